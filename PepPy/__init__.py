@@ -1,5 +1,22 @@
 __all__ = [
     'peppy',
+    'resilience',
+    'sessions',
+    'rollout',
+    'snapshots',
+    'async_peppy',
+    'discovery',
+    'exceptions',
+    'firmware',
+    'fleet',
+    'instrumentation',
+    'inventory',
+    'mock_router',
+    'poller',
+    'port_forwarding',
+    'status',
+    'transaction',
+    'watcher',
     'templates'
 ]
 
@@ -0,0 +1,595 @@
+import asyncio
+import json
+import time
+import urllib.parse
+
+from .exceptions import RouterUnreachableError
+from .instrumentation import RequestEvent, payload_size, request_function
+from .peppy import check_if_good_response, clean_params
+
+try:
+    import aiohttp
+except ImportError: # aiohttp is only needed for the asyncio client
+    aiohttp = None
+
+class AsyncResponse:
+
+    def __init__(self, status_code, text, cookies):
+        """ Buffered response returned by AsyncPepPy so it can be checked like a requests response
+
+        Args:
+            status_code (int): HTTP status code of the response
+            text (str): Body of the response
+            cookies (dict): Cookies set by the response
+        """
+
+        self.status_code = status_code
+        self.text = text
+        self.cookies = cookies
+
+    def json(self):
+        return json.loads(self.text)
+
+class AsyncPepPy:
+
+    def __init__(self, username, password, ip_address="192.168.50.1", port=443, http_type="https", debug=False,
+                 timeout=0.5, proxy=None, pool_maxsize=10, instruments=None):
+        """ Creates an asyncio client that integrates with the Peplink API. Mirrors peppy.PepPy
+
+        Args:
+            username (str): Username to log into Peplink router
+            password (str): Password to log into Peplink router
+            ip_address (str, optional): IP Address of Peplink router. Defaults to "192.168.50.1".
+            port (int, optional): Usually the HTTPS or HTTP port to communicate with Peplink. Defaults to 443.
+            http_type (str, optional): The HTTP protocol to use. Can either be HTTPS or HTTP. Defaults to "https".
+            debug (bool, optional): If True, it will display debugging messages. Defaults to False.
+            timeout (float, optional): Seconds to wait for the connection and between two reads. Defaults to 0.5.
+            proxy (dict, optional): Use local proxy for debugging
+            pool_maxsize (int, optional): Maximum number of connections kept open to the router. Defaults to 10.
+            instruments (list, optional): instrumentation.Instrument objects told about every request. Defaults to None.
+        """
+
+        if aiohttp is None:
+            raise ImportError("AsyncPepPy requires aiohttp. Install it with: pip install PepPy[async]")
+
+        self.username = username
+        self.password = password
+        self.__ip = ip_address
+        self.__timeout = timeout
+        self.__port = port
+        self.__http_type = http_type
+        self.__DEBUG = debug
+        self.__URL = None
+        self.__OVERALL_ENDPOINT = "api.cgi"
+        self.__ADMIN_ENDPOINT = "admin.cgi"
+        self.__FIRMWARE_ENDPOINT = "firmware.cgi"
+        self.__PROXY = proxy
+        self.__pool_maxsize = pool_maxsize
+        self.__session = None
+        self.cookies = None
+        self.instruments = list(instruments or [])
+        self.__update_url()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """ Close every pooled connection to the Peplink router """
+
+        self.__debug('Closing session')
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    @property
+    def ip(self):
+        return self.__ip
+
+    @ip.setter
+    def ip(self, new_ip):
+        self.__ip = new_ip
+
+    @property
+    def timeout(self):
+        return self.__timeout
+
+    @timeout.setter
+    def timeout(self, new_timeout):
+        self.__timeout = new_timeout
+
+    def __update_url(self):
+        self.__debug('Updating URL')
+        self.__URL = f"{self.__http_type}://{self.__ip}:{self.__port}/cgi-bin/MANGA/"
+
+    def __debug(self, message):
+        if self.__DEBUG:
+            print(message)
+
+    def __check_peplink_response(self, response):
+        return check_if_good_response(response)
+
+    def __get_session(self):
+        # aiohttp sessions have to be created inside of a running event loop
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.__pool_maxsize, ssl=False)
+            self.__session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+        return self.__session
+
+    def __client_timeout(self):
+        # Like the timeout of requests: waiting to connect and between two reads, a slow upload is not cut off
+        return aiohttp.ClientTimeout(total=None, sock_connect=self.__timeout, sock_read=self.__timeout)
+
+    def __proxy_url(self):
+        if self.__PROXY:
+            return self.__PROXY.get(self.__http_type)
+        return None
+
+    async def __send_correct_request(self, endpoint, clean=True, get=False, params=None, data=None, json=None, files=None,
+                                     content_type=None):
+        url = self.__URL + endpoint
+        self.__debug(f"Sending a request to: {url}")
+        # Need to clean the parameters = None or else the peplink API will throw an error
+        if clean:
+            json = clean_params(json)
+            data = clean_params(data)
+
+        if not self.instruments:
+            return await self.__send(url, get, params, data, json, files, content_type)
+
+        kwargs = {'params': params, 'data': data, 'json': json}
+        event = RequestEvent(f"{self.__ip}:{self.__port}", endpoint, request_function(endpoint, kwargs),
+                             'GET' if get else 'POST', payload_size(kwargs))
+        for instrument in self.instruments:
+            instrument.before_request(event)
+        start = time.perf_counter()
+        try:
+            response = await self.__send(url, get, params, data, json, files, content_type)
+        except Exception as e:
+            event.failed(e, time.perf_counter() - start)
+            raise
+        else:
+            event.finished(response, time.perf_counter() - start, check_if_good_response(response))
+        finally:
+            for instrument in self.instruments:
+                instrument.after_request(event)
+        return response
+
+    async def __send(self, url, get, params, data, json, files, content_type=None):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{name}={value}" for name, value in self.cookies.items())
+        if isinstance(data, dict):
+            data = urllib.parse.urlencode(data)
+        if isinstance(data, str):
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if content_type:
+            headers['Content-Type'] = content_type
+        if files:
+            data = aiohttp.FormData()
+            for name, file in files.items():
+                data.add_field(name, file, filename=getattr(file, 'name', name))
+
+        session = self.__get_session()
+        try:
+            async with session.request('GET' if get else 'POST', url, params=params, data=data, json=json, headers=headers,
+                                       proxy=self.__proxy_url(),
+                                       timeout=self.__client_timeout()) as raw_response:
+                text = await raw_response.text()
+                cookies = {name: morsel.value for name, morsel in raw_response.cookies.items()}
+                response = AsyncResponse(raw_response.status, text, cookies)
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            raise RouterUnreachableError(f"{url} did not answer: {e!r}") from e
+
+        self.__check_for_new_cookies_in_reponse(response)
+        return response
+
+    def __check_for_new_cookies_in_reponse(self, response):
+        try:
+            response.cookies['bauth'] # bauth is where peplink stores the cookie as
+            self.cookies = response.cookies
+        except KeyError:
+            pass
+        except AttributeError:
+            pass
+
+    def _parse_response(self, response):
+        try:
+            return response.json()['response']
+        except AttributeError as e:
+            return None
+
+    async def apply_changes(self, wait_time=15):
+        """ Apply changes made to the peplink without blocking the event loop
+
+        Args:
+            wait_time (int, optional): Time to wait after applying changes. Defaults to 15.
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Applying Changes")
+
+        params = {'func': 'cmd.config.apply'}
+
+        result = await self.__send_correct_request(self.__OVERALL_ENDPOINT, data=params)
+        await asyncio.sleep(wait_time) # Need to wait some time for the settings to take effect
+        return self.__check_peplink_response(result)
+
+    async def login(self):
+        """ Log into peplink router
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Logging in")
+
+        params = {
+            'username': self.username,
+            'password': self.password,
+            'func': 'login'
+        }
+
+        result = await self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
+        return self.__check_peplink_response(result)
+
+    async def change_password(self, new_password):
+        """ Change password for current logged on user
+
+        Args:
+            new_password (str): New password to replace the old password
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Changing Password")
+
+        params = {
+            'password': self.password,
+            'newPassword': new_password,
+            'func': 'cmd.password'
+        }
+
+        result = await self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
+        self.password = new_password
+        return self.__check_peplink_response(result)
+
+    async def __send_template(self, endpoint, template):
+        # The body is serialized once per template and reused for every router it is pushed to
+        return await self.__send_correct_request(endpoint, clean=False, data=template.body,
+                                                 content_type=template.content_type)
+
+    async def edit_lan(self, lan_profile):
+        """ Edit lan configuration for peplink router under: Network > Network Settings > LAN
+
+        Args:
+            lan_profile (templates.LanProfile): LanProfile data holder
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Editing Lan")
+
+        params = lan_profile.params
+
+        result = await self.__send_template(self.__ADMIN_ENDPOINT, lan_profile)
+        self.ip = params['lan_ip']
+        return self.__check_peplink_response(result)
+
+    async def update_generic_lan(self, generic_lan):
+        """ Update Generic Lan information under: Network > Network Settings
+
+        Args:
+            generic_lan (templates.GenericLan): Generic Lan data holder
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Updating Generic Lan")
+
+
+        result = await self.__send_template(self.__ADMIN_ENDPOINT, generic_lan)
+        return self.__check_peplink_response(result)
+
+    async def add_port_forwarding_rule(self, port_forwarding):
+        """ Add port forwarding rule to peplink router under: Advanced > Port Forwarding
+
+        Args:
+            port_forwarding (templates.PortForwarding): Port forwarding data holder
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Adding Port Forwarding Policy")
+
+        result = await self.__send_template(self.__OVERALL_ENDPOINT, port_forwarding)
+        return self.__check_peplink_response(result)
+
+    async def update_admin_settings(self, admin_settings):
+        """ Update the Admin Settings under: System > Admin Security
+
+        Args:
+            admin_settings (templates.AdminSettings): Admin Settings data holder
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Updating Admin Settings")
+        params = admin_settings.params
+
+        result = await self.__send_template(self.__OVERALL_ENDPOINT, admin_settings)
+        self.__port = params['accessProtocol_https_port']
+        return self.__check_peplink_response(result)
+
+    async def update_time_settings(self, time_settings):
+        """ Update Time Settings under: System > Time
+
+        Args:
+            time_settings (templates.TimeSettings): Time Settings data holder
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Updating Time Settings")
+
+        result = await self.__send_template(self.__OVERALL_ENDPOINT, time_settings)
+        return self.__check_peplink_response(result)
+
+    async def change_ap_password(self, new_password):
+        """ Change the main Wi-Fi password
+
+        Args:
+            new_password (str): The new password to change the old one to
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Changing AP Password")
+        params = {
+            'newPassword': new_password,
+            'func': 'cmd.ap.password'
+        }
+
+        result = await self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
+        return self.__check_peplink_response(result)
+
+    async def update_email_notifications(self, email_settings):
+        """ Update Email Notifications under: System > Email Notification
+
+        Args:
+            email_settings (templates.EmailSettings): Email Settings data holder
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Updating Email Settings")
+
+        result = await self.__send_template(self.__OVERALL_ENDPOINT, email_settings)
+        return self.__check_peplink_response(result)
+
+    async def update_firmware(self, firmware_file_location):
+        """ Update firmware to specified firmware file
+
+        Args:
+            firmware_file_location (str): File path to firmware file. Must be accessible by the running machine
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Updating Firmware")
+        with open(firmware_file_location, 'rb') as firmware_file:
+            params = {'upfile': firmware_file}
+            result = await self.__send_correct_request(self.__FIRMWARE_ENDPOINT, files=params)
+        return self.__check_peplink_response(result)
+
+    async def update_cellular(self, cellular_settings):
+        """ Update Cellular Settings under: Dashboard > Wan Connection Status > Cellular
+
+        Args:
+            cellular_settings (templates.CellularSettings): Cellular Settings data holder
+
+        Returns:
+            bool: True if the Peplink accepted the API Call
+        """
+
+        self.__debug("Updating Cellular")
+
+        result = await self.__send_template(self.__OVERALL_ENDPOINT, cellular_settings)
+        return self.__check_peplink_response(result)
+
+    async def get_ap_profile(self):
+        """ Get Wifi Profile settings
+
+        Returns:
+            dict: All the data that was given from the request
+        """
+
+        params = {'func': 'config.ap.profile'}
+
+        return (await self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True)).json()['response']
+
+    async def get_device_info(self):
+        """ Get device information
+
+        Returns:
+            dict: All the data that was given from the request
+        """
+
+        params = {'func': 'status.system.info'}
+
+        return self._parse_response(await self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True))
+
+    async def get_mac_address(self):
+        """ Get device MAC address
+
+        Returns:
+            str: Device MAC address
+        """
+
+        results = await self.get_device_info()
+        return results['macInfo'][0]['mac']
+
+    async def get_model(self):
+        """ Get device model information
+
+        Returns:
+            str: Device's model information
+        """
+
+        results = await self.get_device_info()
+        return results['device']['model']
+
+    async def get_serial_number(self):
+        """ Get device serial number
+
+        Returns:
+            str: Device serial number
+        """
+
+        results = await self.get_device_info()
+        return results['device']['serialNumber']
+
+    async def get_firmware_version(self):
+        """ Get firmware version on the device
+
+        Returns:
+            str: Device firmware version
+        """
+
+        results = await self.get_device_info()
+        return results['device']['firmwareVersion']
+
+    async def get_uptime(self):
+        """ Get device uptime
+
+        Returns:
+            str: Device uptime
+        """
+
+        results = await self.get_device_info()
+        return results['uptime']['string']
+
+    async def get_device_name(self):
+        """ Get device name
+
+        Returns:
+            str: Device name
+        """
+
+        results = await self.get_device_info()
+        return results['device']['name']
+
+    async def get_device_model(self):
+        """ Get device model
+
+        Returns:
+            str: Device model
+        """
+
+        results = await self.get_device_info()
+        return results['device']['productCode']
+
+    async def get_timezone(self):
+        """ Get timezone
+
+        Returns:
+            str: timezone
+        """
+
+        results = await self.get_device_info()
+        return results['systemTime']['timezone']
+
+    async def get_cpu_load(self):
+        """ Get CPU load of the device
+
+        Returns:
+            str: Device CPU load
+        """
+
+        results = await self.get_device_info()
+        return results['cpuLoad']['string']
+
+    async def get_wan_connection_info(self):
+        """ Get WAN connection info of the device
+
+        Returns:
+            dict: All of WAN connection information from the device
+        """
+
+        params = {'func': 'status.wan.connection'}
+        return (await self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True)).json()['response']
+
+    async def get_imei(self):
+        """ Get IMEI of device
+
+        Returns:
+            str: Device IMEI
+        """
+
+        results = await self.get_wan_connection_info()
+        return results['2']['cellular']['imei']
+
+    async def get_main_apn(self):
+        """ Get APN for SIM slot 1
+
+        Returns:
+            str: SIM slot 1 apn
+        """
+
+        results = await self.get_wan_connection_info()
+        return results['2']['cellular']['sim']['1']['apn']
+
+    async def get_secondary_apn(self):
+        """ Get APN for SIM slot 2
+
+        Returns:
+            str: SIM slot 2 apn
+        """
+
+        results = await self.get_wan_connection_info()
+        try:
+            return results['2']['cellular']['sim']['2']['apn']
+        except KeyError:
+            return None
+
+    async def get_port_forwarding(self):
+        """ Get every port forwarding rule
+
+        Returns:
+            dict: Port forwarding rules keyed by their id
+        """
+
+        params = {'func': 'config.inbound.service'}
+        results = (await self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True)).json()['response']
+        return {key: value for key, value in results.items() if key.isdigit()}
+
+    async def change_ap_ssid(self, new_ssid):
+        """ Change the main Wi-Fi SSID
+
+        Args:
+            new_ssid (str): The new SSID
+
+        Returns:
+            AsyncResponse: The raw response from the Peplink
+        """
+
+        params = {
+            'section': 'EXTAP_network_modify',
+            'ruleid': 1,
+            'ssid': new_ssid,
+            'enable': 'yes'
+        }
+        return await self.__send_correct_request(self.__ADMIN_ENDPOINT, data=params)
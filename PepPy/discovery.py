@@ -0,0 +1,300 @@
+import asyncio
+import ipaddress
+import json
+import queue
+import ssl
+import threading
+
+from .exceptions import RequestRejectedError
+from .fleet import Device
+from .peppy import PepPy
+from .resilience import RetryPolicy
+
+API_PATH = "/cgi-bin/MANGA/api.cgi"
+
+def is_peplink_api(raw_response):
+    """ Check if a raw HTTP response came from the Peplink API
+
+    The API answers every call, even without a session, with a JSON body holding a `stat` field.
+
+    Args:
+        raw_response (bytes): Status line, headers and the start of the body
+
+    Returns:
+        bool: True if it looks like a Peplink api.cgi answer
+    """
+
+    head, _, body = raw_response.partition(b'\r\n\r\n')
+    status_line = head.split(b'\r\n', 1)[0].split()
+    if len(status_line) < 2 or not status_line[0].startswith(b'HTTP/') or status_line[1] not in (b'200', b'401'):
+        return False
+    try:
+        return 'stat' in json.loads(body)
+    except (ValueError, TypeError):
+        return b'"stat"' in body # The body was cut off at the read limit
+
+class DiscoveredRouter:
+
+    def __init__(self, ip_address, port, http_type, device_info=None, error=None):
+        """ A router found by a Scanner
+
+        Args:
+            ip_address (str): IP Address of Peplink router
+            port (int): Port the API answered on
+            http_type (str): HTTP or HTTPS
+            device_info (status.DeviceInfo, optional): Device information, when the scanner logged in. Defaults to None.
+            error (Exception, optional): Why logging in or reading the device information failed. Defaults to None.
+        """
+
+        self.ip_address = ip_address
+        self.port = port
+        self.http_type = http_type
+        self.device_info = device_info
+        self.error = error
+
+    @property
+    def key(self):
+        return f"{self.ip_address}:{self.port}"
+
+    def device(self, username, password, name=None):
+        """ Inventory entry of the router, to build a fleet.Fleet from the scan
+
+        Args:
+            username (str): Username to log into Peplink router
+            password (str): Password to log into Peplink router
+            name (str, optional): Friendly name of the router. Defaults to the device name reported by the router.
+
+        Returns:
+            fleet.Device: The inventory entry
+        """
+
+        if name is None and self.device_info is not None:
+            name = self.device_info.device_name
+        return Device(self.ip_address, username, password, port=self.port, http_type=self.http_type, name=name)
+
+    def __repr__(self):
+        if self.device_info is not None:
+            return f"DiscoveredRouter({self.key}, {self.device_info.serial_number})"
+        return f"DiscoveredRouter({self.key})"
+
+class Scanner:
+
+    def __init__(self, networks, port=443, http_type="https", username=None, password=None, concurrency=512,
+                 timeout=1.0, login_timeout=5, debug=False):
+        """ Finds Peplink routers by probing every host of one or more networks for the API endpoint
+
+        Hosts are probed from one event loop with plain TCP connections, so a /16 at the default
+        concurrency and timeout takes about two minutes when no host answers.
+
+        Args:
+            networks (str or list): CIDR ranges to probe, e.g. "10.0.0.0/16", or single addresses
+            port (int, optional): Port to probe. Defaults to 443.
+            http_type (str, optional): The HTTP protocol to use. Can either be HTTPS or HTTP. Defaults to "https".
+            username (str, optional): Log into every router found and read its device information. Defaults to None.
+            password (str, optional): Password for username. Defaults to None.
+            concurrency (int, optional): Maximum number of hosts probed at once. Defaults to 512.
+            timeout (float, optional): Seconds to wait for a host to connect and answer. Defaults to 1.0.
+            login_timeout (float, optional): Timeout of the login and device information requests. Defaults to 5.
+            debug (bool, optional): If True, it will display debugging messages. Defaults to False.
+        """
+
+        if isinstance(networks, str):
+            networks = [networks]
+        self.networks = [ipaddress.ip_network(network, strict=False) for network in networks]
+        self.port = port
+        self.http_type = http_type
+        self.username = username
+        self.password = password
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.login_timeout = login_timeout
+        self.__DEBUG = debug
+        self.__cancelled = False
+
+    def __debug(self, message):
+        if self.__DEBUG:
+            print(message)
+
+    def hosts(self):
+        """ Every address that will be probed
+
+        Yields:
+            str: Host address
+        """
+
+        for network in self.networks:
+            if network.num_addresses == 1:
+                yield str(network.network_address)
+            else:
+                yield from (str(host) for host in network.hosts())
+
+    def __ssl_context(self):
+        if self.http_type.lower() != 'https':
+            return None
+        # Routers use self signed certificates, same as verify=False in PepPy
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+    async def probe(self, ip_address, ssl_context=None):
+        """ Check if one host answers like the Peplink API
+
+        Args:
+            ip_address (str): Host to probe
+            ssl_context (ssl.SSLContext, optional): Context of HTTPS probes. Defaults to None.
+
+        Returns:
+            bool: True if the host runs the Peplink API on the port
+        """
+
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, self.port, ssl=ssl_context), self.timeout)
+        except (OSError, asyncio.TimeoutError, ssl.SSLError):
+            return False
+
+        request = (f"GET {API_PATH} HTTP/1.1\r\nHost: {ip_address}:{self.port}\r\n"
+                   f"Accept: application/json\r\nConnection: close\r\n\r\n").encode()
+        try:
+            writer.write(request)
+            await writer.drain()
+            response = await asyncio.wait_for(self.__read_response(reader), self.timeout)
+        except (OSError, asyncio.TimeoutError, ssl.SSLError):
+            return False
+        finally:
+            writer.close()
+        return is_peplink_api(response)
+
+    async def __read_response(self, reader, limit=16384):
+        response = b''
+        while len(response) < limit:
+            chunk = await reader.read(limit - len(response))
+            if not chunk:
+                break
+            response += chunk
+        return response
+
+    def identify(self, ip_address):
+        """ Log into a router and read its device information
+
+        Args:
+            ip_address (str): Router address
+
+        Raises:
+            exceptions.RequestRejectedError: The router refused the login
+
+        Returns:
+            status.DeviceInfo: Device information of the router
+        """
+
+        with PepPy(self.username, self.password, ip_address=ip_address, port=self.port, http_type=self.http_type,
+                   timeout=self.login_timeout, retry_policy=RetryPolicy(attempts=1), failure_threshold=None) as pep:
+            if not pep.login():
+                raise RequestRejectedError(f"{ip_address}:{self.port} refused the login of {self.username}")
+            return pep.get_device_snapshot()
+
+    async def __discover(self, ip_address, ssl_context):
+        if not await self.probe(ip_address, ssl_context):
+            return None
+        router = DiscoveredRouter(ip_address, self.port, self.http_type)
+        if self.username is not None:
+            try:
+                router.device_info = await asyncio.get_running_loop().run_in_executor(None, self.identify, ip_address)
+            except Exception as e:
+                router.error = e
+        self.__debug(f"Found {router}")
+        return router
+
+    async def scan(self):
+        """ Probe every host and stream the routers as they are found
+
+        Yields:
+            DiscoveredRouter: One per router found, in the order they answer
+        """
+
+        self.__cancelled = False
+        hosts = self.hosts()
+        found = asyncio.Queue()
+        ssl_context = self.__ssl_context()
+        done = object()
+
+        async def worker():
+            try:
+                # Every worker pulls from the same generator, so only `concurrency` probes are ever scheduled
+                for ip_address in hosts:
+                    if self.__cancelled:
+                        break
+                    router = await self.__discover(ip_address, ssl_context)
+                    if router is not None:
+                        await found.put(router)
+            finally:
+                await found.put(done)
+
+        host_count = sum(network.num_addresses for network in self.networks)
+        workers = [asyncio.ensure_future(worker()) for _ in range(max(min(self.concurrency, host_count), 1))]
+        try:
+            running = len(workers)
+            while running:
+                router = await found.get()
+                if router is done:
+                    running -= 1
+                else:
+                    yield router
+            for finished in workers:
+                finished.result() # Raise what a worker raised
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def cancel(self):
+        """ Stop probing new hosts """
+
+        self.__cancelled = True
+
+    def run(self):
+        """ Probe every host from a background event loop, for code without one
+
+        Yields:
+            DiscoveredRouter: One per router found, in the order they answer
+        """
+
+        results = queue.Queue()
+        done = object()
+
+        async def produce():
+            async for router in self.scan():
+                results.put(router)
+
+        def run_loop():
+            try:
+                asyncio.run(produce())
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(done)
+
+        thread = threading.Thread(target=run_loop, name="PepPy discovery", daemon=True)
+        thread.start()
+        try:
+            while True:
+                result = results.get()
+                if result is done:
+                    return
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+        finally:
+            self.cancel()
+
+def discover(networks, **scanner_options):
+    """ Find every Peplink router of one or more networks
+
+    Args:
+        networks (str or list): CIDR ranges to probe
+        **scanner_options: Keyword arguments for Scanner
+
+    Yields:
+        DiscoveredRouter: One per router found, in the order they answer
+    """
+
+    return Scanner(networks, **scanner_options).run()
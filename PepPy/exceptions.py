@@ -0,0 +1,26 @@
+class PepPyError(Exception):
+    """ Base class of every error raised by PepPy """
+
+class RouterNotReadyError(PepPyError):
+    """ The router did not come back in time after applying changes """
+
+class RouterUnreachableError(PepPyError):
+    """ The router did not answer, even after retrying """
+
+class RequestRejectedError(PepPyError):
+    """ The router answered but refused the request, e.g. the login is no longer accepted """
+
+class RouterBusyError(PepPyError):
+    """ The request waited too long for its turn to be sent, the router was not contacted """
+
+class CircuitOpenError(RouterUnreachableError):
+    """ The router failed too often recently, the request was not sent """
+
+class FirmwareChecksumError(PepPyError):
+    """ The uploaded firmware did not match the SHA-256 of the image """
+
+class RolloutHaltedError(PepPyError):
+    """ A firmware rollout stopped because too many routers failed """
+
+class PortForwardingConflictError(PepPyError):
+    """ Two port forwarding rules share a name or an external port """
@@ -0,0 +1,185 @@
+import hashlib
+import mmap
+import os
+import threading
+import time
+import uuid
+
+from .exceptions import FirmwareChecksumError
+
+# SHA-256 of every image hashed in this process, keyed by (path, size, modification time)
+_digests = dict()
+_digests_lock = threading.Lock()
+
+class FirmwareImage:
+
+    def __init__(self, path, use_mmap=False):
+        """ Firmware file that can be streamed to many routers
+
+        Share one FirmwareImage between uploads so its SHA-256 is only computed once.
+
+        Args:
+            path (str): File path to firmware file. Must be accessible by the running machine
+            use_mmap (bool, optional): Memory map the file instead of reading it. Defaults to False.
+        """
+
+        self.path = os.path.realpath(path)
+        self.name = os.path.basename(path)
+        self.use_mmap = use_mmap
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        self.__key = (self.path, stat.st_size, stat.st_mtime_ns)
+
+    @property
+    def sha256(self):
+        with _digests_lock:
+            digest = _digests.get(self.__key)
+        if digest is None:
+            digest = hashlib.sha256()
+            with open(self.path, 'rb') as image:
+                for chunk in iter(lambda: image.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            digest = digest.hexdigest()
+            with _digests_lock:
+                _digests[self.__key] = digest
+        return digest
+
+    def open(self):
+        """ Open the image for reading
+
+        Returns:
+            file-like: Binary reader with read() and seek(), close it when done
+        """
+
+        image = open(self.path, 'rb')
+        if not self.use_mmap or self.size == 0:
+            return image
+        try:
+            return mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            image.close() # The map keeps its own reference to the file
+
+class BandwidthLimiter:
+
+    def __init__(self, bytes_per_second):
+        """ Token bucket that caps the upload rate. Share one limiter between uploads to cap them together
+
+        Args:
+            bytes_per_second (int): Maximum average upload rate
+        """
+
+        self.bytes_per_second = bytes_per_second
+        self.__tokens = float(bytes_per_second)
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def consume(self, amount):
+        """ Block until amount bytes may be sent
+
+        Args:
+            amount (int): Number of bytes about to be sent
+        """
+
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.__tokens + (now - self.__updated) * self.bytes_per_second, self.bytes_per_second)
+            self.__updated = now
+            self.__tokens -= amount
+            wait = -self.__tokens / self.bytes_per_second if self.__tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class MultipartEncoder:
+
+    def __init__(self, image, field_name='upfile', chunk_size=64 * 1024, progress=None, limiter=None, verify=True):
+        """ Streams a firmware image as a multipart/form-data body without loading it into memory
+
+        Pass it as `data` to requests together with the content_type header.
+
+        Args:
+            image (FirmwareImage): Image to upload
+            field_name (str, optional): Form field of the file. Defaults to 'upfile'.
+            chunk_size (int, optional): Bytes read from the image at once. Defaults to 64 KiB.
+            progress (callable, optional): Called with (bytes_sent, total_bytes) after every chunk. Defaults to None.
+            limiter (BandwidthLimiter, optional): Caps the upload rate. Defaults to None.
+            verify (bool, optional): Check the streamed bytes against image.sha256 before finishing the body. Defaults to True.
+        """
+
+        self.image = image
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.limiter = limiter
+        self.verify = verify
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.__header = (f"--{boundary}\r\n"
+                         f"Content-Disposition: form-data; name=\"{field_name}\"; filename=\"{image.name}\"\r\n"
+                         f"Content-Type: application/octet-stream\r\n\r\n").encode()
+        self.__footer = f"\r\n--{boundary}--\r\n".encode()
+        self.len = len(self.__header) + image.size + len(self.__footer)
+        self.__reader = None
+        self.seek(0)
+
+    def __len__(self):
+        return self.len
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Only rewinding is supported, which is what a retried request needs
+        if offset != 0 or whence != os.SEEK_SET:
+            raise ValueError("MultipartEncoder can only be rewound to the start")
+        self.close()
+        self.__reader = self.image.open()
+        self.__pending = self.__header
+        self.__digest = hashlib.sha256()
+        self.__file_done = False
+        self.__sent = 0
+        return 0
+
+    def tell(self):
+        return self.__sent
+
+    def close(self):
+        if self.__reader is not None:
+            self.__reader.close()
+            self.__reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __next_chunk(self):
+        chunk = self.__reader.read(self.chunk_size)
+        if chunk:
+            self.__digest.update(chunk)
+            return chunk
+        self.__file_done = True
+        if self.verify and self.__digest.hexdigest() != self.image.sha256:
+            # Failing before the closing boundary makes the router discard the upload
+            raise FirmwareChecksumError(f"{self.image.path} changed while it was being uploaded")
+        return self.__footer
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.len
+        chunks = list()
+        length = 0
+        while length < size:
+            if not self.__pending:
+                if self.__file_done:
+                    break
+                self.__pending = self.__next_chunk()
+            take = self.__pending[:size - length]
+            self.__pending = self.__pending[len(take):]
+            chunks.append(take)
+            length += len(take)
+        data = b''.join(chunks)
+
+        if data:
+            if self.limiter is not None:
+                self.limiter.consume(len(data))
+            self.__sent += len(data)
+            if self.progress is not None:
+                self.progress(self.__sent, self.len)
+        return data
@@ -0,0 +1,346 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from .exceptions import RequestRejectedError
+from .peppy import PepPy
+
+class Device:
+
+    def __init__(self, ip_address, username, password, port=443, http_type="https", name=None):
+        """ Inventory entry for one Peplink router
+
+        Args:
+            ip_address (str): IP Address of Peplink router
+            username (str): Username to log into Peplink router
+            password (str): Password to log into Peplink router
+            port (int, optional): Usually the HTTPS or HTTP port to communicate with Peplink. Defaults to 443.
+            http_type (str, optional): The HTTP protocol to use. Can either be HTTPS or HTTP. Defaults to "https".
+            name (str, optional): Friendly name of the router. Defaults to None.
+        """
+
+        self.ip_address = ip_address
+        self.username = username
+        self.password = password
+        self.port = port
+        self.http_type = http_type
+        self.name = name
+
+    @property
+    def key(self):
+        return f"{self.ip_address}:{self.port}"
+
+    def __repr__(self):
+        return f"Device({self.key})"
+
+class FleetResult:
+
+    def __init__(self, device, value=None, error=None, elapsed=0.0):
+        """ Outcome of running an operation on one router
+
+        Args:
+            device (Device): The router the operation ran on
+            value (any, optional): What the operation returned. Defaults to None.
+            error (Exception, optional): The exception raised by the operation. Defaults to None.
+            elapsed (float, optional): Seconds the operation took. Defaults to 0.0.
+        """
+
+        self.device = device
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        outcome = repr(self.value) if self.ok else repr(self.error)
+        return f"FleetResult({self.device.key}, {outcome}, {self.elapsed:.3f}s)"
+
+class _TemplateVariants:
+    # Builds each distinct override of a base template once, routers with the same override share it and its body
+
+    def __init__(self, templates):
+        self.__templates = templates
+        self.__variants = dict()
+        self.__lock = threading.Lock()
+
+    def get(self, method, changes):
+        if not changes:
+            return self.__templates[method]
+        key = (method, repr(sorted(changes.items())))
+        with self.__lock:
+            template = self.__variants.get(key)
+            if template is None:
+                template = self.__variants[key] = self.__templates[method].replace(**changes)
+        return template
+
+    def __len__(self):
+        return len(self.__variants)
+
+class Fleet:
+
+    def __init__(self, devices, max_workers=32, timeout=0.5, device_timeout=None, login=True, debug=False, **client_options):
+        """ Runs PepPy operations across many Peplink routers concurrently
+
+        Args:
+            devices (list): Device objects or dicts with the Device arguments
+            max_workers (int, optional): Maximum number of routers worked on at once. Defaults to 32.
+            timeout (float, optional): Timeout of every single API call. Defaults to 0.5.
+            device_timeout (float, optional): Maximum seconds spent on one router, including login. Defaults to None.
+            login (bool, optional): Log into every router before running the operation. Defaults to True.
+            debug (bool, optional): If True, it will display debugging messages. Defaults to False.
+            **client_options: Extra keyword arguments for every PepPy client
+        """
+
+        self.devices = [device if isinstance(device, Device) else Device(**device) for device in devices]
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.device_timeout = device_timeout
+        self.login = login
+        self.__DEBUG = debug
+        self.__client_options = client_options
+
+    def __len__(self):
+        return len(self.devices)
+
+    def subset(self, devices, max_workers=None):
+        """ Create a fleet of some of these routers with the same settings
+
+        Args:
+            devices (list): Device objects of this fleet
+            max_workers (int, optional): Maximum number of routers worked on at once. Defaults to this fleet's.
+
+        Returns:
+            Fleet: The smaller fleet
+        """
+
+        return Fleet(devices, max_workers=max_workers or self.max_workers, timeout=self.timeout,
+                     device_timeout=self.device_timeout, login=self.login, debug=self.__DEBUG, **self.__client_options)
+
+    def __debug(self, message):
+        if self.__DEBUG:
+            print(message)
+
+    def client(self, device):
+        """ Create a PepPy client for one router of the fleet
+
+        Args:
+            device (Device): Router to connect to
+
+        Returns:
+            peppy.PepPy: Client for the router
+        """
+
+        return PepPy(device.username, device.password, ip_address=device.ip_address, port=device.port,
+                     http_type=device.http_type, timeout=self.timeout, debug=self.__DEBUG, **self.__client_options)
+
+    def __call_operation(self, pep, operation, args, kwargs):
+        if isinstance(operation, str):
+            return getattr(pep, operation)(*args, **kwargs)
+        return operation(pep, *args, **kwargs)
+
+    def __run_on_device(self, device, call, started):
+        started[device.key] = time.monotonic()
+        with self.client(device) as pep:
+            if self.login and not pep.login():
+                raise RequestRejectedError(f"Login to {device.key} as {device.username} failed")
+            return call(pep, device)
+
+    def run(self, operation, *args, **kwargs):
+        """ Run an operation on every router using a bounded thread pool
+
+        Args:
+            operation (str or callable): Name of a PepPy method, or a callable taking a PepPy client as first argument
+            *args: Arguments for the operation
+            **kwargs: Keyword arguments for the operation
+
+        Yields:
+            FleetResult: One result per router, in the order they finish
+        """
+
+        return self.__run(lambda pep, device: self.__call_operation(pep, operation, args, kwargs))
+
+    def run_stoppable(self, stop, operation, *args, **kwargs):
+        """ Run an operation on every router like run, but start no more routers once stop is set
+
+        The routers already being worked on when stop is set still finish and their results are yielded.
+
+        Args:
+            stop (threading.Event): Set it to stop starting routers
+            operation (str or callable): Name of a PepPy method, or a callable taking a PepPy client as first argument
+            *args: Arguments for the operation
+            **kwargs: Keyword arguments for the operation
+
+        Yields:
+            FleetResult: One result per started router, in the order they finish
+        """
+
+        return self.__run(lambda pep, device: self.__call_operation(pep, operation, args, kwargs), stop)
+
+    def __run(self, call, stop=None):
+        started = dict()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            pending = {executor.submit(self.__run_on_device, device, call, started): device
+                       for device in self.devices}
+            while pending:
+                if stop is not None and stop.is_set():
+                    # Only the routers still waiting for a worker are dropped, cancel() fails on running ones
+                    for future in [future for future in pending if future.cancel()]:
+                        del pending[future]
+                    if not pending:
+                        break
+                done, _ = concurrent.futures.wait(pending, timeout=self.__next_deadline(pending, started),
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    device = pending.pop(future)
+                    yield self.__result(device, future, started)
+                for future, device in list(pending.items()):
+                    if self.__timed_out(device, started):
+                        # The worker thread can not be interrupted, its late result is ignored
+                        future.cancel()
+                        del pending[future]
+                        yield FleetResult(device, error=TimeoutError(f"{device.key} took longer than {self.device_timeout}s"),
+                                          elapsed=time.monotonic() - started[device.key])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def __next_deadline(self, pending, started):
+        if self.device_timeout is None:
+            return None
+        now = time.monotonic()
+        deadlines = [started[device.key] + self.device_timeout - now for device in pending.values() if device.key in started]
+        return max(min(deadlines, default=self.device_timeout), 0)
+
+    def __timed_out(self, device, started):
+        if self.device_timeout is None or device.key not in started:
+            return False
+        return time.monotonic() - started[device.key] > self.device_timeout
+
+    def __result(self, device, future, started):
+        elapsed = time.monotonic() - started.get(device.key, time.monotonic())
+        try:
+            result = FleetResult(device, value=future.result(), elapsed=elapsed)
+        except Exception as e:
+            result = FleetResult(device, error=e, elapsed=elapsed)
+        self.__debug(result)
+        return result
+
+    def push_template(self, method, template, apply_changes=False, wait_time=15):
+        """ Push the same template to every router
+
+        Args:
+            method (str): PepPy method that sends the template, e.g. 'update_time_settings'
+            template (templates.BaseTemplate): Template to push
+            apply_changes (bool, optional): Apply the changes on every router that accepted the template. Defaults to False.
+            wait_time (int, optional): Time to wait after applying changes. Defaults to 15.
+
+        Yields:
+            FleetResult: One result per router, in the order they finish
+        """
+
+        def push(pep):
+            accepted = getattr(pep, method)(template)
+            if accepted and apply_changes:
+                return pep.apply_changes(wait_time=wait_time)
+            return accepted
+
+        return self.run(push)
+
+    def fan_out(self, templates, overrides=None, wait_time=15, wait_until_ready=False, ready_timeout=60):
+        """ Push base templates to every router, with some arguments changed per router, and apply once per router
+
+        Routers without an override share the base templates. A changed template is only built once for every
+        distinct override, so its body is serialized once too. The templates of a router are sent in one
+        PepPy.transaction(), LAN IP and admin port changes last.
+
+        Args:
+            templates (dict): Base template of every PepPy method to call, e.g. {'update_time_settings': TimeSettings(...)}.
+                The methods are called in this order
+            overrides (dict, optional): Per router changes keyed by Device.key or Device.name, each a dict of
+                method to the template arguments to change, e.g. {'10.0.0.1:443': {'update_admin_settings': {'name': 'Depot'}}}.
+                Defaults to None.
+            wait_time (int, optional): Time to wait after applying changes. Defaults to 15.
+            wait_until_ready (bool, optional): Poll every router instead of waiting wait_time. Defaults to False.
+            ready_timeout (float, optional): Maximum seconds to poll when wait_until_ready is True. Defaults to 60.
+
+        Raises:
+            ValueError: An override is for a router that is not in the fleet or for a method not in templates
+
+        Yields:
+            FleetResult: One result per router, in the order they finish. The value is the committed
+                transaction.Transaction, its results hold the outcome of every template
+        """
+
+        overrides = overrides or dict()
+        by_name = {device.name: device.key for device in self.devices if device.name is not None}
+        per_device = dict()
+        for router, changes in overrides.items():
+            key = by_name.get(router, router)
+            if all(device.key != key for device in self.devices):
+                raise ValueError(f"Override for {router}, which is not in the fleet")
+            unknown = set(changes) - set(templates)
+            if unknown:
+                raise ValueError(f"Override for {router} changes {', '.join(sorted(unknown))}, which has no base template")
+            per_device.setdefault(key, dict()).update(changes)
+        variants = _TemplateVariants(templates)
+
+        def push(pep, device):
+            changes = per_device.get(device.key, dict())
+            with pep.transaction(wait_time=wait_time, wait_until_ready=wait_until_ready,
+                                 ready_timeout=ready_timeout) as transaction:
+                for method in templates:
+                    getattr(pep, method)(variants.get(method, changes.get(method)))
+            return transaction
+
+        return self.__run(push)
+
+    async def run_async(self, operation, *args, concurrency=100, **kwargs):
+        """ Run an operation on every router from one event loop using AsyncPepPy
+
+        Args:
+            operation (str or callable): Name of an AsyncPepPy method, or a coroutine function taking an AsyncPepPy client as first argument
+            *args: Arguments for the operation
+            concurrency (int, optional): Maximum number of routers worked on at once. Defaults to 100.
+            **kwargs: Keyword arguments for the operation
+
+        Yields:
+            FleetResult: One result per router, in the order they finish
+        """
+
+        from .async_peppy import AsyncPepPy
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_on_device(device):
+            async with semaphore:
+                start = time.monotonic()
+                pep = AsyncPepPy(device.username, device.password, ip_address=device.ip_address, port=device.port,
+                                 http_type=device.http_type, timeout=self.timeout, debug=self.__DEBUG)
+                try:
+                    value = await asyncio.wait_for(self.__call_async_operation(pep, operation, args, kwargs), self.device_timeout)
+                    return FleetResult(device, value=value, elapsed=time.monotonic() - start)
+                except Exception as e:
+                    return FleetResult(device, error=e, elapsed=time.monotonic() - start)
+                finally:
+                    await pep.close()
+
+        tasks = [asyncio.ensure_future(run_on_device(device)) for device in self.devices]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                self.__debug(result)
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __call_async_operation(self, pep, operation, args, kwargs):
+        if self.login and not await pep.login():
+            raise RequestRejectedError(f"Login to {pep.ip} as {pep.username} failed")
+        if isinstance(operation, str):
+            return await getattr(pep, operation)(*args, **kwargs)
+        return await operation(pep, *args, **kwargs)
@@ -0,0 +1,305 @@
+import bisect
+import json
+import logging
+import re
+import threading
+import time
+import urllib.parse
+
+from .exceptions import CircuitOpenError, RequestRejectedError, RouterBusyError, RouterUnreachableError
+
+# Finds the function of a body that is already serialized, without parsing all of it
+_SERIALIZED_FUNCTION = re.compile(r'"(?:func|section)":\s*"([^"]*)"|(?:^|&)(?:func|section)=([^&]*)')
+
+def request_function(endpoint, kwargs):
+    """ Name the Peplink function a request calls
+
+    Args:
+        endpoint (str): Endpoint under /cgi-bin/MANGA/ the request goes to
+        kwargs (dict): Keyword arguments of the request (params, json or data)
+
+    Returns:
+        str: The `func` of api.cgi calls, the `section` of admin.cgi calls, otherwise the endpoint
+    """
+
+    for key in ('params', 'json', 'data'):
+        body = kwargs.get(key)
+        if isinstance(body, dict):
+            if 'func' in body:
+                return body['func']
+            if 'section' in body:
+                return body['section']
+        elif isinstance(body, (str, bytes)):
+            if isinstance(body, bytes):
+                body = body.decode(errors='replace')
+            match = _SERIALIZED_FUNCTION.search(body)
+            if match:
+                return match.group(1) if match.group(1) is not None else urllib.parse.unquote_plus(match.group(2))
+    if endpoint == 'firmware.cgi':
+        return 'firmware'
+    return endpoint
+
+def payload_size(kwargs):
+    """ Size of the request body in bytes
+
+    Args:
+        kwargs (dict): Keyword arguments of the request (json or data)
+
+    Returns:
+        int: Body size, 0 for GET requests
+    """
+
+    if kwargs.get('json') is not None:
+        return len(json.dumps(kwargs['json']).encode())
+    data = kwargs.get('data')
+    if data is None:
+        return 0
+    if isinstance(data, dict):
+        return len(urllib.parse.urlencode(data))
+    if isinstance(data, str):
+        return len(data.encode())
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+class RequestEvent:
+
+    OK = 'ok'
+    FAILED = 'failed'
+    REJECTED = 'rejected'
+    UNREACHABLE = 'unreachable'
+    CIRCUIT_OPEN = 'circuit_open'
+    BUSY = 'busy'
+    ERROR = 'error'
+
+    def __init__(self, router, endpoint, func, method, payload_size):
+        """ One request to a Peplink, handed to every instrument before and after it is sent
+
+        Latency is split into the time until the response headers arrived (connection, TLS handshake and
+        server time, as measured by the HTTP client) and the time spent reading the body. new_connection
+        tells whether a connection had to be opened, so the handshake cost can be told apart from the server
+        time. It is approximate when several threads share one PepPy.
+
+        Args:
+            router (str): ip:port of the router
+            endpoint (str): Endpoint under /cgi-bin/MANGA/
+            func (str): Peplink function that was called
+            method (str): GET or POST
+            payload_size (int): Size of the request body in bytes
+        """
+
+        self.router = router
+        self.endpoint = endpoint
+        self.func = func
+        self.method = method
+        self.payload_size = payload_size
+        self.started = time.time()
+        self.status_code = None
+        self.response_size = None
+        self.outcome = None
+        self.error = None
+        self.elapsed = None
+        self.server_time = None
+        self.new_connection = None
+
+    @property
+    def transfer_time(self):
+        if self.elapsed is None or self.server_time is None:
+            return None
+        return max(self.elapsed - self.server_time, 0.0)
+
+    def finished(self, response, elapsed, accepted):
+        """ Record the response of the router
+
+        Args:
+            response: Any response object with `status_code` and `text` attributes
+            elapsed (float): Seconds the whole call took, retries and login included
+            accepted (bool): True if the Peplink accepted the API call
+        """
+
+        self.elapsed = elapsed
+        self.status_code = getattr(response, 'status_code', None)
+        content = getattr(response, 'content', None)
+        if content is None:
+            content = getattr(response, 'text', '').encode()
+        self.response_size = len(content)
+        if getattr(response, 'elapsed', None) is not None:
+            self.server_time = response.elapsed.total_seconds()
+        self.outcome = self.OK if accepted else self.FAILED
+
+    def failed(self, error, elapsed):
+        """ Record an exception raised instead of a response
+
+        Args:
+            error (Exception): The exception
+            elapsed (float): Seconds until the exception was raised
+        """
+
+        self.elapsed = elapsed
+        self.error = error
+        if isinstance(error, CircuitOpenError):
+            self.outcome = self.CIRCUIT_OPEN
+        elif isinstance(error, RouterUnreachableError):
+            self.outcome = self.UNREACHABLE
+        elif isinstance(error, RequestRejectedError):
+            self.outcome = self.REJECTED
+        elif isinstance(error, RouterBusyError):
+            self.outcome = self.BUSY
+        else:
+            self.outcome = self.ERROR
+
+    def as_dict(self):
+        return {
+            'router': self.router,
+            'endpoint': self.endpoint,
+            'func': self.func,
+            'method': self.method,
+            'payload_size': self.payload_size,
+            'response_size': self.response_size,
+            'status_code': self.status_code,
+            'outcome': self.outcome,
+            'error': repr(self.error) if self.error is not None else None,
+            'started': self.started,
+            'elapsed': self.elapsed,
+            'server_time': self.server_time,
+            'transfer_time': self.transfer_time,
+            'new_connection': self.new_connection,
+        }
+
+class Instrument:
+    """ Base class of the objects passed to PepPy(instruments=[...]), override either method """
+
+    def before_request(self, event):
+        """ Called before a request is sent
+
+        Args:
+            event (RequestEvent): The request, without any response information yet
+        """
+
+    def after_request(self, event):
+        """ Called once the request got a response or raised
+
+        Args:
+            event (RequestEvent): The request and its outcome
+        """
+
+class PrometheusExporter(Instrument):
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix='peppy'):
+        """ Counts requests and their latency per router and function in the Prometheus text format
+
+        Share one exporter between every PepPy of a fleet and serve render() from a /metrics endpoint.
+
+        Args:
+            buckets (tuple, optional): Upper bounds in seconds of the latency histogram. Defaults to DEFAULT_BUCKETS.
+            prefix (str, optional): Prefix of every metric name. Defaults to 'peppy'.
+        """
+
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self.__lock = threading.Lock()
+        self.__requests = dict()
+        self.__latency = dict()
+        self.__bytes_sent = dict()
+        self.__bytes_received = dict()
+        self.__connections = dict()
+
+    def after_request(self, event):
+        labels = (event.router, event.func)
+        with self.__lock:
+            key = labels + (event.outcome,)
+            self.__requests[key] = self.__requests.get(key, 0) + 1
+            self.__bytes_sent[labels] = self.__bytes_sent.get(labels, 0) + (event.payload_size or 0)
+            self.__bytes_received[labels] = self.__bytes_received.get(labels, 0) + (event.response_size or 0)
+            if event.new_connection:
+                self.__connections[event.router] = self.__connections.get(event.router, 0) + 1
+
+            if event.elapsed is not None:
+                counts, total = self.__latency.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+                counts[bisect.bisect_left(self.buckets, event.elapsed)] += 1
+                self.__latency[labels] = (counts, total + event.elapsed)
+
+    def requests(self, router=None, func=None, outcome=None):
+        """ Number of recorded requests matching every given label
+
+        Returns:
+            int: Request count
+        """
+
+        with self.__lock:
+            return sum(count for (r, f, o), count in self.__requests.items()
+                       if router in (None, r) and func in (None, f) and outcome in (None, o))
+
+    def render(self):
+        """ Every metric in the Prometheus text exposition format
+
+        Returns:
+            str: Text to serve from a /metrics endpoint
+        """
+
+        name = self.prefix
+        lines = list()
+        with self.__lock:
+            lines.append(f"# HELP {name}_requests_total Requests sent to Peplink routers")
+            lines.append(f"# TYPE {name}_requests_total counter")
+            for (router, func, outcome), count in sorted(self.__requests.items()):
+                lines.append(f"{name}_requests_total{_labels(router=router, func=func, outcome=outcome)} {count}")
+
+            lines.append(f"# HELP {name}_request_duration_seconds Seconds per request, retries and login included")
+            lines.append(f"# TYPE {name}_request_duration_seconds histogram")
+            for (router, func), (counts, total) in sorted(self.__latency.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f"{name}_request_duration_seconds_bucket{_labels(router=router, func=func, le=bound)} {cumulative}")
+                lines.append(f"{name}_request_duration_seconds_sum{_labels(router=router, func=func)} {total}")
+                lines.append(f"{name}_request_duration_seconds_count{_labels(router=router, func=func)} {cumulative}")
+
+            for metric, values, help_text in (('request_bytes_total', self.__bytes_sent, "Bytes sent in request bodies"),
+                                              ('response_bytes_total', self.__bytes_received, "Bytes received in response bodies")):
+                lines.append(f"# HELP {name}_{metric} {help_text}")
+                lines.append(f"# TYPE {name}_{metric} counter")
+                for (router, func), value in sorted(values.items()):
+                    lines.append(f"{name}_{metric}{_labels(router=router, func=func)} {value}")
+
+            lines.append(f"# HELP {name}_connections_opened_total New connections opened to a router")
+            lines.append(f"# TYPE {name}_connections_opened_total counter")
+            for router, count in sorted(self.__connections.items()):
+                lines.append(f"{name}_connections_opened_total{_labels(router=router)} {count}")
+        return '\n'.join(lines) + '\n'
+
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+class LogExporter(Instrument):
+
+    def __init__(self, logger=None, level=logging.INFO, slow_threshold=None):
+        """ Logs one JSON line per request
+
+        The fields are also attached to the log record as `peppy`, for handlers that ship structured logs.
+
+        Args:
+            logger (logging.Logger, optional): Logger to write to. Defaults to the 'PepPy.requests' logger.
+            level (int, optional): Level of successful requests, failures are logged as warnings. Defaults to logging.INFO.
+            slow_threshold (float, optional): Only log successful requests slower than this many seconds. Defaults to None.
+        """
+
+        self.logger = logger or logging.getLogger('PepPy.requests')
+        self.level = level
+        self.slow_threshold = slow_threshold
+
+    def after_request(self, event):
+        if event.outcome == RequestEvent.OK:
+            if self.slow_threshold is not None and event.elapsed < self.slow_threshold:
+                return
+            level = self.level
+        else:
+            level = logging.WARNING
+        if not self.logger.isEnabledFor(level):
+            return
+        fields = event.as_dict()
+        self.logger.log(level, json.dumps(fields), extra={'peppy': fields})
@@ -0,0 +1,331 @@
+import csv
+import json
+import os
+import time
+
+from .exceptions import RequestRejectedError
+from .status import DeviceInfo, WanStatus
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError: # pyarrow is only needed for Parquet exports
+    pyarrow = None
+
+# Columns and types of every table, so each writer knows its header before the first router answers
+TABLES = {
+    'devices': (
+        ('router', 'string'), ('name', 'string'), ('collected_at', 'float'), ('ok', 'bool'), ('error', 'string'),
+        ('elapsed', 'float'), ('serial_number', 'string'), ('model', 'string'), ('device_model', 'string'),
+        ('device_name', 'string'), ('firmware_version', 'string'), ('mac_address', 'string'), ('timezone', 'string'),
+        ('uptime', 'string'), ('cpu_load', 'string'),
+    ),
+    'wans': (
+        ('router', 'string'), ('serial_number', 'string'), ('collected_at', 'float'), ('wan_id', 'string'),
+        ('name', 'string'), ('enable', 'bool'), ('message', 'string'), ('ip', 'string'), ('cellular', 'bool'),
+        ('imei', 'string'), ('carrier', 'string'), ('signal_level', 'int'), ('sim_1_apn', 'string'), ('sim_2_apn', 'string'),
+    ),
+    'port_forwarding': (
+        ('router', 'string'), ('serial_number', 'string'), ('collected_at', 'float'), ('rule_id', 'string'),
+        ('name', 'string'), ('enable', 'bool'), ('protocol', 'string'), ('external_port', 'string'),
+        ('mapped_port', 'string'), ('server_ip', 'string'), ('allow_pepvpn', 'bool'),
+    ),
+}
+
+def _get(data, *path):
+    for key in path:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return data
+
+def device_row(result, info):
+    """ Flatten the outcome of one router into a row of the devices table
+
+    Args:
+        result (fleet.FleetResult): The collection result of the router
+        info (status.DeviceInfo): Device information, None if it could not be read
+
+    Returns:
+        dict: The row
+    """
+
+    row = {
+        'router': result.device.key,
+        'name': result.device.name,
+        'collected_at': time.time(),
+        'ok': result.ok,
+        'error': repr(result.error) if result.error is not None else None,
+        'elapsed': result.elapsed,
+    }
+    row.update(info.as_dict() if info is not None else dict.fromkeys(DeviceInfo.FIELDS))
+    return row
+
+def wan_rows(router, serial_number, wan_status, collected_at):
+    """ Flatten a status.wan.connection snapshot into rows of the wans table, one per WAN
+
+    Args:
+        router (str): ip:port of the router
+        serial_number (str): Serial number of the router
+        wan_status (status.WanStatus): WAN connection snapshot
+        collected_at (float): Unix time of the collection
+
+    Yields:
+        dict: One row per WAN connection
+    """
+
+    for wan in wan_status:
+        yield {
+            'router': router,
+            'serial_number': serial_number,
+            'collected_at': collected_at,
+            'wan_id': wan.id,
+            'name': wan.name,
+            'enable': wan.raw.get('enable'),
+            'message': wan.raw.get('message'),
+            'ip': wan.raw.get('ip'),
+            'cellular': wan.is_cellular,
+            'imei': _get(wan.cellular, 'imei'),
+            'carrier': _get(wan.cellular, 'carrier', 'name'),
+            'signal_level': _get(wan.cellular, 'signalLevel'),
+            'sim_1_apn': wan.apn(1),
+            'sim_2_apn': wan.apn(2),
+        }
+
+def port_forwarding_rows(router, serial_number, rules, collected_at):
+    """ Flatten config.inbound.service rules into rows of the port_forwarding table
+
+    Args:
+        router (str): ip:port of the router
+        serial_number (str): Serial number of the router
+        rules (dict): Port forwarding rules keyed by their id
+        collected_at (float): Unix time of the collection
+
+    Yields:
+        dict: One row per rule
+    """
+
+    for rule_id, rule in rules.items():
+        yield {
+            'router': router,
+            'serial_number': serial_number,
+            'collected_at': collected_at,
+            'rule_id': rule_id,
+            'name': rule.get('name'),
+            'enable': rule.get('enable'),
+            'protocol': _get(rule, 'protocol', 'type'),
+            'external_port': _string(_get(rule, 'protocol', 'port')),
+            'mapped_port': _string(_get(rule, 'protocol', 'portMapper')),
+            'server_ip': _get(rule, 'inboundServer', 'ip'),
+            'allow_pepvpn': rule.get('allowPepvpnConnection'),
+        }
+
+def _string(value):
+    # Ports can be a number, a range like "8000-8010" or missing
+    return None if value is None else str(value)
+
+class _TableWriter:
+
+    EXTENSION = None
+
+    def __init__(self, directory, prefix='inventory'):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.paths = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def path(self, table):
+        return os.path.join(self.directory, f"{self.prefix}_{table}.{self.EXTENSION}")
+
+    def write(self, table, row):
+        """ Write one row
+
+        Args:
+            table (str): Name of the table in TABLES
+            row (dict): The row, keys that are not columns of the table are ignored
+        """
+
+        if table not in self.paths:
+            self.paths[table] = self.path(table)
+            self._open(table)
+        self._write(table, row)
+
+    def close(self):
+        """ Flush and close every file """
+
+class CsvWriter(_TableWriter):
+    """ Writes every table to {prefix}_{table}.csv in a directory """
+
+    EXTENSION = 'csv'
+
+    def __init__(self, directory, prefix='inventory'):
+        super().__init__(directory, prefix)
+        self.__files = dict()
+        self.__writers = dict()
+
+    def _open(self, table):
+        self.__files[table] = open(self.paths[table], 'w', newline='')
+        self.__writers[table] = csv.DictWriter(self.__files[table], [name for name, _ in TABLES[table]], extrasaction='ignore')
+        self.__writers[table].writeheader()
+
+    def _write(self, table, row):
+        self.__writers[table].writerow(row)
+
+    def close(self):
+        for file in self.__files.values():
+            file.close()
+        self.__files.clear()
+
+class JsonLinesWriter(_TableWriter):
+    """ Writes every table to {prefix}_{table}.jsonl in a directory, one JSON object per row """
+
+    EXTENSION = 'jsonl'
+
+    def __init__(self, directory, prefix='inventory'):
+        super().__init__(directory, prefix)
+        self.__files = dict()
+
+    def _open(self, table):
+        self.__files[table] = open(self.paths[table], 'w')
+
+    def _write(self, table, row):
+        self.__files[table].write(json.dumps({name: row.get(name) for name, _ in TABLES[table]}) + '\n')
+
+    def close(self):
+        for file in self.__files.values():
+            file.close()
+        self.__files.clear()
+
+class ParquetWriter(_TableWriter):
+
+    EXTENSION = 'parquet'
+
+    def __init__(self, directory, prefix='inventory', batch_size=1000):
+        """ Writes every table to {prefix}_{table}.parquet in a directory
+
+        Rows are buffered and written as one row group per batch, so memory only grows with batch_size.
+
+        Args:
+            directory (str): Directory of the files
+            prefix (str, optional): Start of every file name. Defaults to 'inventory'.
+            batch_size (int, optional): Rows per row group. Defaults to 1000.
+        """
+
+        if pyarrow is None:
+            raise ImportError("ParquetWriter requires pyarrow. Install it with: pip install PepPy[parquet]")
+
+        super().__init__(directory, prefix)
+        self.batch_size = batch_size
+        self.__types = {'string': pyarrow.string(), 'float': pyarrow.float64(), 'int': pyarrow.int64(), 'bool': pyarrow.bool_()}
+        self.__writers = dict()
+        self.__batches = dict()
+
+    def _open(self, table):
+        schema = pyarrow.schema([(name, self.__types[kind]) for name, kind in TABLES[table]])
+        self.__writers[table] = pyarrow.parquet.ParquetWriter(self.paths[table], schema)
+        self.__batches[table] = list()
+
+    def _write(self, table, row):
+        self.__batches[table].append(row)
+        if len(self.__batches[table]) >= self.batch_size:
+            self.__flush(table)
+
+    def __flush(self, table):
+        writer = self.__writers[table]
+        if self.__batches[table]:
+            writer.write_table(pyarrow.Table.from_pylist(self.__batches[table], schema=writer.schema))
+            self.__batches[table] = list()
+
+    def close(self):
+        for table, writer in self.__writers.items():
+            self.__flush(table)
+            writer.close()
+        self.__writers.clear()
+
+class InventoryCollector:
+
+    def __init__(self, fleet, port_forwarding=True, wan=True):
+        """ Collects device information, WAN connections and port forwarding rules of a whole fleet
+
+        Routers are queried in parallel and their rows are handed out as soon as each router answers,
+        so nothing is kept for the whole fleet.
+
+        Args:
+            fleet (fleet.Fleet): Routers to collect from
+            port_forwarding (bool, optional): Collect the port forwarding rules. Defaults to True.
+            wan (bool, optional): Collect the WAN connections. Defaults to True.
+        """
+
+        self.fleet = fleet
+        self.port_forwarding = port_forwarding
+        self.wan = wan
+
+    def collect_device(self, pep):
+        """ Read everything the collector needs from one router
+
+        Args:
+            pep (peppy.PepPy): Logged in client of the router
+
+        Raises:
+            exceptions.RequestRejectedError: The port forwarding rules could not be read
+
+        Returns:
+            tuple: status.DeviceInfo, status.WanStatus or None, dict of port forwarding rules or None
+        """
+
+        info = pep.get_device_snapshot(max_age=0)
+        wan_status = WanStatus(pep.get_wan_connection_info()) if self.wan else None
+        rules = None
+        if self.port_forwarding:
+            config = pep.get_config('config.inbound.service', use_cache=False)
+            if config is None:
+                # Reported as a failed router, not as a router without rules
+                raise RequestRejectedError(f"Could not read the port forwarding rules of {pep.ip}")
+            rules = {key: rule for key, rule in config.items() if key.isdigit()}
+        return info, wan_status, rules
+
+    def collect(self):
+        """ Collect from every router
+
+        Yields:
+            tuple: (table, row) for every row of every table, router after router
+        """
+
+        for result in self.fleet.run(self.collect_device):
+            info, wan_status, rules = result.value if result.ok else (None, None, None)
+            row = device_row(result, info)
+            yield 'devices', row
+            if wan_status is not None:
+                for wan_row in wan_rows(row['router'], row['serial_number'], wan_status, row['collected_at']):
+                    yield 'wans', wan_row
+            if rules is not None:
+                for rule_row in port_forwarding_rows(row['router'], row['serial_number'], rules, row['collected_at']):
+                    yield 'port_forwarding', rule_row
+
+    def export(self, *writers):
+        """ Collect from every router and stream the rows into writers
+
+        Args:
+            *writers: CsvWriter, JsonLinesWriter or ParquetWriter objects, closed once everything is written
+
+        Returns:
+            dict: Number of rows written per table
+        """
+
+        counts = dict.fromkeys(TABLES, 0)
+        try:
+            for table, row in self.collect():
+                counts[table] += 1
+                for writer in writers:
+                    writer.write(table, row)
+        finally:
+            for writer in writers:
+                writer.close()
+        return counts
@@ -0,0 +1,338 @@
+""" Local stand-in for Peplink routers, used by the tests and the benchmarks.
+
+One MockRouterServer runs any number of virtual routers in one process, each listening on its own port.
+Every router answers the parts of the API that PepPy uses and can be made slow, flaky or unresponsive.
+
+Run it on its own with:
+    python -m PepPy.mock_router --devices 10 --port 9000 --latency 0.05
+"""
+import argparse
+import json
+import random
+import ssl
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Keys of a request that are not part of the stored configuration
+_REQUEST_KEYS = ('func', 'action', 'agent', 'instantActive', 'enforce', 'section')
+
+class MockRouter:
+
+    def __init__(self, number=1, username='admin', password='admin', firmware_version='8.1.0', latency=0.0,
+                 error_rate=0.0, timeout_rate=0.0, hang_time=5.0, require_login=True, reboot_time=0.0):
+        """ State of one virtual Peplink router
+
+        Args:
+            number (int, optional): Used to make the serial number, MAC address and IMEI unique. Defaults to 1.
+            username (str, optional): Accepted login username. Defaults to 'admin'.
+            password (str, optional): Accepted login password. Defaults to 'admin'.
+            firmware_version (str, optional): Reported firmware version. Defaults to '8.1.0'.
+            latency (float or tuple, optional): Seconds to wait before answering, or a (min, max) range. Defaults to 0.0.
+            error_rate (float, optional): Fraction of requests answered with HTTP 503. Defaults to 0.0.
+            timeout_rate (float, optional): Fraction of requests that are never answered. Defaults to 0.0.
+            hang_time (float, optional): Seconds an unanswered request keeps the connection open. Defaults to 5.0.
+            require_login (bool, optional): Answer 401 to requests without a valid bauth cookie. Defaults to True.
+            reboot_time (float, optional): Seconds the router drops every connection after a firmware upgrade. Defaults to 0.0.
+        """
+
+        self.number = number
+        self.username = username
+        self.password = password
+        self.firmware_version = firmware_version
+        self.next_firmware_version = None
+        self.reject_firmware = False
+        self.latency = latency
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_time = hang_time
+        self.require_login = require_login
+        self.reboot_time = reboot_time
+        self.rebooting_until = 0.0
+        self.name = f"Mock Router {number}"
+        self.serial_number = f"MOCK-{number:04d}-{number * 7 % 10000:04d}"
+        self.mac_address = "00:1A:DD:{:02X}:{:02X}:{:02X}".format((number >> 16) & 0xff, (number >> 8) & 0xff, number & 0xff)
+        self.imei = f"35{number:013d}"
+        self.started = time.monotonic()
+        self.sessions = set()
+        self.config = dict()
+        self.requests = 0
+        self.applies = 0
+        self.firmware_uploads = 0
+        self.lock = threading.Lock()
+
+    def delay(self):
+        if isinstance(self.latency, (tuple, list)):
+            return random.uniform(*self.latency)
+        return self.latency
+
+    def system_info(self):
+        uptime = int(time.monotonic() - self.started)
+        load = random.randint(1, 40)
+        return {
+            'device': {'name': self.name, 'model': 'MAX BR1 Mini', 'productCode': 'MAX-BR1-MINI-LTEA-W-T',
+                       'serialNumber': self.serial_number, 'firmwareVersion': self.firmware_version},
+            'macInfo': [{'name': 'LAN', 'mac': self.mac_address}],
+            'uptime': {'second': uptime, 'string': f"{uptime // 86400} days {uptime % 86400 // 3600} hours"},
+            'cpuLoad': {'percentage': load, 'string': f"{load}%"},
+            'systemTime': {'timezone': self.config.get('config.time', {}).get('timeZone', 'UTC')}
+        }
+
+    def wan_connection(self):
+        return {
+            'order': [1, 2],
+            '1': {'name': 'WAN', 'enable': True, 'message': 'Connected', 'ip': '10.0.0.2'},
+            '2': {'name': 'Cellular', 'enable': True, 'message': 'Connected',
+                  'cellular': {'imei': self.imei, 'carrier': {'name': 'Mock Mobile'}, 'signalLevel': 4,
+                               'sim': {'1': {'apn': 'mock.apn'}}}}
+        }
+
+    def read(self, func):
+        if func == 'status.system.info':
+            return self.system_info()
+        elif func == 'status.wan.connection':
+            return self.wan_connection()
+        elif func.startswith('config.'):
+            return self.config.get(func, {})
+        return None
+
+    def write(self, params):
+        func = params.get('func')
+        if func == 'cmd.config.apply':
+            self.applies += 1
+        elif func == 'cmd.password':
+            self.password = params.get('newPassword', self.password)
+        elif func == 'config.inbound.service':
+            self.__write_rules(params)
+        elif func and func.startswith('config.'):
+            section = self.config.setdefault(func, dict())
+            if 'list' in params:
+                for entry in params['list']:
+                    section[str(entry.get('id', len(section) + 1))] = entry
+            else:
+                section.update({key: value for key, value in params.items() if key not in _REQUEST_KEYS})
+        elif 'section' in params:
+            self.config.setdefault(params['section'], dict()).update(params)
+
+    def __write_rules(self, params):
+        rules = self.config.setdefault('config.inbound.service', dict())
+        action = params.get('action', 'add')
+        for rule in params.get('list', []):
+            if action == 'remove':
+                rules.pop(str(rule.get('id')), None)
+                continue
+            rule = dict(rule)
+            if action == 'add' or not rule.get('id'):
+                rule['id'] = max((int(key) for key in rules), default=0) + 1
+            rules[str(rule['id'])] = rule
+
+class _MockRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    @property
+    def router(self):
+        return self.server.router
+
+    def do_GET(self):
+        self.__handle(get=True)
+
+    def do_POST(self):
+        self.__handle(get=False)
+
+    def __handle(self, get):
+        router = self.router
+        body = b'' if get else self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with router.lock:
+            router.requests += 1
+
+        if time.monotonic() < router.rebooting_until:
+            self.close_connection = True
+            return
+        time.sleep(router.delay())
+        if random.random() < router.timeout_rate:
+            time.sleep(router.hang_time)
+            self.close_connection = True
+            return
+        if random.random() < router.error_rate:
+            return self.__reply('Service Unavailable', status=503, content_type='text/plain')
+
+        path = urllib.parse.urlsplit(self.path)
+        endpoint = path.path.rsplit('/', 1)[-1]
+        with router.lock:
+            if endpoint == 'api.cgi':
+                self.__api(get, path.query, body)
+            elif endpoint == 'admin.cgi':
+                self.__admin(body)
+            elif endpoint == 'firmware.cgi':
+                self.__firmware(body)
+            else:
+                self.__reply('Not Found', status=404, content_type='text/plain')
+
+    def __logged_in(self):
+        cookies = dict(cookie.strip().split('=', 1) for cookie in self.headers.get('Cookie', '').split(';') if '=' in cookie)
+        return not self.router.require_login or cookies.get('bauth') in self.router.sessions
+
+    def __api(self, get, query, body):
+        router = self.router
+        params = self.__parse_body(body) if not get else {key: values[0] for key, values in urllib.parse.parse_qs(query).items()}
+        func = params.get('func', '')
+
+        if func == 'login':
+            if params.get('username') == router.username and params.get('password') == router.password:
+                session = uuid.uuid4().hex
+                router.sessions.add(session)
+                return self.__json({'stat': 'ok', 'response': {'permission': {'GET': True, 'POST': True}}},
+                                   cookie=f"bauth={session}; Path=/; HttpOnly")
+            return self.__json({'stat': 'fail', 'code': 401, 'message': 'Invalid username or password'})
+
+        if not self.__logged_in():
+            return self.__json({'stat': 'fail', 'code': 401, 'message': 'Unauthorized'})
+
+        if get:
+            response = router.read(func)
+            if response is None:
+                return self.__json({'stat': 'fail', 'code': 400, 'message': f"Unknown function {func}"})
+            return self.__json({'stat': 'ok', 'response': response})
+
+        router.write(params)
+        self.__json({'stat': 'ok'})
+
+    def __admin(self, body):
+        if not self.__logged_in():
+            return self.__reply('<status>\n0\n</status>', content_type='text/xml')
+        self.router.write(self.__parse_body(body))
+        self.__reply('<status>\n1\n</status>', content_type='text/xml')
+
+    def __firmware(self, body):
+        router = self.router
+        if not self.__logged_in() or router.reject_firmware or b'filename=' not in body:
+            return self.__reply('<status>\n0\n</status>', content_type='text/xml')
+        router.firmware_uploads += 1
+        if router.next_firmware_version:
+            router.firmware_version = router.next_firmware_version
+            router.started = time.monotonic()
+            router.rebooting_until = router.started + router.reboot_time
+        self.__reply('<status>\n1\n</status>', content_type='text/xml')
+
+    def __parse_body(self, body):
+        text = body.decode(errors='replace')
+        try:
+            return json.loads(text)
+        except ValueError:
+            return {key: values[0] for key, values in urllib.parse.parse_qs(text, keep_blank_values=True).items()}
+
+    def __json(self, body, cookie=None):
+        self.__reply(json.dumps(body), cookie=cookie)
+
+    def __reply(self, body, status=200, content_type='application/json', cookie=None):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if cookie:
+            self.send_header('Set-Cookie', cookie)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _RouterHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # A client that timed out closes the connection before the answer is written
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+class MockRouterServer:
+
+    def __init__(self, devices=1, host='127.0.0.1', port=0, certfile=None, keyfile=None, **router_options):
+        """ Runs virtual Peplink routers, each one on its own port
+
+        Args:
+            devices (int, optional): Number of virtual routers. Defaults to 1.
+            host (str, optional): Address to listen on. Defaults to '127.0.0.1'.
+            port (int, optional): Port of the first router, the others use the following ports. 0 picks free ports. Defaults to 0.
+            certfile (str, optional): Certificate to serve HTTPS with. Defaults to None (HTTP).
+            keyfile (str, optional): Private key of certfile. Defaults to None.
+            **router_options: Keyword arguments for every MockRouter, e.g. latency or error_rate
+        """
+
+        self.host = host
+        self.http_type = 'https' if certfile else 'http'
+        self.routers = [MockRouter(number + 1, **router_options) for number in range(devices)]
+        self.__servers = list()
+        self.__threads = list()
+        self.__port = port
+        self.__ssl_context = None
+        if certfile:
+            self.__ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.__ssl_context.load_cert_chain(certfile, keyfile)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        for number, router in enumerate(self.routers):
+            server = _RouterHTTPServer((self.host, self.__port + number if self.__port else 0), _MockRouterHandler)
+            if self.__ssl_context:
+                server.socket = self.__ssl_context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+            server.router = router
+            router.port = server.server_address[1]
+            thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+            thread.start()
+            self.__servers.append(server)
+            self.__threads.append(thread)
+
+    def stop(self):
+        for server in self.__servers:
+            server.shutdown()
+            server.server_close()
+        self.__servers.clear()
+        self.__threads.clear()
+
+    def inventory(self):
+        """ Connection details of every virtual router
+
+        Returns:
+            list: Dicts with the fleet.Device arguments
+        """
+
+        return [{'ip_address': self.host, 'port': router.port, 'username': router.username, 'password': router.password,
+                 'http_type': self.http_type, 'name': router.name} for router in self.routers]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000, help="Port of the first router, 0 picks free ports")
+    parser.add_argument('--certfile', help="Serve HTTPS with this certificate")
+    parser.add_argument('--keyfile')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockRouterServer(args.devices, host=args.host, port=args.port, certfile=args.certfile, keyfile=args.keyfile,
+                              latency=args.latency, error_rate=args.error_rate, timeout_rate=args.timeout_rate)
+    with server:
+        for router in server.routers:
+            print(f"{router.name}: {server.http_type}://{server.host}:{router.port} ({router.serial_number})", flush=True)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
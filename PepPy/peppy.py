@@ -1,16 +1,98 @@
-import urllib
+import contextlib
 
 import requests
 import urllib3
 import time
+from requests.adapters import HTTPAdapter
+
+from .exceptions import CircuitOpenError, PepPyError, RequestRejectedError, RouterNotReadyError, RouterUnreachableError
+from .firmware import BandwidthLimiter, FirmwareImage, MultipartEncoder
+from .instrumentation import RequestEvent, payload_size, request_function
+from .port_forwarding import RuleTable
+from .resilience import CircuitBreaker, RequestGovernor, RetryPolicy
+from .sessions import SessionStore
+from .status import DeviceInfo, WanStatus
+from .templates import without_none
+from .transaction import Transaction
 
 # Disable a printed warning for the requests module
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+def check_if_good_response(response):
+    """ Check if the Peplink accepted an API call
+
+    Args:
+        response: Any response object with a `text` attribute
+
+    Returns:
+        bool: True if the response body reports success
+    """
+
+    try:
+        if 'ok' in response.text or 'Success' in response.text:
+            return True
+        elif '1' in response.text.split('\n'):
+            return True
+        else:
+            return False
+    except AttributeError:
+        return False
+
+def is_unauthorized(response):
+    """ Check if the Peplink refused a request because the session is not logged in
+
+    Args:
+        response: Any response object with `status_code` and `text` attributes
+
+    Returns:
+        bool: True if the response is a HTTP 401 or an API error with code 401
+    """
+
+    if response.status_code == 401:
+        return True
+    if '401' not in response.text:
+        return False
+    try:
+        return response.json().get('code') == 401
+    except (ValueError, AttributeError):
+        return False
+
+def clean_params(params):
+    """ Remove every parameter set to None, the Peplink API throws an error on them
+
+    Args:
+        params (dict or list): Parameters to clean, they are left unchanged
+
+    Returns:
+        dict or list: A cleaned copy of the parameters
+    """
+
+    return without_none(params)
+
+def never_sent(error):
+    """ Check if a failed request could not have reached the router
+
+    Args:
+        error (requests.exceptions.RequestException): Raised by requests
+
+    Returns:
+        bool: True if the connection was never made, so sending again can not repeat a change
+    """
+
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and not isinstance(error, requests.exceptions.Timeout):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
 class PepPy:
 
     def __init__(self, username, password, ip_address="192.168.50.1", port=443, http_type="https", debug=False,
-                 timeout=0.5, proxy=None):
+                 timeout=0.5, proxy=None, pool_connections=1, pool_maxsize=10, max_retries=0, keep_alive=True,
+                 device_info_ttl=5, wan_status_ttl=5, skip_unchanged=False, retry_policy=None, auto_login=True,
+                 failure_threshold=5, failure_cooldown=30, instruments=None, session_store=None,
+                 rate_limit=None, rate_burst=None, max_concurrent=None, queue_timeout=None):
         """ Creates a python module that integrates with the Peplink API.
 
         Args:
@@ -21,6 +103,28 @@ class PepPy:
             http_type (str, optional): The HTTP protocol to use. Can either be HTTPS or HTTP. Defaults to "https".
             debug (bool, optional): If True, it will display debugging messages. Defaults to False.
             proxy (dict, optional): Use local proxy for debugging
+            pool_connections (int, optional): Number of connection pools to cache. Defaults to 1.
+            pool_maxsize (int, optional): Maximum number of connections kept open to the router. Defaults to 10.
+            max_retries (int or urllib3.util.Retry, optional): Retry configuration for the connection adapter. Defaults to 0.
+            keep_alive (bool, optional): Reuse connections between API calls. Defaults to True.
+            device_info_ttl (float, optional): Seconds cached volatile device info (uptime, CPU load) stays fresh. Defaults to 5.
+            wan_status_ttl (float, optional): Seconds a cached WAN connection status stays fresh. Defaults to 5.
+            skip_unchanged (bool, optional): Read the current configuration back and skip pushes, and applies, that change nothing. Defaults to False.
+            retry_policy (resilience.RetryPolicy, optional): How to retry timeouts and connection errors. A POST is only sent again
+                if the connection could not be made or the router answered with a retry_on_status. Defaults to RetryPolicy().
+            auto_login (bool, optional): Log in again and repeat the request when the session expired. Defaults to True.
+            failure_threshold (int, optional): Failed requests in a row before calls to this ip:port fail fast, None disables it. Defaults to 5.
+            failure_cooldown (float, optional): Seconds to fail fast before a single probe request is let through. Defaults to 30.
+            instruments (list, optional): instrumentation.Instrument objects told about every request. Defaults to None.
+            session_store (sessions.SessionStore or str, optional): Store, or path of one, to share the login session
+                with other instances and processes. Defaults to None.
+            rate_limit (float, optional): API calls per second to this ip:port, shared by every instance. Retries of a
+                call do not count again. None disables it. Defaults to None.
+            rate_burst (int, optional): API calls that can be sent at once after a quiet period. Defaults to rate_limit.
+            max_concurrent (int, optional): API calls in flight at once to this ip:port, shared by every instance.
+                None disables it. Defaults to None.
+            queue_timeout (float, optional): Longest wait for the rate and concurrency limits, including the process wide
+                resilience.RequestGovernor.set_global_limit(). Defaults to waiting as long as needed.
         """
 
         self.username = username
@@ -36,7 +140,52 @@ class PepPy:
         self.__FIRMWARE_ENDPOINT = "firmware.cgi"
         self.__PROXY = proxy
         self.cookies  = None
+        self.__device_info_ttl = device_info_ttl
+        self.__device_info = None
+        self.__wan_status_ttl = wan_status_ttl
+        self.__wan_status = None
+        self.__transaction = None
+        self.__skip_unchanged = skip_unchanged
+        self.__config_cache = dict()
+        self.__unapplied_changes = False
+        self.__retry_policy = retry_policy or RetryPolicy()
+        self.__auto_login = auto_login
+        self.__failure_threshold = failure_threshold
+        self.__failure_cooldown = failure_cooldown
+        self.__rate_limit = rate_limit
+        self.__rate_burst = rate_burst
+        self.__max_concurrent = max_concurrent
+        self.__queue_timeout = queue_timeout
+        self.__waiting_for_reboot = False
+        self.instruments = list(instruments or [])
+        if isinstance(session_store, str):
+            session_store = SessionStore(session_store)
+        self.__session_store = session_store
+        self.__session = self.__create_session(pool_connections, pool_maxsize, max_retries, keep_alive)
         self.__update_url()
+        if self.__session_store is not None:
+            self.cookies = self.__session_store.get(self.__session_key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Close every pooled connection to the Peplink router """
+
+        self.__debug('Closing session')
+        self.__session.close()
+
+    def __create_session(self, pool_connections, pool_maxsize, max_retries, keep_alive):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=max_retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
         
     @property
     def ip(self):
@@ -54,6 +203,10 @@ class PepPy:
     def timeout(self, new_timeout):
         self.__timeout = new_timeout
     
+    @property
+    def __session_key(self):
+        return f"{self.__ip}:{self.__port}:{self.username}"
+
     def __update_url(self):
         self.__debug('Updating URL')
         self.__URL = f"{self.__http_type}://{self.__ip}:{self.__port}/cgi-bin/MANGA/"
@@ -63,52 +216,130 @@ class PepPy:
             print(message)
 
     def __check_peplink_response(self, response):
-        result = self.__check_if_good_response(response)
+        result = check_if_good_response(response)
         return result
-    
-    def __check_if_good_response(self, response):
-        try:
-            if 'ok' in response.text or 'Success' in response.text:
-                return True
-            elif '1' in response.text.split('\n'):
-                return True
-            else:
-                return False
-        except AttributeError:
-            return False
 
-    def __send_correct_request(self, endpoint, clean=True, get=False, **kwargs):
+    def __send_correct_request(self, endpoint, clean=True, get=False, relogin=True, **kwargs):
         url = self.__URL + endpoint
         self.__debug(f"Sending a request to: {url}")
         # Need to clean the parameters = None or else the peplink API will throw an error
         if clean:
-            self.__clean(kwargs)
-        try:  
-            if get:
-                response = requests.get(url, verify=False, cookies=self.cookies, timeout=self.__timeout, proxies=self.__PROXY, **kwargs)
-            else:
-                response = requests.post(url, verify=False, cookies=self.cookies, timeout=self.__timeout, proxies=self.__PROXY, **kwargs)
-        except requests.exceptions.ReadTimeout:
-            response = dict()
-        except requests.exceptions.ConnectTimeout:
-            response = dict()
-        except requests.exceptions.ConnectionError:
-            response = dict()
+            kwargs = clean_params(kwargs)
+
+        if not self.instruments:
+            return self.__send_and_relogin(url, get, relogin, kwargs)
+
+        event = RequestEvent(f"{self.__ip}:{self.__port}", endpoint, request_function(endpoint, kwargs),
+                             'GET' if get else 'POST', payload_size(kwargs))
+        for instrument in self.instruments:
+            instrument.before_request(event)
+        connections = self.__connections_opened(url)
+        start = time.perf_counter()
+        try:
+            response = self.__send_and_relogin(url, get, relogin, kwargs)
+        except Exception as e:
+            event.failed(e, time.perf_counter() - start)
+            raise
+        else:
+            event.finished(response, time.perf_counter() - start, check_if_good_response(response))
+        finally:
+            event.new_connection = self.__connections_opened(url) > connections
+            for instrument in self.instruments:
+                instrument.after_request(event)
+        return response
+
+    def __send_template(self, endpoint, template):
+        # The body is serialized once per template and reused for every router it is pushed to
+        return self.__send_correct_request(endpoint, clean=False, data=template.body,
+                                           headers={'Content-Type': template.content_type})
+
+    def __connections_opened(self, url):
+        # urllib3 counts the connections each pool opened, a keep-alive reuse leaves it unchanged.
+        # Every pool of the session belongs to this router
+        try:
+            pools = self.__session.get_adapter(url).poolmanager.pools
+            return sum(pools[key].num_connections for key in pools.keys())
+        except (AttributeError, KeyError):
+            return 0
+
+    def __send_and_relogin(self, url, get, relogin, kwargs):
+        response = self.__send_in_turn(url, get, kwargs)
+        if relogin and self.__auto_login and is_unauthorized(response):
+            self.__debug("Session expired, logging in again")
+            if self.__session_store is not None and self.cookies:
+                # Another process may have stored a newer session, only forget the rejected one
+                self.__session_store.discard(self.__session_key, dict(self.cookies.items()))
+            if self.login():
+                response = self.__send_in_turn(url, get, kwargs)
+            if is_unauthorized(response):
+                raise RequestRejectedError(f"{url} rejected the login of {self.username}")
 
         self.__check_for_new_cookies_in_reponse(response)
         return response
 
-    def __clean(self, params):
-        if type(params) == list:
-            return [self.__clean(e) for e in params]
-        elif type(params) == dict:
-            for k, v in list(params.items()):
-                if v is None:
-                    del params[k]
+    def __request_slot(self):
+        if self.__rate_limit is None and self.__max_concurrent is None:
+            return RequestGovernor.global_slot(self.__queue_timeout)
+        # Shared by every instance talking to the same router
+        governor = RequestGovernor.for_router(f"{self.__ip}:{self.__port}", self.__rate_limit, self.__rate_burst,
+                                              self.__max_concurrent)
+        return governor.slot(self.__queue_timeout)
+
+    def __send_in_turn(self, url, get, kwargs):
+        # A call waits for its turn before the breaker is asked, so a half-open probe is never held up in the queue
+        with self.__request_slot():
+            return self.__send_through_breaker(url, get, kwargs)
+
+    def __send_through_breaker(self, url, get, kwargs):
+        # Readiness probes are expected to fail while the router reboots
+        if self.__failure_threshold is None or self.__waiting_for_reboot:
+            return self.__send_with_retries(url, get, kwargs)
+
+        # Shared by every instance talking to the same router
+        breaker = CircuitBreaker.for_router(f"{self.__ip}:{self.__port}", self.__failure_threshold, self.__failure_cooldown)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{self.__ip}:{self.__port} failed {breaker.failures} times in a row, "
+                                   f"retrying in {breaker.retry_after():.1f}s")
+        try:
+            response = self.__send_with_retries(url, get, kwargs)
+        except RouterUnreachableError:
+            breaker.record_failure()
+            raise
+        except Exception:
+            breaker.release() # Only failures to reach the router count
+            raise
+        if self.__retry_policy.should_retry_status(response.status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def __send_with_retries(self, url, get, kwargs):
+        attempt = 0
+        while True:
+            attempt += 1
+            # A failed attempt could have read part of a streamed body
+            if hasattr(kwargs.get('data'), 'seek'):
+                kwargs['data'].seek(0)
+            try:
+                if get:
+                    response = self.__session.get(url, verify=False, cookies=self.cookies, timeout=self.__timeout, proxies=self.__PROXY, **kwargs)
                 else:
-                    params[k] = self.__clean(v)
-        return params
-    
+                    response = self.__session.post(url, verify=False, cookies=self.cookies, timeout=self.__timeout, proxies=self.__PROXY, **kwargs)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if attempt >= self.__retry_policy.attempts:
+                    raise RouterUnreachableError(f"{url} did not answer after {attempt} attempts: {e}") from e
+                # The router may have received a POST that timed out, sending it again could repeat the change
+                if not get and not never_sent(e):
+                    raise RouterUnreachableError(f"{url} did not answer, not sent again as it may have been received: {e}") from e
+            else:
+                if attempt >= self.__retry_policy.attempts or not self.__retry_policy.should_retry_status(response.status_code):
+                    return response
+
+            delay = self.__retry_policy.delay(attempt)
+            self.__debug(f"Attempt {attempt} to {url} failed, retrying in {delay:.2f}s")
+            time.sleep(delay)
+
     def __check_for_new_cookies_in_reponse(self, response):
         try:
             response.cookies['bauth'] # bauth is where peplink stores the cookie as
@@ -121,13 +352,21 @@ class PepPy:
     
     def __update_cookies(self, new_cookies):
         self.cookies  = new_cookies
+        if self.__session_store is not None:
+            expires = next((cookie.expires for cookie in new_cookies if cookie.name == 'bauth'), None)
+            self.__session_store.put(self.__session_key, dict(new_cookies.items()), expires)
     
     
-    def apply_changes(self, wait_time=15):
+    def apply_changes(self, wait_time=15, wait_until_ready=False, ready_timeout=60):
         """ Apply changes made to the peplink. This usually takes a couple seconds to take effect
 
         Args:
             wait_time (int, optional): Time to wait after applying changes. Defaults to 15.
+            wait_until_ready (bool, optional): Poll the router instead of waiting wait_time and return as soon as it is ready. Defaults to False.
+            ready_timeout (float, optional): Maximum seconds to poll when wait_until_ready is True. Defaults to 60.
+
+        Raises:
+            exceptions.RouterNotReadyError: The router did not come back within ready_timeout
 
         Returns:
             bool: True if the Peplink accepted the API Call
@@ -135,20 +374,194 @@ class PepPy:
 
         self.__debug("Applying Changes")
 
+        if self.__skip_unchanged and not self.__unapplied_changes:
+            self.__debug("Nothing changed, skipping apply")
+            return True
+
         params = {'func': 'cmd.config.apply'}
 
         result = self.__send_correct_request(self.__OVERALL_ENDPOINT, data=params)
-        time.sleep(wait_time) # Need to wait some time for the settings to take effect
-        return self.__check_peplink_response(result)
+        self.__device_info = None # Name, timezone, etc. could have changed
+        self.__wan_status = None
+        self.__unapplied_changes = False
+        accepted = self.__check_peplink_response(result)
+        if wait_until_ready:
+            if accepted:
+                self.wait_until_ready(timeout=ready_timeout)
+        else:
+            time.sleep(wait_time) # Need to wait some time for the settings to take effect
+        return accepted
+
+    def wait_until_ready(self, timeout=60, poll_interval=0.5, max_poll_interval=5, settle_checks=2, min_delay=5):
+        """ Poll status.system.info with exponential backoff until the router answers consistently
+
+        Right after an apply the router can still answer before it restarts, so good answers only count once
+        a probe failed, the uptime went back, or min_delay seconds passed.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait. Defaults to 60.
+            poll_interval (float, optional): Seconds between the first polls. Defaults to 0.5.
+            max_poll_interval (float, optional): Largest backoff between polls. Defaults to 5.
+            settle_checks (int, optional): Consecutive good answers needed to call the router settled. Defaults to 2.
+            min_delay (float, optional): Seconds after which good answers count without a sign of a restart, for
+                applies that do not restart the router. Defaults to 5.
+
+        Raises:
+            exceptions.RouterNotReadyError: The router did not settle within timeout
+
+        Returns:
+            float: Seconds it took for the router to be ready
+        """
+
+        start = time.monotonic()
+        deadline = start + timeout
+        interval = poll_interval
+        good_answers = 0
+        restarted = False
+        last_uptime = None
+        with self.expecting_reboot():
+            while True:
+                time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+                results = self.__probe()
+                if results is None:
+                    restarted = True
+                    good_answers = 0
+                    interval = min(interval * 2, max_poll_interval)
+                else:
+                    uptime = (results.get('uptime') or {}).get('second')
+                    if uptime is not None and last_uptime is not None and uptime < last_uptime:
+                        restarted = True
+                    last_uptime = uptime
+                    interval = poll_interval
+                    # Answers from before the restart do not count
+                    if restarted or time.monotonic() - start >= min_delay:
+                        good_answers += 1
+                    if good_answers >= settle_checks:
+                        elapsed = time.monotonic() - start
+                        self.__debug(f"Router ready after {elapsed:.1f}s")
+                        return elapsed
+                if time.monotonic() >= deadline:
+                    raise RouterNotReadyError(f"{self.__ip}:{self.__port} was not ready after {timeout}s")
+
+    @contextlib.contextmanager
+    def expecting_reboot(self):
+        """ Send the requests of the with block around the circuit breaker
+
+        Polls of a rebooting router are expected to fail, they must not open the breaker that every other
+        client of the router shares.
+        """
+
+        waiting_for_reboot = self.__waiting_for_reboot
+        self.__waiting_for_reboot = True
+        try:
+            yield self
+        finally:
+            self.__waiting_for_reboot = waiting_for_reboot
+
+    def __probe(self):
+        try:
+            return self.get_device_info()
+        except (KeyError, ValueError, PepPyError):
+            return None
 
     
-    def login(self):
+    @contextlib.contextmanager
+    def transaction(self, wait_time=15, wait_until_ready=False, ready_timeout=60):
+        """ Queue configuration changes and send them together with a single apply
+
+        Every setter called inside of the with block returns a transaction.PendingChange instead of sending.
+        On exit the changes are sent, address changing ones (LAN IP, admin port) last, then applied once.
+        Nothing is sent if the block raises.
+
+        Args:
+            wait_time (int, optional): Time to wait after applying changes. Defaults to 15.
+            wait_until_ready (bool, optional): Poll the router instead of waiting wait_time. Defaults to False.
+            ready_timeout (float, optional): Maximum seconds to poll when wait_until_ready is True. Defaults to 60.
+
+        Yields:
+            transaction.Transaction: The open transaction, holds the per-change results after commit
+        """
+
+        if self.__transaction is not None:
+            raise PepPyError("A transaction is already open")
+
+        self.__debug("Starting transaction")
+        self.__transaction = Transaction()
+        try:
+            yield self.__transaction
+        finally:
+            transaction, self.__transaction = self.__transaction, None
+
+        self.__debug(f"Committing {len(transaction)} changes")
+        transaction.commit(lambda: self.apply_changes(wait_time=wait_time, wait_until_ready=wait_until_ready,
+                                                      ready_timeout=ready_timeout))
+
+    def __submit(self, name, send, priority=Transaction.NORMAL, template=None):
+        if template is not None and self.__is_unchanged(template):
+            self.__debug(f"Skipping {name}, the router already has these settings")
+            return True
+
+        def send_and_track():
+            accepted = send()
+            if accepted:
+                self.__unapplied_changes = True
+            if template is not None:
+                self.__config_cache.pop(template.params.get('func'), None)
+            return accepted
+
+        if self.__transaction is not None:
+            return self.__transaction.queue(name, send_and_track, priority)
+        return send_and_track()
+
+    def __is_unchanged(self, template):
+        if not self.__skip_unchanged or not template.readable:
+            return False
+        current = self.get_config(template['func'])
+        if current is None:
+            return False
+        return not template.differs_from(template.current_config(current))
+
+    def get_config(self, func, use_cache=True):
+        """ Read a configuration section back from the router, e.g. 'config.time'
+
+        Args:
+            func (str): The config.* function of the section
+            use_cache (bool, optional): Reuse the section if it was already read in this session. Defaults to True.
+
+        Returns:
+            dict: The current configuration of the section, None if it could not be read
+        """
+
+        if use_cache and func in self.__config_cache:
+            return self.__config_cache[func]
+
+        params = {'func': func}
+        try:
+            results = self._parse_response(self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True))
+        except (KeyError, ValueError, RequestRejectedError):
+            results = None
+        if results is not None:
+            self.__config_cache[func] = results
+        return results
+
+    def login(self, reuse_session=True):
         """ Log into peplink router
 
+        Args:
+            reuse_session (bool, optional): With a session_store, take over a stored session instead of logging in.
+                A session the router no longer accepts is replaced by a new login on the next call. Defaults to True.
+
         Returns:
             bool: True if the Peplink accepted the API Call
         """
 
+        if reuse_session and self.__session_store is not None:
+            cookies = self.__session_store.get(self.__session_key)
+            if cookies:
+                self.__debug("Reusing stored session")
+                self.cookies = cookies
+                return True
+
         self.__debug("Logging in")
 
         params = {
@@ -157,7 +570,7 @@ class PepPy:
             'func': 'login'
         }
         
-        result = self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
+        result = self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params, relogin=False)
         return self.__check_peplink_response(result)
 
     def change_password(self, new_password):
@@ -180,7 +593,10 @@ class PepPy:
 
         result = self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
         self.password = new_password
-        return self.__check_peplink_response(result)
+        accepted = self.__check_peplink_response(result)
+        if accepted:
+            self.__unapplied_changes = True
+        return accepted
     
     def edit_lan(self, lan_profile): 
         """ Edit lan configuration for peplink router under: Network > Network Settings > LAN
@@ -196,9 +612,12 @@ class PepPy:
 
         params = lan_profile.params
 
-        result = self.__send_correct_request(self.__ADMIN_ENDPOINT, data=params)
-        self.ip = params['lan_ip']
-        return self.__check_peplink_response(result)
+        def send():
+            result = self.__send_template(self.__ADMIN_ENDPOINT, lan_profile)
+            self.ip = params['lan_ip']
+            return self.__check_peplink_response(result)
+
+        return self.__submit('edit_lan', send, Transaction.MOVES_IP, template=lan_profile)
 
     def update_generic_lan(self, generic_lan):
         """ Update Generic Lan information under: Network > Network Settings
@@ -212,10 +631,12 @@ class PepPy:
 
         self.__debug("Updating Generic Lan")
 
-        params = generic_lan.params
 
-        result = self.__send_correct_request(self.__ADMIN_ENDPOINT, data=params)
-        return self.__check_peplink_response(result)
+        def send():
+            result = self.__send_template(self.__ADMIN_ENDPOINT, generic_lan)
+            return self.__check_peplink_response(result)
+
+        return self.__submit('update_generic_lan', send, template=generic_lan)
 
     def add_port_forwarding_rule(self, port_forwarding):
         """ Add port forwarding rule to peplink router under: Advanced > Port Forwarding
@@ -228,11 +649,53 @@ class PepPy:
         """
         
         self.__debug("Adding Port Forwarding Policy")
-        params = port_forwarding.params
-        
-        result =  self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
-        return self.__check_peplink_response(result)
+
+        def send():
+            result = self.__send_template(self.__OVERALL_ENDPOINT, port_forwarding)
+            return self.__check_peplink_response(result)
+
+        return self.__submit('add_port_forwarding_rule', send, template=port_forwarding)
     
+    def sync_port_forwarding(self, desired_rules, remove_missing=True):
+        """ Make the port forwarding rules of the router match desired_rules, rules are matched by name
+
+        Only the differences are sent, in at most one request each for removing, updating and adding rules.
+
+        Args:
+            desired_rules (list or port_forwarding.RuleTable): templates.PortForwarding objects or rule dicts
+            remove_missing (bool, optional): Remove rules of the router that are not in desired_rules. Defaults to True.
+
+        Raises:
+            exceptions.PortForwardingConflictError: Two desired rules share a name or an external port
+            exceptions.RequestRejectedError: The current rules could not be read
+
+        Returns:
+            bool: True if the Peplink accepted every API Call
+        """
+
+        desired = desired_rules if isinstance(desired_rules, RuleTable) else RuleTable(desired_rules)
+        add, update, remove = self.get_port_forwarding_table(use_cache=False).plan_sync(desired)
+        if not remove_missing:
+            remove = []
+        self.__debug(f"Syncing Port Forwarding: {len(add)} to add, {len(update)} to update, {len(remove)} to remove")
+        if not (add or update or remove):
+            return True
+
+        # Removing first frees names and ports the added rules may use
+        batches = [('remove', [{'id': rule['id']} for rule in remove]), ('update', update), ('add', add)]
+
+        def send():
+            accepted = True
+            for action, rules in batches:
+                if rules:
+                    params = {'func': 'config.inbound.service', 'action': action, 'list': rules}
+                    result = self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
+                    accepted = self.__check_peplink_response(result) and accepted
+            self.__config_cache.pop('config.inbound.service', None)
+            return accepted
+
+        return self.__submit('sync_port_forwarding', send)
+
     def update_admin_settings(self, admin_settings):
         """ Update the Admin Settings under: System > Admin Security
 
@@ -244,12 +707,14 @@ class PepPy:
         """
 
         self.__debug("Updating Admin Settings")
-        non_urlencode_params = urllib.parse.urlencode(admin_settings.params, safe='+')
         params = admin_settings.params
 
-        result = self.__send_correct_request(self.__OVERALL_ENDPOINT, data=non_urlencode_params)
-        self.__port = params['accessProtocol_https_port']
-        return self.__check_peplink_response(result)
+        def send():
+            result = self.__send_template(self.__OVERALL_ENDPOINT, admin_settings)
+            self.__port = params['accessProtocol_https_port']
+            return self.__check_peplink_response(result)
+
+        return self.__submit('update_admin_settings', send, Transaction.MOVES_PORT, template=admin_settings)
     
     def update_time_settings(self, time_settings):
         """ Update Time Settings under: System > Time
@@ -262,10 +727,12 @@ class PepPy:
         """
 
         self.__debug("Updating Time Settings")
-        params = time_settings.params
 
-        result = self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
-        return self.__check_peplink_response(result)
+        def send():
+            result = self.__send_template(self.__OVERALL_ENDPOINT, time_settings)
+            return self.__check_peplink_response(result)
+
+        return self.__submit('update_time_settings', send, template=time_settings)
     
     def change_ap_password(self, new_password):
         """ Change the main Wi-Fi password
@@ -283,8 +750,11 @@ class PepPy:
             'func': 'cmd.ap.password'
         }
 
-        result = self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
-        return self.__check_peplink_response(result)
+        def send():
+            result = self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params)
+            return self.__check_peplink_response(result)
+
+        return self.__submit('change_ap_password', send)
     
     def update_email_notifications(self, email_settings):
         """ Update Email Notifications under: System > Email Notification
@@ -297,25 +767,43 @@ class PepPy:
         """
 
         self.__debug("Updating Email Settings")
-        params = email_settings.params
 
-        result = self.__send_correct_request(self.__OVERALL_ENDPOINT, json=params, clean=False)
-        return self.__check_peplink_response(result)
+        def send():
+            result = self.__send_template(self.__OVERALL_ENDPOINT, email_settings)
+            return self.__check_peplink_response(result)
 
-    def update_firmware(self, firmware_file_location):
-        """ Update firmware to specified firmware file
+        return self.__submit('update_email_notifications', send, template=email_settings)
+
+    def update_firmware(self, firmware_file_location, progress=None, bandwidth_limit=None, use_mmap=False):
+        """ Update firmware to specified firmware file. The file is streamed instead of loaded into memory
 
         Args:
-            firmware_file_location (str): File path to firmware file. Must be accessible by the running machine
+            firmware_file_location (str or firmware.FirmwareImage): File path to firmware file. Must be accessible by the running machine.
+                Share one FirmwareImage between routers so its SHA-256 is only computed once
+            progress (callable, optional): Called with (bytes_sent, total_bytes) while uploading. Defaults to None.
+            bandwidth_limit (int or firmware.BandwidthLimiter, optional): Maximum upload rate in bytes per second.
+                Share one BandwidthLimiter between routers to cap them together. Defaults to None.
+            use_mmap (bool, optional): Memory map the file when a path is given. Defaults to False.
+
+        Raises:
+            exceptions.FirmwareChecksumError: The file changed while it was being uploaded
 
         Returns:
             bool: True if the Peplink accepted the API Call
         """
 
         self.__debug("Updating Firmware")
-        params = {'upfile': open(firmware_file_location, 'rb')}
-
-        result = self.__send_correct_request(self.__FIRMWARE_ENDPOINT, files=params)
+        if isinstance(firmware_file_location, FirmwareImage):
+            image = firmware_file_location
+        else:
+            image = FirmwareImage(firmware_file_location, use_mmap=use_mmap)
+        if isinstance(bandwidth_limit, (int, float)):
+            bandwidth_limit = BandwidthLimiter(bandwidth_limit)
+
+        with MultipartEncoder(image, progress=progress, limiter=bandwidth_limit) as body:
+            result = self.__send_correct_request(self.__FIRMWARE_ENDPOINT, clean=False, data=body,
+                                                 headers={'Content-Type': body.content_type})
+        self.__device_info = None
         return self.__check_peplink_response(result)
     
     def update_cellular(self, cellular_settings):
@@ -329,10 +817,12 @@ class PepPy:
         """
 
         self.__debug("Updating Cellular")
-        params = cellular_settings.params
 
-        result = self.__send_correct_request(self.__OVERALL_ENDPOINT, clean=False, json=params)
-        return self.__check_peplink_response(result)
+        def send():
+            result = self.__send_template(self.__OVERALL_ENDPOINT, cellular_settings)
+            return self.__check_peplink_response(result)
+
+        return self.__submit('update_cellular', send, template=cellular_settings)
 
     def get_ap_profile(self):
         """ Get Wifi Profile settings
@@ -354,7 +844,42 @@ class PepPy:
 
         params = {'func': 'status.system.info'}
 
-        return self._parse_response(self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True))
+        results = self._parse_response(self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True))
+        if results is not None:
+            self.__device_info = DeviceInfo(results)
+        return results
+
+    def refresh(self):
+        """ Fetch device information again and replace every cached field
+
+        Returns:
+            status.DeviceInfo: New snapshot of the device information, None if the request failed
+        """
+
+        self.__device_info = None
+        self.get_device_info()
+        return self.__device_info
+
+    def get_device_snapshot(self, max_age=None):
+        """ Get every device information field from one status.system.info request
+
+        Args:
+            max_age (float, optional): Fetch again if the cached snapshot is older than this. Defaults to reusing any cached snapshot.
+
+        Returns:
+            status.DeviceInfo: Snapshot of the device information, None if the request failed
+        """
+
+        if self.__device_info is None or (max_age is not None and self.__device_info.age > max_age):
+            return self.refresh()
+        return self.__device_info
+
+    def __get_device_field(self, field):
+        if self.__device_info is None or not self.__device_info.is_fresh(field, self.__device_info_ttl):
+            self.refresh()
+        if self.__device_info is None: # The router could not be read
+            return None
+        return getattr(self.__device_info, field)
 
     def _parse_response(self, response):
         try:
@@ -369,8 +894,7 @@ class PepPy:
             str: Device MAC address
         """
 
-        results = self.get_device_info()
-        return results['macInfo'][0]['mac']
+        return self.__get_device_field('mac_address')
     
     def get_model(self):
         """ Get device model information
@@ -379,8 +903,7 @@ class PepPy:
             str: Device's model information
         """
 
-        results = self.get_device_info()
-        return results['device']['model']
+        return self.__get_device_field('model')
     
     def get_serial_number(self):
         """ Get device serial number
@@ -389,8 +912,7 @@ class PepPy:
             str: Device serial number
         """
 
-        results = self.get_device_info()
-        return results['device']['serialNumber']
+        return self.__get_device_field('serial_number')
     
     def get_firmware_version(self):
         """ Get firmware version on the device
@@ -399,8 +921,7 @@ class PepPy:
             str: Device firmware version
         """
 
-        results = self.get_device_info()
-        return results['device']['firmwareVersion']
+        return self.__get_device_field('firmware_version')
     
     def get_uptime(self):
         """ Get device uptime
@@ -409,8 +930,7 @@ class PepPy:
             str: Device uptime
         """
 
-        results = self.get_device_info()
-        return results['uptime']['string']
+        return self.__get_device_field('uptime')
     
     def get_device_name(self):
         """ Get device name
@@ -419,8 +939,7 @@ class PepPy:
             str: Device name
         """
 
-        results = self.get_device_info()
-        return results['device']['name']
+        return self.__get_device_field('device_name')
 
     def get_device_model(self):
         """ Get device model
@@ -428,9 +947,8 @@ class PepPy:
         Returns:
             str: Device model
         """
-        
-        results = self.get_device_info()
-        return results['device']['productCode']
+
+        return self.__get_device_field('device_model')
     
     def get_timezone(self):
         """ Get timezone
@@ -438,9 +956,8 @@ class PepPy:
         Returns:
             str: timezone
         """
-        
-        results = self.get_device_info()
-        return results['systemTime']['timezone']
+
+        return self.__get_device_field('timezone')
 
     def get_cpu_load(self):
         """ Get CPU load of the device
@@ -449,8 +966,7 @@ class PepPy:
             str: Device CPU load
         """
 
-        results = self.get_device_info()
-        return results['cpuLoad']['string']
+        return self.__get_device_field('cpu_load')
     
     def get_wan_connection_info(self):
         """ Get WAN connection info of the device
@@ -460,7 +976,25 @@ class PepPy:
         """
 
         params = {'func': 'status.wan.connection'}
-        return self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True).json()['response']
+        results = self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True).json()['response']
+        self.__wan_status = WanStatus(results)
+        return results
+
+    def get_wan_status(self, max_age=None):
+        """ Get every WAN connection from one status.wan.connection request
+
+        Args:
+            max_age (float, optional): Fetch again if the cached status is older than this. Defaults to wan_status_ttl.
+
+        Returns:
+            status.WanStatus: Snapshot of the WAN connections
+        """
+
+        if max_age is None:
+            max_age = self.__wan_status_ttl
+        if self.__wan_status is None or self.__wan_status.age >= max_age:
+            self.get_wan_connection_info()
+        return self.__wan_status
     
     def get_imei(self):
         """ Get IMEI of device
@@ -469,8 +1003,7 @@ class PepPy:
             str: Device IMEI
         """
 
-        results = self.get_wan_connection_info()
-        return results['2']['cellular']['imei']
+        return self.get_wan_status().imei
 
     def get_main_apn(self):
         """ Get APN for SIM slot 1
@@ -479,8 +1012,7 @@ class PepPy:
             str: SIM slot 1 apn
         """
         
-        results = self.get_wan_connection_info()
-        return results['2']['cellular']['sim']['1']['apn']
+        return self.get_wan_status().main_apn
     
     def get_secondary_apn(self):
         """Get APN for SIM slot 2
@@ -489,26 +1021,37 @@ class PepPy:
             str: SIM slot 2 apn
         """
         
-        results = self.get_wan_connection_info()
-        try:
-            return results['2']['cellular']['sim']['2']['apn']
-        except KeyError:
-            return None
+        return self.get_wan_status().secondary_apn
     
     def get_port_forwarding(self):
-        
+        """ Get every port forwarding rule
+
+        Returns:
+            dict: Port forwarding rules keyed by their id
+        """
+
         params = {'func': 'config.inbound.service'}
         results = self.__send_correct_request(self.__OVERALL_ENDPOINT, params=params, get=True).json()['response']
-        response_results = {}
-        
-        for i in results.keys():
-            try:
-                if type(int(i)) == type(1):
-                    print(i)
-                    response_results[i] = results[i]
-            except:
-                pass
-        return response_results
+        return {key: value for key, value in results.items() if key.isdigit()}
+
+    def get_port_forwarding_table(self, use_cache=True):
+        """ Get every port forwarding rule, indexed by name, external port and server IP
+
+        Args:
+            use_cache (bool, optional): Reuse the rules if they were already read in this session. Defaults to True.
+
+        Raises:
+            exceptions.RequestRejectedError: The rules could not be read
+
+        Returns:
+            port_forwarding.RuleTable: The rules of the router
+        """
+
+        response = self.get_config('config.inbound.service', use_cache=use_cache)
+        if response is None:
+            # An empty table would make a sync add every rule again
+            raise RequestRejectedError(f"Could not read the port forwarding rules of {self.__ip}:{self.__port}")
+        return RuleTable.from_response(response)
 
     def change_ap_ssid(self, new_ssid):
 
@@ -518,5 +1061,8 @@ class PepPy:
             'ssid': new_ssid,
             'enable': 'yes'
         }
-        return self.__send_correct_request(self.__ADMIN_ENDPOINT, data=params)
+        result = self.__send_correct_request(self.__ADMIN_ENDPOINT, data=params)
+        if self.__check_peplink_response(result):
+            self.__unapplied_changes = True
+        return result
         
\ No newline at end of file
@@ -0,0 +1,335 @@
+import collections
+import concurrent.futures
+import heapq
+import json
+import random
+import threading
+import time
+
+from .exceptions import RequestRejectedError
+from .status import WanStatus
+
+class Sample:
+
+    def __init__(self, router, metric, value, timestamp):
+        """ One measurement of one router
+
+        Args:
+            router (str): ip:port of the router
+            metric (str): Name of the metric, e.g. 'cpu_load' or 'wan.2.signal_level'
+            value (float): The measured value
+            timestamp (float): Unix time of the measurement
+        """
+
+        self.router = router
+        self.metric = metric
+        self.value = value
+        self.timestamp = timestamp
+
+    def as_dict(self):
+        return {'router': self.router, 'metric': self.metric, 'value': self.value, 'timestamp': self.timestamp}
+
+    def __repr__(self):
+        return f"Sample({self.router}, {self.metric}={self.value})"
+
+class RingBuffer:
+
+    def __init__(self, capacity):
+        """ Keeps the last capacity items, the oldest ones are dropped
+
+        Args:
+            capacity (int): Maximum number of items
+        """
+
+        self.capacity = capacity
+        self.__items = collections.deque(maxlen=capacity)
+        self.__lock = threading.Lock()
+
+    def append(self, item):
+        with self.__lock:
+            self.__items.append(item)
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __iter__(self):
+        with self.__lock:
+            return iter(list(self.__items))
+
+    @property
+    def latest(self):
+        with self.__lock:
+            return self.__items[-1] if self.__items else None
+
+class Sink:
+    """ Base class of the objects passed to Poller(sinks=[...]). A plain callable taking the samples works too """
+
+    def write(self, samples):
+        """ Called after every poll of a router
+
+        Args:
+            samples (list): Sample objects of the poll
+        """
+
+    def close(self):
+        """ Called when the poller stops """
+
+class JsonLinesSink(Sink):
+
+    def __init__(self, path):
+        """ Appends every sample to a file as one JSON object per line
+
+        Args:
+            path (str): File to append to
+        """
+
+        self.path = path
+        self.__file = open(path, 'a')
+        self.__lock = threading.Lock()
+
+    def write(self, samples):
+        with self.__lock:
+            self.__file.writelines(json.dumps(sample.as_dict()) + '\n' for sample in samples)
+            self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+def _number(value):
+    # Firmware reports numbers as 12 or as "12%"
+    try:
+        return float(str(value).rstrip('%').strip())
+    except ValueError:
+        return None
+
+class _RouterState:
+
+    def __init__(self, device, interval):
+        self.device = device
+        self.interval = interval
+        self.client = None
+        self.wans = None
+        self.cpu_load = None
+        self.uptime = None
+
+class Poller:
+
+    def __init__(self, fleet, interval=60, min_interval=15, max_interval=600, backoff=2, jitter=0.1, cpu_change=10,
+                 buffer_size=1440, sinks=None, debug=False):
+        """ Samples CPU load, uptime and WAN health of many routers on an adaptive schedule
+
+        Every router keeps one logged in client for the life of the poller. A router whose samples did not
+        change is polled less often, up to max_interval. One that changed, a WAN went up or down, the signal
+        level or CPU load moved or the router rebooted, goes back to min_interval. Every interval is jittered
+        and the first polls are spread over min_interval, so the fleet is never polled all at once.
+
+        Args:
+            fleet (fleet.Fleet): Routers to poll, its max_workers bounds the polls running at once
+            interval (float, optional): Seconds between the first polls of a router. Defaults to 60.
+            min_interval (float, optional): Shortest interval, used after a change. Defaults to 15.
+            max_interval (float, optional): Longest interval of a stable or unreachable router. Defaults to 600.
+            backoff (float, optional): Interval multiplier after every poll without a change. Defaults to 2.
+            jitter (float, optional): Fraction of every interval that is randomized. Defaults to 0.1.
+            cpu_change (float, optional): CPU load percentage points that count as a change. Defaults to 10.
+            buffer_size (int, optional): Samples kept in memory per router and metric. Defaults to 1440.
+            sinks (list, optional): Sink objects or callables given the samples of every poll. Defaults to None.
+            debug (bool, optional): If True, it will display debugging messages. Defaults to False.
+        """
+
+        self.fleet = fleet
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.cpu_change = cpu_change
+        self.buffer_size = buffer_size
+        self.sinks = list(sinks or [])
+        self.__DEBUG = debug
+        self.__buffers = dict()
+        self.__buffers_lock = threading.Lock()
+        self.__states = {device.key: _RouterState(device, interval) for device in fleet.devices}
+        now = time.monotonic()
+        self.__schedule = [(now + random.uniform(0, min_interval), key) for key in self.__states]
+        heapq.heapify(self.__schedule)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=fleet.max_workers)
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def __debug(self, message):
+        if self.__DEBUG:
+            print(message)
+
+    def current_interval(self, router):
+        """ Seconds until the next poll of a router, before jitter
+
+        Args:
+            router (str): ip:port of the router
+
+        Returns:
+            float: The interval
+        """
+
+        return self.__states[router].interval
+
+    def series(self, router, metric):
+        """ Samples of one metric still kept in memory
+
+        Args:
+            router (str): ip:port of the router
+            metric (str): Name of the metric
+
+        Returns:
+            list: (timestamp, value) tuples, the oldest first
+        """
+
+        buffer = self.__buffers.get((router, metric))
+        return list(buffer) if buffer is not None else []
+
+    def __record(self, sample):
+        key = (sample.router, sample.metric)
+        buffer = self.__buffers.get(key)
+        if buffer is None:
+            with self.__buffers_lock:
+                buffer = self.__buffers.setdefault(key, RingBuffer(self.buffer_size))
+        buffer.append((sample.timestamp, sample.value))
+
+    def __client(self, state):
+        if state.client is None:
+            pep = self.fleet.client(state.device)
+            if self.fleet.login and not pep.login():
+                pep.close() # Not kept, the next poll logs in again
+                raise RequestRejectedError(f"Login to {state.device.key} as {state.device.username} failed")
+            state.client = pep
+        return state.client
+
+    def poll(self, router):
+        """ Poll one router now and adapt its interval
+
+        Args:
+            router (str): ip:port of the router
+
+        Returns:
+            list: Sample objects of the poll
+        """
+
+        state = self.__states[router]
+        now = time.time()
+        try:
+            pep = self.__client(state)
+            info = pep.refresh()
+            wan_status = WanStatus(pep.get_wan_connection_info())
+        except Exception as e:
+            self.__debug(f"Polling {router} failed: {e}")
+            state.interval = min(state.interval * self.backoff, self.max_interval)
+            samples = [Sample(router, 'reachable', 0, now)]
+        else:
+            samples = self.__samples(router, info.raw if info is not None else dict(), wan_status, now)
+            changed = self.__changed(state, samples)
+            if changed:
+                state.interval = self.min_interval
+            else:
+                state.interval = min(state.interval * self.backoff, self.max_interval)
+
+        for sample in samples:
+            self.__record(sample)
+        for sink in self.sinks:
+            if callable(sink):
+                sink(samples)
+            else:
+                sink.write(samples)
+        return samples
+
+    def __samples(self, router, info, wan_status, now):
+        samples = [Sample(router, 'reachable', 1, now)]
+        cpu_load = info.get('cpuLoad', {})
+        cpu_load = _number(cpu_load.get('percentage', cpu_load.get('string')))
+        if cpu_load is not None:
+            samples.append(Sample(router, 'cpu_load', cpu_load, now))
+        uptime = info.get('uptime', {}).get('second')
+        if uptime is not None:
+            samples.append(Sample(router, 'uptime', uptime, now))
+        for wan in wan_status:
+            samples.append(Sample(router, f"wan.{wan.id}.up", int(wan.raw.get('message') == 'Connected'), now))
+            if wan.is_cellular and wan.cellular.get('signalLevel') is not None:
+                samples.append(Sample(router, f"wan.{wan.id}.signal_level", wan.cellular['signalLevel'], now))
+        return samples
+
+    def __changed(self, state, samples):
+        values = {sample.metric: sample.value for sample in samples}
+        wans = {metric: value for metric, value in values.items() if metric.startswith('wan.')}
+        cpu_load, uptime = values.get('cpu_load'), values.get('uptime')
+
+        changed = state.wans is not None and (
+            wans != state.wans
+            or (cpu_load is not None and state.cpu_load is not None and abs(cpu_load - state.cpu_load) >= self.cpu_change)
+            or (uptime is not None and state.uptime is not None and uptime < state.uptime) # Rebooted
+        )
+        state.wans, state.cpu_load, state.uptime = wans, cpu_load, uptime
+        return changed
+
+    def __next_poll(self, router):
+        interval = self.__states[router].interval
+        return time.monotonic() + interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run_pending(self):
+        """ Poll every router that is due, in parallel
+
+        Returns:
+            int: Number of routers polled
+        """
+
+        now = time.monotonic()
+        due = list()
+        while self.__schedule and self.__schedule[0][0] <= now:
+            due.append(heapq.heappop(self.__schedule)[1])
+
+        futures = {self.__executor.submit(self.poll, router): router for router in due}
+        for future in concurrent.futures.as_completed(futures):
+            router = futures[future]
+            try:
+                future.result()
+            except Exception as e: # A sink failed, keep polling the router
+                self.__debug(f"Recording samples of {router} failed: {e}")
+            heapq.heappush(self.__schedule, (self.__next_poll(router), router))
+        return len(due)
+
+    def run(self, duration=None):
+        """ Poll until stop() is called or duration has passed
+
+        Args:
+            duration (float, optional): Seconds to run for. Defaults to running until stop().
+        """
+
+        deadline = None if duration is None else time.monotonic() + duration
+        while not self.__stopped.is_set():
+            self.run_pending()
+            wake_up = self.__schedule[0][0] if self.__schedule else time.monotonic() + self.min_interval
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    break
+                wake_up = min(wake_up, deadline)
+            self.__stopped.wait(max(wake_up - time.monotonic(), 0))
+
+    def start(self):
+        """ Poll from a background thread until stop() is called """
+
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.run, name="PepPy poller", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """ Stop polling and close every client and sink """
+
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.__executor.shutdown(wait=True)
+        for state in self.__states.values():
+            if state.client is not None:
+                state.client.close()
+                state.client = None
+        for sink in self.sinks:
+            if isinstance(sink, Sink):
+                sink.close()
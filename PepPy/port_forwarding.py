@@ -0,0 +1,199 @@
+from .exceptions import PortForwardingConflictError
+from .templates import PortForwarding, _matches
+
+def rule_ports(rule):
+    """ Every external port a rule forwards
+
+    Args:
+        rule (dict): One config.inbound.service rule
+
+    Returns:
+        list: Port numbers, empty for protocols without ports (ICMP, IP)
+    """
+
+    value = (rule.get('protocol') or {}).get('port')
+    ports = list()
+    if value is None:
+        return ports
+    for part in str(value).split(','):
+        first, _, last = part.strip().partition('-')
+        if first.isdigit():
+            ports.extend(range(int(first), int(last or first) + 1))
+    return ports
+
+def rule_protocol(rule):
+    return (rule.get('protocol') or {}).get('type')
+
+def rule_server(rule):
+    return (rule.get('inboundServer') or {}).get('ip')
+
+def _as_rule(rule):
+    if isinstance(rule, PortForwarding):
+        return rule.params['list'][0]
+    return rule
+
+class RuleTable:
+
+    def __init__(self, rules=()):
+        """ Port forwarding rules indexed by name, (protocol, external port) and server IP
+
+        Args:
+            rules (iterable, optional): Rule dicts as sent to or read from config.inbound.service, or
+                templates.PortForwarding objects. Defaults to no rules.
+
+        Raises:
+            exceptions.PortForwardingConflictError: Two rules share a name or an external port
+        """
+
+        self.__by_name = dict()
+        self.__by_port = dict()
+        self.__by_server = dict()
+        for rule in rules:
+            self.add(rule)
+
+    @classmethod
+    def from_response(cls, response):
+        """ Build a table from a config.inbound.service response
+
+        Args:
+            response (dict): The 'response' part of config.inbound.service, rules keyed by their id
+
+        Returns:
+            RuleTable: The table, rules keep the id they have on the router
+        """
+
+        table = cls()
+        for key, rule in (response or {}).items():
+            if key.isdigit() and isinstance(rule, dict):
+                table.add(dict(rule, id=rule.get('id', int(key))), check=False) # The router already holds these
+        return table
+
+    def __len__(self):
+        return len(self.__by_name)
+
+    def __iter__(self):
+        return iter(self.__by_name.values())
+
+    def __contains__(self, name):
+        return name in self.__by_name
+
+    def get(self, name):
+        """ Get a rule by name
+
+        Returns:
+            dict: The rule, None if there is no rule with this name
+        """
+
+        return self.__by_name.get(name)
+
+    def find_port(self, protocol, port):
+        """ Get the rule forwarding an external port
+
+        Args:
+            protocol (str): TCP or UDP
+            port (int): External port
+
+        Returns:
+            dict: The rule, None if the port is not forwarded
+        """
+
+        return self.__by_port.get((protocol, int(port)))
+
+    def for_server(self, server_ip_address):
+        """ Get every rule forwarding to an internal IP Address
+
+        Returns:
+            list: The rules
+        """
+
+        return [self.__by_name[name] for name in self.__by_server.get(server_ip_address, ())]
+
+    def conflicts(self, rule):
+        """ Find the rules a new rule would clash with
+
+        Args:
+            rule (dict or templates.PortForwarding): The new rule
+
+        Returns:
+            list: Rules with the same name or forwarding one of the same external ports
+        """
+
+        rule = _as_rule(rule)
+        found = list()
+        if rule.get('name') in self.__by_name:
+            found.append(self.__by_name[rule['name']])
+        protocol = rule_protocol(rule)
+        for port in rule_ports(rule):
+            existing = self.__by_port.get((protocol, port))
+            if existing is not None and all(existing is not other for other in found):
+                found.append(existing)
+        return found
+
+    def add(self, rule, check=True):
+        """ Add a rule to the table
+
+        Args:
+            rule (dict or templates.PortForwarding): The rule
+            check (bool, optional): Raise instead of adding a conflicting rule. Defaults to True.
+
+        Raises:
+            exceptions.PortForwardingConflictError: The rule shares a name or an external port with another rule
+        """
+
+        rule = _as_rule(rule)
+        if check:
+            conflicts = self.conflicts(rule)
+            if conflicts:
+                names = ', '.join(repr(other.get('name')) for other in conflicts)
+                raise PortForwardingConflictError(f"Port forwarding rule {rule.get('name')!r} conflicts with {names}")
+
+        self.__by_name[rule.get('name')] = rule
+        protocol = rule_protocol(rule)
+        for port in rule_ports(rule):
+            self.__by_port[(protocol, port)] = rule
+        self.__by_server.setdefault(rule_server(rule), dict())[rule.get('name')] = None
+
+    def remove(self, name):
+        """ Remove a rule from the table
+
+        Args:
+            name (str): Name of the rule
+
+        Returns:
+            dict: The removed rule
+        """
+
+        rule = self.__by_name.pop(name)
+        protocol = rule_protocol(rule)
+        for port in rule_ports(rule):
+            if self.__by_port.get((protocol, port)) is rule:
+                del self.__by_port[(protocol, port)]
+        self.__by_server.get(rule_server(rule), dict()).pop(name, None)
+        return rule
+
+    def plan_sync(self, desired):
+        """ Work out what turns the rules of this table into the desired ones, rules are matched by name
+
+        Args:
+            desired (RuleTable): The rules the router should end up with
+
+        Returns:
+            tuple: (rules to add, rules to update with the id they have here, rules to remove)
+        """
+
+        add, update = list(), list()
+        for rule in desired:
+            current = self.get(rule.get('name'))
+            if current is None:
+                add.append(rule)
+            elif not _matches(_comparable(rule), current):
+                update.append(dict(rule, id=current['id']))
+        remove = [rule for rule in self if rule.get('name') not in desired]
+        return add, update, remove
+
+def _comparable(rule):
+    # The id and the action inside of inboundServer are only part of the request
+    rule = {key: value for key, value in rule.items() if key != 'id'}
+    if isinstance(rule.get('inboundServer'), dict):
+        rule['inboundServer'] = {key: value for key, value in rule['inboundServer'].items() if key != 'action'}
+    return rule
@@ -0,0 +1,308 @@
+import contextlib
+import random
+import threading
+import time
+
+from .exceptions import RouterBusyError
+
+class RetryPolicy:
+
+    def __init__(self, attempts=3, backoff=0.2, max_backoff=5, jitter=0.5, retry_on_status=(502, 503, 504)):
+        """ How PepPy retries requests that did not reach the router
+
+        Args:
+            attempts (int, optional): Total number of attempts, 1 disables retrying. Defaults to 3.
+            backoff (float, optional): Seconds to wait before the first retry, doubled on every retry. Defaults to 0.2.
+            max_backoff (float, optional): Longest wait between two attempts. Defaults to 5.
+            jitter (float, optional): Fraction of every wait that is randomized, between 0 and 1. Defaults to 0.5.
+            retry_on_status (tuple, optional): HTTP status codes that are retried. Defaults to (502, 503, 504).
+        """
+
+        if attempts < 1:
+            raise ValueError("attempts has to be at least 1")
+
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_on_status = tuple(retry_on_status)
+
+    def delay(self, attempt):
+        """ Seconds to wait after a failed attempt
+
+        Args:
+            attempt (int): Number of the attempt that failed, starting at 1
+
+        Returns:
+            float: Exponential backoff with jitter
+        """
+
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return delay * (1 - self.jitter * random.random())
+
+    def should_retry_status(self, status_code):
+        return status_code in self.retry_on_status
+
+class CircuitBreaker:
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    # Breakers shared by every PepPy instance, keyed by ip:port
+    __shared = dict()
+    __shared_lock = threading.Lock()
+
+    def __init__(self, failure_threshold=5, cooldown=30):
+        """ Stops sending requests to a router after consecutive failures
+
+        After failure_threshold failed requests in a row the breaker opens and every request fails fast.
+        Once cooldown has passed a single probe request is let through (half-open). It closes the
+        breaker if it succeeds and opens it again if it fails.
+
+        Args:
+            failure_threshold (int, optional): Consecutive failures that open the breaker. Defaults to 5.
+            cooldown (float, optional): Seconds to fail fast before letting a probe through. Defaults to 30.
+        """
+
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.__state = CircuitBreaker.CLOSED
+        self.__opened_at = 0.0
+        self.__probing = False
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def for_router(cls, key, failure_threshold=5, cooldown=30):
+        """ Get the breaker shared by every client of a router
+
+        Args:
+            key (str): ip:port of the router
+            failure_threshold (int, optional): Used if the breaker does not exist yet. Defaults to 5.
+            cooldown (float, optional): Used if the breaker does not exist yet. Defaults to 30.
+
+        Returns:
+            CircuitBreaker: The shared breaker
+        """
+
+        with cls.__shared_lock:
+            breaker = cls.__shared.get(key)
+            if breaker is None:
+                breaker = cls.__shared[key] = cls(failure_threshold, cooldown)
+            return breaker
+
+    @classmethod
+    def reset_all(cls):
+        """ Forget every shared breaker """
+
+        with cls.__shared_lock:
+            cls.__shared.clear()
+
+    @property
+    def state(self):
+        with self.__lock:
+            if self.__state == CircuitBreaker.OPEN and time.monotonic() - self.__opened_at >= self.cooldown:
+                return CircuitBreaker.HALF_OPEN
+            return self.__state
+
+    def allow(self):
+        """ Check if a request can be sent. In half-open state only one caller gets True
+
+        Returns:
+            bool: True if the request should be sent
+        """
+
+        with self.__lock:
+            if self.__state == CircuitBreaker.CLOSED:
+                return True
+            if self.__state == CircuitBreaker.OPEN and time.monotonic() - self.__opened_at >= self.cooldown:
+                self.__state = CircuitBreaker.HALF_OPEN
+            if self.__state == CircuitBreaker.HALF_OPEN and not self.__probing:
+                self.__probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.__lock:
+            self.failures = 0
+            self.__probing = False
+            self.__state = CircuitBreaker.CLOSED
+
+    def release(self):
+        """ Forget a request that says nothing about the router, e.g. it failed before being sent """
+
+        with self.__lock:
+            self.__probing = False
+
+    def record_failure(self):
+        with self.__lock:
+            self.failures += 1
+            self.__probing = False
+            if self.__state == CircuitBreaker.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.__state = CircuitBreaker.OPEN
+                self.__opened_at = time.monotonic()
+
+    def retry_after(self):
+        """ Seconds until a probe request will be let through
+
+        Returns:
+            float: 0 if requests are allowed now
+        """
+
+        with self.__lock:
+            if self.__state != CircuitBreaker.OPEN:
+                return 0.0
+            return max(self.__opened_at + self.cooldown - time.monotonic(), 0.0)
+
+def _remaining(deadline):
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+class TokenBucket:
+
+    def __init__(self, rate, burst=None):
+        """ Lets rate requests per second through on average, with bursts of up to burst requests
+
+        Args:
+            rate (float): Tokens added per second
+            burst (int, optional): Most tokens the bucket holds. Defaults to rate, at least 1.
+        """
+
+        if rate <= 0:
+            raise ValueError("rate has to be positive")
+
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.__tokens = self.burst
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """ Take one token, waiting until there is one
+
+        Args:
+            timeout (float, optional): Longest wait in seconds. Defaults to waiting as long as needed.
+
+        Returns:
+            bool: False if no token became available within timeout
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__tokens + (now - self.__updated) * self.rate, self.burst)
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return True
+                wait = (1 - self.__tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+class RequestGovernor:
+
+    # Governors shared by every PepPy instance, keyed by ip:port
+    __shared = dict()
+    __shared_lock = threading.Lock()
+    # Requests in flight to all routers of the process, None for no limit
+    __global = None
+
+    def __init__(self, rate=None, burst=None, max_concurrent=None):
+        """ Limits how fast and how many requests at once are sent to one router
+
+        Args:
+            rate (float, optional): Requests per second, None for no limit. Defaults to None.
+            burst (int, optional): Requests that can be sent at once after a quiet period. Defaults to rate.
+            max_concurrent (int, optional): Requests in flight at once, None for no limit. Defaults to None.
+        """
+
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_concurrent = max_concurrent
+        self.__semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    @classmethod
+    def for_router(cls, key, rate=None, burst=None, max_concurrent=None):
+        """ Get the governor shared by every client of a router
+
+        Args:
+            key (str): ip:port of the router
+            rate (float, optional): Used if the governor does not exist yet. Defaults to None.
+            burst (int, optional): Used if the governor does not exist yet. Defaults to None.
+            max_concurrent (int, optional): Used if the governor does not exist yet. Defaults to None.
+
+        Returns:
+            RequestGovernor: The shared governor
+        """
+
+        with cls.__shared_lock:
+            governor = cls.__shared.get(key)
+            if governor is None:
+                governor = cls.__shared[key] = cls(rate, burst, max_concurrent)
+            return governor
+
+    @classmethod
+    def reset_all(cls):
+        """ Forget every shared governor and the global limit """
+
+        with cls.__shared_lock:
+            cls.__shared.clear()
+            RequestGovernor.__global = None
+
+    @classmethod
+    def set_global_limit(cls, max_concurrent):
+        """ Limit the requests in flight to all routers of the process together
+
+        Args:
+            max_concurrent (int): Requests in flight at once, None removes the limit
+        """
+
+        RequestGovernor.__global = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    @classmethod
+    @contextlib.contextmanager
+    def global_slot(cls, timeout=None):
+        """ Wait for a free place under the global limit only, for clients without a governor
+
+        Args:
+            timeout (float, optional): Longest wait in seconds. Defaults to waiting as long as needed.
+
+        Raises:
+            exceptions.RouterBusyError: No place became free within timeout
+        """
+
+        semaphore = RequestGovernor.__global
+        if semaphore is not None and not semaphore.acquire(timeout=timeout):
+            raise RouterBusyError(f"No request slot became free within {timeout}s")
+        try:
+            yield
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    @contextlib.contextmanager
+    def slot(self, timeout=None):
+        """ Wait until a request can be sent to the router, then hold its place while it is sent
+
+        The router's own limit is waited for first, so requests queued for a busy router do not hold
+        places under the global limit that other routers could use.
+
+        Args:
+            timeout (float, optional): Longest wait in seconds for all limits together. Defaults to waiting as long as needed.
+
+        Raises:
+            exceptions.RouterBusyError: The request could not be sent within timeout
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.__semaphore is not None and not self.__semaphore.acquire(timeout=_remaining(deadline)):
+            raise RouterBusyError(f"{self.max_concurrent} requests to the router are already in flight after waiting {timeout}s")
+        try:
+            if self.bucket is not None and not self.bucket.acquire(timeout=_remaining(deadline)):
+                raise RouterBusyError(f"The rate limit of {self.bucket.rate}/s was not free within {timeout}s")
+            with RequestGovernor.global_slot(_remaining(deadline)):
+                yield
+        finally:
+            if self.__semaphore is not None:
+                self.__semaphore.release()
@@ -0,0 +1,154 @@
+import math
+import threading
+import time
+
+from .exceptions import PepPyError, RolloutHaltedError, RouterNotReadyError
+from .firmware import BandwidthLimiter, FirmwareImage
+
+class Rollout:
+
+    def __init__(self, fleet, firmware_file_location, target_version, canary=1, waves=(10, 50, 100), max_in_flight=10,
+                 max_failure_rate=0.1, upload_timeout=600, ready_timeout=900, poll_interval=5, bandwidth_limit=None, debug=False):
+        """ Upgrades the firmware of a fleet in waves and stops when too many routers fail
+
+        The canary routers are upgraded first and any failure among them halts the rollout. The rest of the
+        fleet follows in waves that end at a cumulative percentage of the fleet.
+
+        Args:
+            fleet (fleet.Fleet): Routers to upgrade
+            firmware_file_location (str or firmware.FirmwareImage): File path to firmware file
+            target_version (str): Firmware version the routers report once upgraded
+            canary (int, optional): Number of routers upgraded first. Defaults to 1.
+            waves (tuple, optional): Cumulative percentages of the fleet upgraded by the end of each wave. Defaults to (10, 50, 100).
+            max_in_flight (int, optional): Maximum number of routers upgrading at once. Defaults to 10.
+            max_failure_rate (float, optional): Halt once more than this fraction of the routers upgraded by the end of
+                a wave failed. Defaults to 0.1.
+            upload_timeout (float, optional): Timeout of the firmware upload request. Defaults to 600.
+            ready_timeout (float, optional): Seconds to wait for a router to come back with the new version. Defaults to 900.
+            poll_interval (float, optional): Seconds before the first version check after the upload, doubled up to 30. Defaults to 5.
+            bandwidth_limit (int, optional): Maximum total upload rate in bytes per second. Defaults to None.
+            debug (bool, optional): If True, it will display debugging messages. Defaults to False.
+        """
+
+        self.fleet = fleet
+        if isinstance(firmware_file_location, FirmwareImage):
+            self.image = firmware_file_location
+        else:
+            self.image = FirmwareImage(firmware_file_location)
+        self.target_version = target_version
+        self.canary = canary
+        self.waves = waves
+        self.max_in_flight = max_in_flight
+        self.max_failure_rate = max_failure_rate
+        self.upload_timeout = upload_timeout
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+        self.limiter = BandwidthLimiter(bandwidth_limit) if bandwidth_limit else None
+        self.results = list()
+        self.halted = False
+        self.__DEBUG = debug
+
+    def __debug(self, message):
+        if self.__DEBUG:
+            print(message)
+
+    def plan(self):
+        """ Split the fleet into waves
+
+        Returns:
+            list: One list of fleet.Device per wave, the canary wave first
+        """
+
+        devices = list(self.fleet.devices)
+        waves = [devices[:self.canary]]
+        done = len(waves[0])
+        for percentage in self.waves:
+            end = max(math.ceil(len(devices) * percentage / 100), done)
+            waves.append(devices[done:end])
+            done = end
+        waves.append(devices[done:]) # Whatever the percentages did not cover
+        return [wave for wave in waves if wave]
+
+    @property
+    def failure_rate(self):
+        if not self.results:
+            return 0.0
+        return sum(not result.ok for result in self.results) / len(self.results)
+
+    def upgrade(self, pep):
+        """ Upgrade one router and wait until it reports the target version
+
+        Args:
+            pep (peppy.PepPy): Logged in client of the router
+
+        Raises:
+            exceptions.RouterNotReadyError: The router did not come back with the target version in time
+
+        Returns:
+            str: The firmware version the router reports
+        """
+
+        if pep.get_device_snapshot(max_age=0).firmware_version == self.target_version:
+            return self.target_version
+
+        request_timeout = pep.timeout
+        pep.timeout = self.upload_timeout
+        try:
+            if not pep.update_firmware(self.image, bandwidth_limit=self.limiter):
+                raise PepPyError(f"{pep.ip} did not accept the firmware")
+        finally:
+            pep.timeout = request_timeout
+
+        return self.__wait_for_version(pep)
+
+    def __wait_for_version(self, pep, max_poll_interval=30):
+        # The router keeps answering with the old version until it reboots into the new one
+        deadline = time.monotonic() + self.ready_timeout
+        interval = self.poll_interval
+        version = None
+        with pep.expecting_reboot():
+            while time.monotonic() < deadline:
+                time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+                try:
+                    snapshot = pep.refresh()
+                    version = snapshot.firmware_version if snapshot else None
+                except (PepPyError, KeyError, ValueError):
+                    version = None
+                if version == self.target_version:
+                    return version
+                interval = min(interval * 2, max_poll_interval)
+        raise RouterNotReadyError(f"{pep.ip} reports firmware {version} instead of {self.target_version} after {self.ready_timeout}s")
+
+    def run(self):
+        """ Upgrade the fleet wave after wave
+
+        Raises:
+            exceptions.RolloutHaltedError: A canary failed or the failure rate went over max_failure_rate
+
+        Yields:
+            fleet.FleetResult: One result per router, in the order they finish
+        """
+
+        for number, wave in enumerate(self.plan()):
+            self.__debug(f"Starting wave {number} with {len(wave)} routers")
+            planned = len(self.results) + len(wave)
+            stop = threading.Event()
+            for result in self.fleet.subset(wave, max_workers=self.max_in_flight).run_stoppable(stop, self.upgrade):
+                self.results.append(result)
+                yield result
+                if not stop.is_set() and self.__should_halt(number == 0 and self.canary > 0, planned):
+                    # The routers already flashing are not interrupted, their results are still recorded
+                    self.__debug(f"Halting wave {number}, waiting for the routers in flight")
+                    self.halted = True
+                    stop.set()
+            if self.halted:
+                raise RolloutHaltedError(f"Halted in wave {number}: {self.failure_rate:.0%} of "
+                                         f"{len(self.results)} upgraded routers failed")
+
+    def __should_halt(self, canary, planned):
+        failures = sum(not result.ok for result in self.results)
+        if canary:
+            return failures > 0
+        # The rate is the one at the end of the wave, so an early failure halts only if the rest of the wave
+        # can not bring it back under max_failure_rate
+        return failures / planned > self.max_failure_rate
@@ -0,0 +1,109 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'peppy', 'sessions.db')
+
+class SessionStore:
+
+    def __init__(self, path=DEFAULT_PATH, ttl=1800, busy_timeout=10):
+        """ Keeps Peplink session cookies in an SQLite file shared by every thread and process
+
+        Pass the same store, or the same path, to every PepPy so short lived scripts and worker processes reuse
+        a session instead of logging in again. Sessions are keyed by ip:port:username. SQLite locks the file
+        for every write, so concurrent processes never see half written sessions.
+
+        Args:
+            path (str, optional): Database file, created with owner only permissions. Defaults to DEFAULT_PATH.
+            ttl (float, optional): Seconds a session without an expiry date is reused. Defaults to 1800.
+            busy_timeout (float, optional): Seconds to wait for another process holding the lock. Defaults to 10.
+        """
+
+        self.path = path
+        self.ttl = ttl
+        self.busy_timeout = busy_timeout
+        self.__local = threading.local()
+        self.__create()
+
+    def __create(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # The cookies are as good as the password, keep other users out
+        os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+        with self.__connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS sessions "
+                               "(key TEXT PRIMARY KEY, cookies TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def __connection(self):
+        # sqlite3 connections can not be shared between threads
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.__local.connection = connection
+        return connection
+
+    def get(self, key):
+        """ Get the cookies of a session that has not expired
+
+        Args:
+            key (str): ip:port:username of the session
+
+        Returns:
+            dict: Cookie names and values, None if there is no usable session
+        """
+
+        row = self.__connection().execute("SELECT cookies, expires FROM sessions WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, cookies, expires=None):
+        """ Save the cookies of a session, replacing the previous ones
+
+        Args:
+            key (str): ip:port:username of the session
+            cookies (dict): Cookie names and values
+            expires (float, optional): Unix time the session expires. Defaults to ttl seconds from now.
+        """
+
+        if expires is None:
+            expires = time.time() + self.ttl
+        with self.__connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO sessions (key, cookies, expires) VALUES (?, ?, ?)",
+                               (key, json.dumps(cookies, sort_keys=True), expires))
+
+    def discard(self, key, cookies=None):
+        """ Forget a session the router no longer accepts
+
+        Args:
+            key (str): ip:port:username of the session
+            cookies (dict, optional): Only forget the session if it still holds these cookies, so a
+                session another process just created is kept. Defaults to None.
+        """
+
+        with self.__connection() as connection:
+            if cookies is None:
+                connection.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            else:
+                connection.execute("DELETE FROM sessions WHERE key = ? AND cookies = ?", (key, json.dumps(cookies, sort_keys=True)))
+
+    def purge(self):
+        """ Delete every expired session
+
+        Returns:
+            int: Number of sessions deleted
+        """
+
+        with self.__connection() as connection:
+            return connection.execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),)).rowcount
+
+    def close(self):
+        """ Close the connection of the calling thread """
+
+        connection = getattr(self.__local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.__local.connection = None
@@ -0,0 +1,367 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+# The config.* sections the Peplink API can send back
+SECTIONS = ('config.notify', 'config.time', 'config.inbound.service', 'config.wan.connection', 'config.ap.profile')
+
+def _canonical(section):
+    # The same configuration always gives the same bytes, so the same hash
+    return json.dumps(section, sort_keys=True, separators=(',', ':')).encode()
+
+class Snapshot:
+
+    def __init__(self, router, id, taken, sections, written=0):
+        """ The configuration of one router at one point in time
+
+        Args:
+            router (str): ip:port of the router
+            id (str): Id of the snapshot, ids of a router sort by the time they were taken
+            taken (float): Unix time the snapshot was taken
+            sections (dict): SHA-256 of every section that could be read, keyed by its config.* function
+            written (int, optional): Sections that were new to the store when the snapshot was saved. Defaults to 0.
+        """
+
+        self.router = router
+        self.id = id
+        self.taken = taken
+        self.sections = sections
+        self.written = written
+
+    def as_dict(self):
+        return {'router': self.router, 'id': self.id, 'taken': self.taken, 'sections': self.sections}
+
+    def __repr__(self):
+        return f"Snapshot({self.router}, {self.id}, {len(self.sections)} sections)"
+
+class Change:
+
+    def __init__(self, section, path, old, new):
+        """ One value that differs between two configurations
+
+        Args:
+            section (str): config.* function of the section
+            path (tuple): Keys leading to the value inside of the section, empty for a whole section
+            old (any): Value before, None if it was added
+            new (any): Value after, None if it was removed
+        """
+
+        self.section = section
+        self.path = path
+        self.old = old
+        self.new = new
+
+    @property
+    def kind(self):
+        if self.old is None:
+            return 'added'
+        if self.new is None:
+            return 'removed'
+        return 'changed'
+
+    def __eq__(self, other):
+        return isinstance(other, Change) and (self.section, self.path, self.old, self.new) == \
+            (other.section, other.path, other.old, other.new)
+
+    def __repr__(self):
+        location = '.'.join((self.section,) + tuple(str(key) for key in self.path))
+        return f"Change({location}: {self.old!r} -> {self.new!r})"
+
+def _diff(section, path, old, new, changes):
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old) | set(new), key=str):
+            _diff(section, path + (key,), old.get(key), new.get(key), changes)
+    else:
+        changes.append(Change(section, path, old, new))
+
+def diff_sections(old, new):
+    """ Compare two configurations section by section
+
+    Args:
+        old (dict): Sections keyed by their config.* function
+        new (dict): Sections keyed by their config.* function
+
+    Returns:
+        list: Change objects, ordered by section and path
+    """
+
+    changes = list()
+    for section in sorted(set(old) | set(new)):
+        _diff(section, (), old.get(section), new.get(section), changes)
+    return changes
+
+class SnapshotStore:
+
+    def __init__(self, path, sections=SECTIONS, compression_level=6):
+        """ Keeps configuration snapshots of many routers in a directory
+
+        Every section is stored once, gzip compressed, under the SHA-256 of its content. A snapshot only lists
+        the hashes of its sections, so a nightly backup of a router whose configuration did not change writes
+        one small file and no section at all.
+
+        Args:
+            path (str): Directory of the store, created if it does not exist
+            sections (tuple, optional): config.* functions to read from every router. Defaults to SECTIONS.
+            compression_level (int, optional): gzip level of the stored sections. Defaults to 6.
+        """
+
+        self.path = path
+        self.sections = tuple(sections)
+        self.compression_level = compression_level
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(path, 'snapshots'), exist_ok=True)
+
+    def __object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest[2:] + '.json.gz')
+
+    def __router_path(self, router):
+        # ip:port is not a valid file name everywhere
+        return os.path.join(self.path, 'snapshots', router.replace(':', '_'))
+
+    def __write_atomic(self, path, data):
+        # Readers and other processes never see a half written file
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def __put_section(self, section):
+        data = _canonical(section)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.__object_path(digest)
+        if os.path.exists(path):
+            return digest, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__write_atomic(path, gzip.compress(data, compresslevel=self.compression_level, mtime=0))
+        return digest, True
+
+    def read_sections(self, pep):
+        """ Read every section of the store from a router
+
+        Args:
+            pep (peppy.PepPy): Logged in client of the router
+
+        Returns:
+            dict: Sections keyed by their config.* function, sections that could not be read are left out
+        """
+
+        sections = dict()
+        for func in self.sections:
+            section = pep.get_config(func, use_cache=False)
+            if section is not None:
+                sections[func] = section
+        return sections
+
+    def save(self, router, sections, taken=None):
+        """ Store a snapshot, only sections the store does not hold yet are written
+
+        Args:
+            router (str): ip:port of the router
+            sections (dict): Sections keyed by their config.* function, see read_sections
+            taken (float, optional): Unix time the sections were read. Defaults to now.
+
+        Returns:
+            Snapshot: The stored snapshot
+        """
+
+        taken = time.time() if taken is None else taken
+        digests, written = dict(), 0
+        for func, section in sections.items():
+            digests[func], new = self.__put_section(section)
+            written += new
+
+        directory = self.__router_path(router)
+        os.makedirs(directory, exist_ok=True)
+        id = time.strftime('%Y%m%dT%H%M%S', time.gmtime(taken)) + f"{int(taken % 1 * 1e6):06d}Z"
+        while os.path.exists(os.path.join(directory, id + '.json')):
+            id += '_' # Two snapshots in the same microsecond
+        snapshot = Snapshot(router, id, taken, digests, written)
+        self.__write_atomic(os.path.join(directory, id + '.json'), json.dumps(snapshot.as_dict(), indent=1).encode())
+        return snapshot
+
+    def take(self, pep, router):
+        """ Read a router and store a snapshot of it
+
+        Args:
+            pep (peppy.PepPy): Logged in client of the router
+            router (str): ip:port of the router
+
+        Returns:
+            Snapshot: The stored snapshot
+        """
+
+        return self.save(router, self.read_sections(pep))
+
+    def backup(self, fleet):
+        """ Snapshot every router of a fleet, the routers are read concurrently
+
+        Args:
+            fleet (fleet.Fleet): Routers to back up
+
+        Yields:
+            fleet.FleetResult: One result per router, in the order they finish, the value is the Snapshot
+        """
+
+        for result in fleet.run(self.read_sections):
+            if result.ok:
+                result.value = self.save(result.device.key, result.value)
+            yield result
+
+    def routers(self):
+        """ Routers with at least one snapshot
+
+        Returns:
+            list: ip:port of every router
+        """
+
+        directory = os.path.join(self.path, 'snapshots')
+        routers = list()
+        for name in sorted(os.listdir(directory)):
+            for snapshot_id in self.__ids(os.path.join(directory, name))[-1:]:
+                routers.append(self.load(name, snapshot_id).router)
+        return routers
+
+    def __ids(self, directory):
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json'))
+
+    def snapshots(self, router):
+        """ Ids of the snapshots of a router
+
+        Args:
+            router (str): ip:port of the router
+
+        Returns:
+            list: Snapshot ids, the oldest first
+        """
+
+        return self.__ids(self.__router_path(router))
+
+    def load(self, router, snapshot_id):
+        """ Load a snapshot
+
+        Args:
+            router (str): ip:port of the router
+            snapshot_id (str): Id of the snapshot
+
+        Raises:
+            KeyError: The router has no snapshot with this id
+
+        Returns:
+            Snapshot: The snapshot, its sections are read with sections()
+        """
+
+        try:
+            with open(os.path.join(self.__router_path(router), snapshot_id + '.json'), 'rb') as file:
+                raw = json.load(file)
+        except FileNotFoundError:
+            raise KeyError(f"{router} has no snapshot {snapshot_id}") from None
+        return Snapshot(raw['router'], raw['id'], raw['taken'], raw['sections'])
+
+    def latest(self, router):
+        """ Load the newest snapshot of a router
+
+        Returns:
+            Snapshot: The snapshot, None if the router has none
+        """
+
+        ids = self.snapshots(router)
+        return self.load(router, ids[-1]) if ids else None
+
+    def section(self, digest):
+        """ Read one stored section
+
+        Args:
+            digest (str): SHA-256 of the section, as listed in Snapshot.sections
+
+        Returns:
+            dict: The section
+        """
+
+        with open(self.__object_path(digest), 'rb') as file:
+            return json.loads(gzip.decompress(file.read()))
+
+    def restore_sections(self, snapshot):
+        """ Read every section of a snapshot
+
+        Args:
+            snapshot (Snapshot): The snapshot
+
+        Returns:
+            dict: Sections keyed by their config.* function
+        """
+
+        return {func: self.section(digest) for func, digest in snapshot.sections.items()}
+
+    def diff(self, old, new):
+        """ Compare two snapshots, sections with the same hash are skipped without being read
+
+        Args:
+            old (Snapshot): The earlier snapshot
+            new (Snapshot): The later snapshot
+
+        Returns:
+            list: Change objects
+        """
+
+        changed = [func for func in set(old.sections) | set(new.sections) if old.sections.get(func) != new.sections.get(func)]
+        return diff_sections({func: self.section(old.sections[func]) for func in changed if func in old.sections},
+                             {func: self.section(new.sections[func]) for func in changed if func in new.sections})
+
+    def diff_live(self, pep, router):
+        """ Compare the live configuration of a router with its newest snapshot
+
+        Args:
+            pep (peppy.PepPy): Logged in client of the router
+            router (str): ip:port of the router
+
+        Returns:
+            list: Change objects, every section is added if the router has no snapshot yet
+        """
+
+        live = self.read_sections(pep)
+        latest = self.latest(router)
+        if latest is None:
+            return diff_sections(dict(), live)
+        digests = {func: hashlib.sha256(_canonical(section)).hexdigest() for func, section in live.items()}
+        changed = [func for func in set(latest.sections) | set(digests) if latest.sections.get(func) != digests.get(func)]
+        return diff_sections({func: self.section(latest.sections[func]) for func in changed if func in latest.sections},
+                             {func: live[func] for func in changed if func in live})
+
+    def prune(self, keep):
+        """ Delete all but the newest snapshots of every router, then every section no snapshot uses anymore
+
+        Args:
+            keep (int): Snapshots to keep per router
+
+        Returns:
+            int: Number of sections deleted
+        """
+
+        directory = os.path.join(self.path, 'snapshots')
+        used = set()
+        for name in os.listdir(directory):
+            ids = self.__ids(os.path.join(directory, name))
+            for snapshot_id in ids[:max(len(ids) - keep, 0)]:
+                os.remove(os.path.join(directory, name, snapshot_id + '.json'))
+            for snapshot_id in ids[max(len(ids) - keep, 0):]:
+                used.update(self.load(name, snapshot_id).sections.values())
+
+        deleted = 0
+        objects = os.path.join(self.path, 'objects')
+        for prefix in os.listdir(objects):
+            for name in os.listdir(os.path.join(objects, prefix)):
+                if name.endswith('.json.gz') and prefix + name[:-len('.json.gz')] not in used:
+                    os.remove(os.path.join(objects, prefix, name))
+                    deleted += 1
+        return deleted
@@ -0,0 +1,194 @@
+import time
+
+class DeviceInfo:
+
+    # Field name: (path inside of status.system.info, True if the value changes while the router is running)
+    FIELDS = {
+        'mac_address': (('macInfo', 0, 'mac'), False),
+        'model': (('device', 'model'), False),
+        'serial_number': (('device', 'serialNumber'), False),
+        'firmware_version': (('device', 'firmwareVersion'), False),
+        'device_name': (('device', 'name'), False),
+        'device_model': (('device', 'productCode'), False),
+        'timezone': (('systemTime', 'timezone'), False),
+        'uptime': (('uptime', 'string'), True),
+        'cpu_load': (('cpuLoad', 'string'), True),
+    }
+
+    def __init__(self, response, fetched_at=None):
+        """ Snapshot of one status.system.info response
+
+        Args:
+            response (dict): The 'response' part of status.system.info
+            fetched_at (float, optional): time.monotonic() of the request. Defaults to now.
+        """
+
+        self.raw = response
+        self.fetched_at = time.monotonic() if fetched_at is None else fetched_at
+
+    def __getattr__(self, name):
+        try:
+            path, _ = DeviceInfo.FIELDS[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        value = self.raw
+        for key in path:
+            value = value[key]
+        return value
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    def is_fresh(self, field, ttl):
+        """ Check if a field of this snapshot can still be used
+
+        Args:
+            field (str): Name of the field in DeviceInfo.FIELDS
+            ttl (float): Seconds a volatile field stays fresh. Static fields stay fresh for the whole session
+
+        Returns:
+            bool: True if the field does not need to be fetched again
+        """
+
+        _, volatile = DeviceInfo.FIELDS[field]
+        return not volatile or self.age < ttl
+
+    def as_dict(self):
+        """ Every known field of the snapshot
+
+        Returns:
+            dict: Field name to value, None if the router did not report it
+        """
+
+        fields = dict()
+        for name in DeviceInfo.FIELDS:
+            try:
+                fields[name] = getattr(self, name)
+            except (KeyError, IndexError, TypeError):
+                fields[name] = None
+        return fields
+
+    def __repr__(self):
+        return f"DeviceInfo({self.as_dict()})"
+
+class WanConnection:
+
+    def __init__(self, wan_id, raw):
+        """ One WAN connection of a status.wan.connection response
+
+        Args:
+            wan_id (str): The id of the wan connection. Cellular is usually 2
+            raw (dict): The part of the response for this connection
+        """
+
+        self.id = str(wan_id)
+        self.raw = raw
+
+    @property
+    def name(self):
+        return self.raw.get('name')
+
+    @property
+    def cellular(self):
+        return self.raw.get('cellular')
+
+    @property
+    def is_cellular(self):
+        return self.cellular is not None
+
+    @property
+    def imei(self):
+        return self.raw['cellular']['imei']
+
+    def sim(self, slot):
+        """ Get the information of one SIM slot
+
+        Args:
+            slot (int or str): SIM slot number, 1 or 2
+
+        Returns:
+            dict: SIM information, None if the slot is not reported
+        """
+
+        try:
+            return self.raw['cellular']['sim'][str(slot)]
+        except (KeyError, TypeError):
+            return None
+
+    def apn(self, slot):
+        """ Get the APN of one SIM slot
+
+        Args:
+            slot (int or str): SIM slot number, 1 or 2
+
+        Returns:
+            str: APN of the SIM slot, None if the slot is not reported
+        """
+
+        sim = self.sim(slot)
+        if sim is None:
+            return None
+        return sim.get('apn')
+
+    def __repr__(self):
+        return f"WanConnection({self.id}, {self.name!r})"
+
+class WanStatus:
+
+    CELLULAR_WAN_ID = '2'
+
+    def __init__(self, response, fetched_at=None):
+        """ Snapshot of one status.wan.connection response
+
+        Args:
+            response (dict): The 'response' part of status.wan.connection
+            fetched_at (float, optional): time.monotonic() of the request. Defaults to now.
+        """
+
+        self.raw = response
+        self.fetched_at = time.monotonic() if fetched_at is None else fetched_at
+        self.__connections = {key: WanConnection(key, value) for key, value in response.items()
+                              if key.isdigit() and isinstance(value, dict)}
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    @property
+    def ids(self):
+        return list(self.__connections)
+
+    def __iter__(self):
+        return iter(self.__connections.values())
+
+    def wan(self, wan_id):
+        """ Get one WAN connection
+
+        Args:
+            wan_id (int or str): The id of the wan connection
+
+        Returns:
+            WanConnection: The WAN connection
+        """
+
+        return self.__connections[str(wan_id)]
+
+    @property
+    def cellular(self):
+        return self.wan(WanStatus.CELLULAR_WAN_ID)
+
+    @property
+    def imei(self):
+        return self.cellular.imei
+
+    @property
+    def main_apn(self):
+        return self.cellular.raw['cellular']['sim']['1']['apn']
+
+    @property
+    def secondary_apn(self):
+        return self.cellular.apn(2)
+
+    def __repr__(self):
+        return f"WanStatus({self.ids})"
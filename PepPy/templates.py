@@ -1,7 +1,178 @@
+import copy
+import json
+import urllib.parse
+
+class _FrozenDict(dict):
+    # A dict that can still be serialized by json and requests, but not changed
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Template parameters can not be changed, use replace() to get a changed copy")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        # pickle would fill the dict through __setitem__
+        return _FrozenDict, (dict(self),)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        # Copies are made to be changed, so they are plain dicts and lists
+        return _thaw(self)
+
+def _thaw(value):
+    if isinstance(value, dict):
+        return {key: _thaw(item) for key, item in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_thaw(item) for item in value]
+    return copy.deepcopy(value)
+
+_CONTAINERS = (dict, list, tuple)
+
+def _freeze(value):
+    # Only containers are visited, the scalars that make up most of a template are kept as they are
+    if isinstance(value, dict):
+        return _FrozenDict({key: _freeze(item) if isinstance(item, _CONTAINERS) else item for key, item in value.items()})
+    return tuple(_freeze(item) if isinstance(item, _CONTAINERS) else item for item in value)
+
+def _rebuild(cls, arguments):
+    return cls(**arguments)
+
+def _arguments(local_variables):
+    return {key: value for key, value in local_variables.items() if key != 'self'}
+
+def without_none(params):
+    """ Copy parameters without every value set to None, the Peplink API throws an error on them
+
+    Args:
+        params (dict or list): Parameters to copy
+
+    Returns:
+        dict or list: The copy, dicts and lists nested in it are copied as well
+    """
+
+    if isinstance(params, (list, tuple)):
+        return [without_none(e) for e in params]
+    elif isinstance(params, dict):
+        return {k: without_none(v) for k, v in params.items() if v is not None}
+    return params
+
+def _matches(desired, current, keep_none=False):
+    # Every value that would be sent has to be in the current configuration.
+    # None values are only sent, and compared, by templates that keep them
+    if isinstance(desired, dict):
+        if not isinstance(current, dict):
+            return False
+        return all(key in current and _matches(value, current[key], keep_none) for key, value in desired.items()
+                   if keep_none or value is not None)
+    elif isinstance(desired, (list, tuple)):
+        if not isinstance(current, (list, tuple)) or len(desired) != len(current):
+            return False
+        return all(_matches(d, c, keep_none) for d, c in zip(desired, current))
+    return desired == current or str(desired) == str(current)
+
 class BaseTemplate:
 
+    __slots__ = ('_params', '_arguments', '_body')
+
+    # Keys that tell the API what to do with the request, they are not part of the configuration
+    REQUEST_KEYS = ('func', 'action', 'agent', 'instantActive', 'enforce', 'section')
+    # False if the router can not send the settings back through its API
+    readable = True
+    # How the body is sent, 'json' or 'form'
+    encoding = 'json'
+    # False if None values have to be sent as null, e.g. to turn a setting off
+    strip_none = True
+
+    def _freeze(self, params, arguments):
+        # Templates are shared between routers and threads, so they never change once built
+        object.__setattr__(self, '_params', _freeze(params))
+        object.__setattr__(self, '_arguments', arguments)
+        object.__setattr__(self, '_body', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} can not be changed, use replace() to get a changed copy")
+
+    __delattr__ = __setattr__
+
+    def __reduce__(self):
+        # Built again from its arguments, e.g. when sent to another process
+        return _rebuild, (type(self), self._arguments)
+
+    def __copy__(self):
+        return self # It can not change, so it can be shared
+
+    def __deepcopy__(self, memo):
+        return type(self)(**copy.deepcopy(self._arguments, memo))
+
+    @property
+    def params(self):
+        return self._params
+
+    def replace(self, **changes):
+        """ Copy the template with some of its arguments changed
+
+        Args:
+            **changes: Arguments of the template's constructor to change
+
+        Returns:
+            BaseTemplate: The new template, of the same type
+        """
+
+        return type(self)(**dict(self._arguments, **changes))
+
+    @property
+    def body(self):
+        """ The request body, serialized on first use and reused for every router the template is pushed to
+
+        Returns:
+            bytes: JSON or urlencoded parameters, None values already removed unless strip_none is False
+        """
+
+        if self._body is None:
+            object.__setattr__(self, '_body', self._serialize())
+        return self._body
+
+    @property
+    def content_type(self):
+        if self.encoding == 'json':
+            return 'application/json'
+        return 'application/x-www-form-urlencoded'
+
+    def _serialize(self):
+        params = without_none(self._params) if self.strip_none else self._params
+        if self.encoding == 'json':
+            return json.dumps(params, allow_nan=False).encode()
+        return urllib.parse.urlencode(params, doseq=True).encode()
+
+    def current_config(self, response):
+        """ Get the part of a config.* response that this template would change
+
+        Args:
+            response (dict): The 'response' part of the GET request for this template's func
+
+        Returns:
+            dict: The current configuration to compare against
+        """
+
+        return response
+
+    def differs_from(self, current):
+        """ Check if pushing this template would change the router
+
+        Args:
+            current (dict): The current configuration, see current_config
+
+        Returns:
+            bool: True if a value in params is different from, or missing in, the current configuration
+        """
+
+        desired = {key: value for key, value in self.params.items() if key not in BaseTemplate.REQUEST_KEYS}
+        return not _matches(desired, current, keep_none=not self.strip_none)
+
     def __setitem__(self, key, value):
-        self.params[key] = value
+        raise TypeError(f"{type(self).__name__} can not be changed, use replace() to get a changed copy")
 
     def __getitem__(self, key):
         return self.params[key]
@@ -14,6 +185,9 @@ class BaseTemplate:
 
 class EmailSettings(BaseTemplate):
 
+    __slots__ = ()
+    strip_none = False # authentication is sent as null to turn it off
+
     def __init__(self, host, security, port, sender, recipients, username=None, password=None, enable=True):
         """ Email Settings holder for peplink API
 
@@ -27,8 +201,9 @@ class EmailSettings(BaseTemplate):
             recipients (list): A list of recipients to send the notifications to
             enable (bool, optional): Enable and Disable email notifications. Defaults to True.
         """
-        
-        self.params = {
+
+        arguments = _arguments(locals())
+        params = {
             'enable': enable,
             'host': host,
             'security': security,
@@ -40,13 +215,16 @@ class EmailSettings(BaseTemplate):
         }
 
         if username:
-            self.params['authentication'] = {
+            params['authentication'] = {
                 'user': username,
                 'password': password
             }
+        self._freeze(params, arguments)
 
 class TimeSettings(BaseTemplate):
 
+    __slots__ = ()
+
     def __init__(self, timeZone, syncSource='server', timeServer='0.peplink.pool.ntp.org'):
         """ Time Settings holder for peplink API
 
@@ -56,12 +234,21 @@ class TimeSettings(BaseTemplate):
             timeServer (str, optional): Specify any ntp server that. Defaults to '0.peplink.pool.ntp.org'
         """
         
-        self.params = locals()
-        self.params['func'] = 'config.time'
-        del self.params['self']
+        arguments = _arguments(locals())
+        params = {
+            'timeZone': timeZone,
+            'syncSource': syncSource,
+            'timeServer': timeServer,
+            'func': 'config.time'
+        }
+        self._freeze(params, arguments)
 
 class AdminSettings(BaseTemplate):
 
+    __slots__ = ()
+    readable = False
+    encoding = 'form'
+
     def __init__(self, name, admin_name=None, admin_password=None, user_name=None, user_password=None, web_session_timeout=14400, access_protocol_method='http+https',
                     http_redirect_to_https='yes', http_port=80, http_access='lan', https_port=443, https_access='lan'):
         """ Admin Settings data holder for Peplink API
@@ -81,34 +268,40 @@ class AdminSettings(BaseTemplate):
             https_access (str, optional): Where the Web Interface can be accessed from using HTTPS. Can be lan or lan+wan. Defaults to 'lan'.
         """
 
-        self.arguments = locals()
-        self.__set_parameters()
+        arguments = _arguments(locals())
+        self._freeze(self.__parameters(arguments), arguments)
 
-    def __set_parameters(self):
-        self.params = {
-            'device_name': self.arguments['name'],
-            'name': self.arguments['name'],
+    def __parameters(self, arguments):
+        return {
+            'device_name': arguments['name'],
+            'name': arguments['name'],
             'legacy': '', # This needs to be here to make the request work
             'is_enforce': '',
             
             'func': 'config.admin',
-            'adminLoginName': self.arguments['admin_name'],
-            'adminLoginPassword': self.arguments['admin_password'],
-            'adminLoginPasswordConfirm': self.arguments['admin_password'],
-            'userLoginName': self.arguments['user_name'],
-            'userLoginPassword': self.arguments['user_password'],
-            'userLoginPasswordConfirm': self.arguments['user_password'],
-            'timeout': self.arguments['web_session_timeout'],
-            'accessProtocol_method': self.arguments['access_protocol_method'],
-            'accessProtocol_http_port': self.arguments['http_port'],
-            'accessProtocol_http_access': self.arguments['http_access'],
-            'accessProtocol_https_port': self.arguments['https_port'],
-            'https_port': self.arguments['https_port'],
-            'accessProtocol_https_access': self.arguments['https_access'],
+            'adminLoginName': arguments['admin_name'],
+            'adminLoginPassword': arguments['admin_password'],
+            'adminLoginPasswordConfirm': arguments['admin_password'],
+            'userLoginName': arguments['user_name'],
+            'userLoginPassword': arguments['user_password'],
+            'userLoginPasswordConfirm': arguments['user_password'],
+            'timeout': arguments['web_session_timeout'],
+            'accessProtocol_method': arguments['access_protocol_method'],
+            'accessProtocol_http_port': arguments['http_port'],
+            'accessProtocol_http_access': arguments['http_access'],
+            'accessProtocol_https_port': arguments['https_port'],
+            'https_port': arguments['https_port'],
+            'accessProtocol_https_access': arguments['https_access'],
         }
 
+    def _serialize(self):
+        # The router wants the + of http+https as it is
+        return urllib.parse.urlencode(without_none(self._params), safe='+').encode()
+
 class PortForwarding(BaseTemplate):
 
+    __slots__ = ()
+
     def __init__(self, name, server_ip_address, id=0, enable=True, protocol='TCP', external_port=None, mapped_port=None, allow_pepvpn=False,
                     enable_wan=False, enable_cell=False, enable_wifi_2=False, enable_wifi_5=False):
         """ Port Forwarding data holder for Peplink API
@@ -128,8 +321,8 @@ class PortForwarding(BaseTemplate):
             enable_wifi_5 (bool, optional): Enable the 5 GHz Wi-Fi to pass this port forwarding rule. Defaults to False.
         """
 
-        arguments = locals()
-        self.params = {
+        arguments = _arguments(locals())
+        params = {
             'func': 'config.inbound.service',
             'action': 'add',
             'list': [
@@ -151,9 +344,23 @@ class PortForwarding(BaseTemplate):
                 }
             ]
         }
-        self.__check_parameters(arguments)
-
-    def __check_parameters(self, parameters):
+        self.__check_parameters(params, arguments)
+        self._freeze(params, arguments)
+
+    def current_config(self, response):
+        for key, rule in response.items():
+            if key.isdigit() and rule.get('name') == self.params['list'][0]['name']:
+                return rule
+        return None
+
+    def differs_from(self, current):
+        desired = dict(self.params['list'][0])
+        desired['inboundServer'] = {key: value for key, value in desired['inboundServer'].items() if key != 'action'}
+        if not desired['id']:
+            del desired['id'] # A new rule does not know its id yet
+        return not _matches(desired, current, keep_none=not self.strip_none)
+
+    def __check_parameters(self, params, parameters):
         wan_connection = dict()
         order = list()
         if parameters['enable_wan']:
@@ -173,10 +380,14 @@ class PortForwarding(BaseTemplate):
             raise SyntaxError("Please enable one of these WAN connections (enable_wan, enable_cell, enable_wifi_2_4, enable_wifi_5).")
 
         wan_connection['order'] = order
-        self.params['list'][0]['wanConnection'] = wan_connection
+        params['list'][0]['wanConnection'] = wan_connection
 
 class GenericLan(BaseTemplate):
 
+    __slots__ = ()
+    readable = False
+    encoding = 'form'
+
     def __init__(self, proxy_dns_enable='yes', proxy_dns_caching='no', proxy_google_dns='yes'):
         """ Generic Lan data holder for Peplink API
 
@@ -185,16 +396,22 @@ class GenericLan(BaseTemplate):
             proxy_dns_caching (str, optional): Enable DNS caching. Can be yes or no. Defaults to 'no
             proxy_google_dns (str, optional): Enable the use of Google's public DNS servers for proxy DNS. Can be yes or no. Defaults to 'no'
         """
-                    
-        self.params = {
+
+        arguments = _arguments(locals())
+        params = {
             'section': 'LAN_generic_modify',
             'ldns_enable': proxy_dns_enable,
             'ldns_cache': proxy_dns_caching,
             'ldns_use_google': proxy_google_dns
         }
+        self._freeze(params, arguments)
 
 class LanProfile(BaseTemplate):
 
+    __slots__ = ()
+    readable = False
+    encoding = 'form'
+
     def __init__(self, name, id=0, enable_dhcp=True, router_ip='192.168.50.1', router_subnet_mask=24, dhcp_pool_start='192.168.50.10', dhcp_pool_end='192.168.50.250',
                  dhcp_pool_subnet_mask='24', dhcp_lease_time=86400, reservation_mac=None, reservation_ip=None, reservation_name=None, reservation_order=1):
         """ Lan Profile data holder for Peplink API
@@ -211,7 +428,8 @@ class LanProfile(BaseTemplate):
             dhcp_lease_time (int, optional): Dhcp lease time for IP Addresses. This is only applicable if dhcp is enabled. Defaults to 86400.
         """
 
-        self.params = {
+        arguments = _arguments(locals())
+        params = {
             'lan_id': id,
             'section': 'LAN_network_modify',
             'lan_ip': router_ip,
@@ -228,12 +446,16 @@ class LanProfile(BaseTemplate):
         }
 
         if enable_dhcp:
-            self.params['lan_dhcp_mode'] = 'server'
+            params['lan_dhcp_mode'] = 'server'
         else:
-            self.params['lan_dhcp_mode'] = 'disable'
+            params['lan_dhcp_mode'] = 'disable'
+        self._freeze(params, arguments)
 
 class CellularSettings(BaseTemplate):
 
+    __slots__ = ()
+    strip_none = False # The API wants every key, even when it is null
+
     def __init__(self, instant_active=True, id=2, name='Cellular', enable=True, enable_healthcheck=True, enable_ddns=False,
                     schedule=None, cellular={'preferredSim': None, 'simCardScheme': '1'}, sim1_info=None, sim2_info=None, signal_level=0, priority=1, mtu=1342):
         """ Cellular Settings data holder for Peplink API
@@ -254,6 +476,9 @@ class CellularSettings(BaseTemplate):
             mtu (int, optional): The maxium transmit unit. Firstnet is 1342. Defaults to 1342.
         """
 
+        arguments = _arguments(locals())
+        cellular = dict(cellular) # Do not change the default argument
+
         # Sim Information has to be filled out for request to be sucessfull
         if not sim1_info:
             sim1_info = {
@@ -329,7 +554,7 @@ class CellularSettings(BaseTemplate):
             'recovery': 3
         }
 
-        self.params = {
+        params = {
             'func': 'config.wan.connection',
             'agent': 'webui',
             'action': 'update',
@@ -356,3 +581,11 @@ class CellularSettings(BaseTemplate):
             ],
             'enforce': False
         }
+        self._freeze(params, arguments)
+
+    def current_config(self, response):
+        return response.get(str(self.params['list'][0]['id']))
+
+    def differs_from(self, current):
+        desired = {key: value for key, value in self.params['list'][0].items() if key != 'id'}
+        return not _matches(desired, current, keep_none=not self.strip_none)
@@ -0,0 +1,91 @@
+class PendingChange:
+
+    def __init__(self, name, send, priority=0):
+        """ A configuration change queued by a transaction
+
+        Args:
+            name (str): Name of the PepPy method that queued the change
+            send (callable): Sends the change and returns True if the Peplink accepted it
+            priority (int, optional): Changes with a higher priority are sent later. Defaults to 0.
+        """
+
+        self.name = name
+        self.priority = priority
+        self.accepted = None
+        self.error = None
+        self.__send = send
+
+    @property
+    def sent(self):
+        return self.accepted is not None or self.error is not None
+
+    def send(self):
+        try:
+            self.accepted = bool(self.__send())
+        except Exception as e:
+            self.accepted = False
+            self.error = e
+        return self.accepted
+
+    def __repr__(self):
+        return f"PendingChange({self.name}, accepted={self.accepted})"
+
+class Transaction:
+
+    # Changes that move the address of the router have to be sent last
+    NORMAL = 0
+    MOVES_IP = 1
+    MOVES_PORT = 2
+
+    def __init__(self):
+        """ Changes queued by PepPy.transaction() that are sent together with one apply """
+
+        self.changes = list()
+        self.applied = None
+
+    def queue(self, name, send, priority=NORMAL):
+        """ Queue a change until the transaction is committed
+
+        Args:
+            name (str): Name of the PepPy method that queued the change
+            send (callable): Sends the change and returns True if the Peplink accepted it
+            priority (int, optional): Changes with a higher priority are sent later. Defaults to Transaction.NORMAL.
+
+        Returns:
+            PendingChange: The queued change. Its result is filled in on commit
+        """
+
+        change = PendingChange(name, send, priority)
+        self.changes.append(change)
+        return change
+
+    def commit(self, apply_changes):
+        """ Send every queued change, address changes last, then apply once
+
+        Args:
+            apply_changes (callable): Applies the changes on the router and returns True if accepted
+
+        Returns:
+            bool: True if every change was accepted and applied
+        """
+
+        # sorted() is stable, changes of the same priority keep their order
+        for change in sorted(self.changes, key=lambda change: change.priority):
+            change.send()
+
+        if any(change.accepted for change in self.changes):
+            self.applied = apply_changes()
+        return self.ok
+
+    @property
+    def ok(self):
+        if not self.changes:
+            return True
+        return bool(self.applied) and all(change.accepted for change in self.changes)
+
+    @property
+    def results(self):
+        return [(change.name, change.accepted) for change in self.changes]
+
+    def __len__(self):
+        return len(self.changes)
@@ -0,0 +1,260 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from .exceptions import RequestRejectedError
+
+class WanEvent:
+
+    def __init__(self, router, wan_id, old, new, timestamp=None):
+        """ Something changed on one WAN connection of a router
+
+        Args:
+            router (str): ip:port of the router
+            wan_id (str): The id of the wan connection
+            old (any): Value before the change
+            new (any): Value after the change
+            timestamp (float, optional): Unix time the change was seen. Defaults to now.
+        """
+
+        self.router = router
+        self.wan_id = wan_id
+        self.old = old
+        self.new = new
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.router}, wan {self.wan_id}: {self.old!r} -> {self.new!r})"
+
+class WanUp(WanEvent):
+    """ The WAN connection is connected again, old and new are the status messages """
+
+class WanDown(WanEvent):
+    """ The WAN connection is no longer connected, old and new are the status messages """
+
+class SimSwitched(WanEvent):
+    """ Another SIM slot became active, old and new are the slot numbers """
+
+class ApnChanged(WanEvent):
+
+    def __init__(self, router, wan_id, old, new, slot, timestamp=None):
+        """ The APN of one SIM slot changed
+
+        Args:
+            slot (str): The SIM slot whose APN changed
+        """
+
+        super().__init__(router, wan_id, old, new, timestamp)
+        self.slot = slot
+
+class ImeiChanged(WanEvent):
+    """ The cellular modem reports another IMEI, usually because the modem was swapped """
+
+class SignalThresholdCrossed(WanEvent):
+
+    def __init__(self, router, wan_id, old, new, threshold, timestamp=None):
+        """ The signal level went over or under a threshold
+
+        Args:
+            threshold (int): The crossed threshold
+        """
+
+        super().__init__(router, wan_id, old, new, timestamp)
+        self.threshold = threshold
+
+    @property
+    def rising(self):
+        return self.new >= self.threshold
+
+def _active_sim(cellular):
+    for slot, sim in (cellular.get('sim') or {}).items():
+        if isinstance(sim, dict) and sim.get('active'):
+            return slot
+    return None
+
+class _WanState:
+    # Only the fields events are made from, extracted once per changed WAN
+
+    def __init__(self, raw):
+        cellular = raw.get('cellular') or {}
+        self.raw = raw
+        self.up = raw.get('message') == 'Connected'
+        self.message = raw.get('message')
+        self.imei = cellular.get('imei')
+        self.signal_level = cellular.get('signalLevel')
+        self.active_sim = _active_sim(cellular)
+        self.apns = {slot: sim.get('apn') for slot, sim in (cellular.get('sim') or {}).items() if isinstance(sim, dict)}
+
+class WanWatcher:
+
+    def __init__(self, fleet=None, interval=10, signal_thresholds=(2,), debug=False):
+        """ Turns successive status.wan.connection snapshots of many routers into typed events
+
+        Snapshots are compared top down: an unchanged response, or an unchanged WAN inside of it, is skipped
+        with one dict comparison and only the WANs that changed are looked at field by field.
+
+        Args:
+            fleet (fleet.Fleet, optional): Routers to poll with run() or start(). Not needed to feed update() yourself.
+            interval (float, optional): Seconds between two snapshots of a router. Defaults to 10.
+            signal_thresholds (tuple, optional): Signal levels that raise SignalThresholdCrossed. Defaults to (2,).
+            debug (bool, optional): If True, it will display debugging messages. Defaults to False.
+        """
+
+        self.fleet = fleet
+        self.interval = interval
+        self.signal_thresholds = tuple(sorted(signal_thresholds))
+        self.__DEBUG = debug
+        self.__callbacks = list()
+        self.__snapshots = dict()
+        self.__states = dict()
+        self.__clients = dict()
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def __debug(self, message):
+        if self.__DEBUG:
+            print(message)
+
+    def on(self, event_type, callback):
+        """ Call callback with every event of a type
+
+        Args:
+            event_type (type): WanEvent or one of its subclasses, WanEvent receives every event
+            callback (callable): Called with the event, from the thread that fed the snapshot
+        """
+
+        self.__callbacks.append((event_type, callback))
+
+    def to_queue(self, queue, loop=None, event_type=WanEvent):
+        """ Put every event into an asyncio queue, safe to call from the polling threads
+
+        Args:
+            queue (asyncio.Queue): Queue to put the events into
+            loop (asyncio.AbstractEventLoop, optional): Loop of the queue. Defaults to the running loop.
+            event_type (type, optional): Only queue events of this type. Defaults to WanEvent.
+        """
+
+        loop = loop or asyncio.get_running_loop()
+        self.on(event_type, lambda event: loop.call_soon_threadsafe(queue.put_nowait, event))
+
+    def update(self, router, response):
+        """ Compare a new status.wan.connection response of a router with the previous one
+
+        The first response of a router only sets the baseline.
+
+        Args:
+            router (str): ip:port of the router
+            response (dict): The 'response' part of status.wan.connection
+
+        Returns:
+            list: WanEvent objects, already handed to the callbacks
+        """
+
+        with self.__lock:
+            previous = self.__snapshots.get(router)
+            self.__snapshots[router] = response
+        if previous is None or previous == response:
+            if previous is None:
+                self.__states[router] = {key: _WanState(value) for key, value in response.items()
+                                         if key.isdigit() and isinstance(value, dict)}
+            return []
+
+        states = self.__states.setdefault(router, dict())
+        events = list()
+        for wan_id, raw in response.items():
+            if not wan_id.isdigit() or not isinstance(raw, dict) or previous.get(wan_id) == raw:
+                continue
+            state = _WanState(raw)
+            old = states.get(wan_id)
+            states[wan_id] = state
+            if old is not None:
+                events.extend(self.__diff(router, wan_id, old, state))
+
+        for event in events:
+            self.__debug(event)
+            for event_type, callback in self.__callbacks:
+                if isinstance(event, event_type):
+                    callback(event)
+        return events
+
+    def __diff(self, router, wan_id, old, new):
+        if old.up != new.up:
+            yield (WanUp if new.up else WanDown)(router, wan_id, old.message, new.message)
+        if old.imei != new.imei:
+            yield ImeiChanged(router, wan_id, old.imei, new.imei)
+        if old.active_sim != new.active_sim:
+            yield SimSwitched(router, wan_id, old.active_sim, new.active_sim)
+        for slot in sorted(set(old.apns) | set(new.apns)):
+            if old.apns.get(slot) != new.apns.get(slot):
+                yield ApnChanged(router, wan_id, old.apns.get(slot), new.apns.get(slot), slot)
+        if old.signal_level is not None and new.signal_level is not None and old.signal_level != new.signal_level:
+            low, high = sorted((old.signal_level, new.signal_level))
+            for threshold in self.signal_thresholds:
+                if low < threshold <= high:
+                    yield SignalThresholdCrossed(router, wan_id, old.signal_level, new.signal_level, threshold)
+
+    def __client(self, device):
+        pep = self.__clients.get(device.key)
+        if pep is None:
+            pep = self.fleet.client(device)
+            if self.fleet.login and not pep.login():
+                pep.close() # Not kept, the next check logs in again
+                raise RequestRejectedError(f"Login to {device.key} as {device.username} failed")
+            self.__clients[device.key] = pep
+        return pep
+
+    def check(self, device):
+        """ Take a snapshot of one router of the fleet and compare it
+
+        Args:
+            device (fleet.Device): Router to check
+
+        Raises:
+            exceptions.RequestRejectedError: The login to the router failed
+
+        Returns:
+            list: WanEvent objects
+        """
+
+        return self.update(device.key, self.__client(device).get_wan_connection_info())
+
+    def run(self, duration=None):
+        """ Check every router of the fleet each interval until stop() is called or duration has passed
+
+        Args:
+            duration (float, optional): Seconds to run for. Defaults to running until stop().
+        """
+
+        deadline = None if duration is None else time.monotonic() + duration
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.fleet.max_workers) as executor:
+            while not self.__stopped.is_set():
+                started = time.monotonic()
+                futures = {executor.submit(self.check, device): device for device in self.fleet.devices}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.__debug(f"Checking {futures[future].key} failed: {e}")
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                self.__stopped.wait(max(started + self.interval - time.monotonic(), 0))
+
+    def start(self):
+        """ Check the fleet from a background thread until stop() is called """
+
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.run, name="PepPy WAN watcher", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """ Stop checking and close every client """
+
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        for pep in self.__clients.values():
+            pep.close()
+        self.__clients.clear()
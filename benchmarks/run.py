@@ -0,0 +1,230 @@
+""" PepPy throughput and latency benchmarks against a local mock router.
+
+Every scenario reports p50/p95/p99 latency, requests per second and the peak
+memory allocated per call. Results are written as JSON so two versions can be
+compared.
+
+Usage:
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --scenario single --calls 500
+    python benchmarks/run.py --compare old.json results.json
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import PepPy
+from PepPy import fleet, peppy, templates
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class _MockRouters:
+    """ Mock routers in a child process, so their work does not show up in the measurements """
+
+    def __init__(self, devices=1, latency=0.0):
+        self.__command = [sys.executable, '-m', 'PepPy.mock_router', '--port', '0', '--devices', str(devices),
+                          '--latency', str(latency)]
+        self.__devices = devices
+        self.ports = list()
+
+    def __enter__(self):
+        self.__process = subprocess.Popen(self.__command, cwd=_ROOT, stdout=subprocess.PIPE, text=True)
+        while len(self.ports) < self.__devices:
+            line = self.__process.stdout.readline()
+            if not line:
+                raise RuntimeError("The mock router did not start")
+            self.ports.append(int(line.split(' (')[0].rsplit(':', 1)[1]))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__process.terminate()
+        self.__process.wait()
+
+    def inventory(self):
+        return [{'ip_address': '127.0.0.1', 'port': port, 'username': 'admin', 'password': 'admin', 'http_type': 'http'}
+                for port in self.ports]
+
+
+def _templates():
+    return {
+        'update_time_settings': templates.TimeSettings('America/Denver'),
+        'update_email_notifications': templates.EmailSettings('smtp.example.com', None, 2525, 'peppy@example.com',
+                                                              ['ops@example.com']),
+        'update_cellular': templates.CellularSettings(),
+        'add_port_forwarding_rule': templates.PortForwarding('Web', '192.168.50.5', external_port=80, enable_wan=True),
+        'update_admin_settings': templates.AdminSettings('Benchmark'),
+        'update_generic_lan': templates.GenericLan(),
+    }
+
+
+def _operations(firmware_file):
+    operations = {
+        'login': lambda pep: pep.login(),
+        'get_device_info': lambda pep: pep.get_device_info(),
+        'get_wan_connection_info': lambda pep: pep.get_wan_connection_info(),
+        'get_port_forwarding': lambda pep: pep.get_port_forwarding(),
+    }
+    for method, template in _templates().items():
+        operations[method] = lambda pep, method=method, template=template: getattr(pep, method)(template)
+    operations['update_firmware'] = lambda pep: pep.update_firmware(firmware_file)
+    return operations
+
+
+def _client(port):
+    pep = peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=port, http_type='http', timeout=30,
+                      failure_threshold=None)
+    pep.login()
+    return pep
+
+
+def _summary(latencies, elapsed, memory=None):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'calls': len(latencies),
+        'p50_ms': quantiles[49] * 1000,
+        'p95_ms': quantiles[94] * 1000,
+        'p99_ms': quantiles[98] * 1000,
+        'requests_per_second': len(latencies) / elapsed,
+        'memory_per_call_kib': memory,
+    }
+
+
+def _memory_per_call(operation, pep, samples):
+    # tracemalloc slows every call down, so memory is measured in a separate pass
+    peaks = list()
+    tracemalloc.start()
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        operation(pep)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - start)
+    tracemalloc.stop()
+    return statistics.mean(peaks) / 1024
+
+
+def _timed(operation, pep):
+    start = time.perf_counter()
+    operation(pep)
+    return time.perf_counter() - start
+
+
+def single_device(server, operations, calls):
+    results = dict()
+    with _client(server.ports[0]) as pep:
+        for name, operation in operations.items():
+            count = max(calls // 10, 5) if name == 'update_firmware' else calls
+            start = time.perf_counter()
+            latencies = [_timed(operation, pep) for _ in range(count)]
+            elapsed = time.perf_counter() - start
+            results[name] = _summary(latencies, elapsed, _memory_per_call(operation, pep, min(count, 20)))
+    return results
+
+
+def threaded(server, operations, calls, threads):
+    results = dict()
+    for name in ('login', 'get_device_info', 'update_time_settings'):
+        operation = operations[name]
+        clients = [_client(server.ports[0]) for _ in range(threads)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            start = time.perf_counter()
+            latencies = list(executor.map(lambda index: _timed(operation, clients[index % threads]), range(calls)))
+            elapsed = time.perf_counter() - start
+        for pep in clients:
+            pep.close()
+        results[name] = _summary(latencies, elapsed)
+    return results
+
+
+def fleet_sweep(server, workers):
+    results = dict()
+    devices = fleet.Fleet(server.inventory(), max_workers=workers, timeout=30, failure_threshold=None)
+    for name in ('get_firmware_version', 'get_wan_connection_info'):
+        start = time.perf_counter()
+        latencies = [result.elapsed for result in devices.run(name)]
+        elapsed = time.perf_counter() - start
+        results[name] = _summary(latencies, elapsed)
+    return results
+
+
+def compare(old_file, new_file):
+    with open(old_file) as old, open(new_file) as new:
+        old_results, new_results = json.load(old)['scenarios'], json.load(new)['scenarios']
+    print(f"{'scenario':<45} {'p50 ms':>18} {'requests/s':>22}")
+    for scenario, operations in new_results.items():
+        for name, new_summary in operations.items():
+            old_summary = old_results.get(scenario, {}).get(name)
+            if old_summary is None:
+                continue
+            p50 = f"{old_summary['p50_ms']:.2f} -> {new_summary['p50_ms']:.2f}"
+            rps = f"{old_summary['requests_per_second']:.0f} -> {new_summary['requests_per_second']:.0f}"
+            print(f"{scenario + '/' + name:<45} {p50:>18} {rps:>22}")
+
+
+def _print(results):
+    for scenario, operations in results.items():
+        print(scenario)
+        for name, summary in operations.items():
+            memory = summary['memory_per_call_kib']
+            memory = f"{memory:9.1f} KiB" if memory is not None else ''
+            print(f"  {name:<30} p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms  "
+                  f"p99 {summary['p99_ms']:8.2f} ms  {summary['requests_per_second']:9.1f} req/s {memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=('single', 'threaded', 'fleet'), action='append')
+    parser.add_argument('--calls', type=int, default=200, help="Calls per operation")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--devices', type=int, default=100, help="Virtual routers of the fleet scenario")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds every mock router waits before answering")
+    parser.add_argument('--firmware-size', type=int, default=8, help="Size of the uploaded firmware in MiB")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    scenarios = args.scenario or ['single', 'threaded', 'fleet']
+    results = dict()
+    with tempfile.NamedTemporaryFile(suffix='.bin') as firmware_file:
+        firmware_file.write(os.urandom(args.firmware_size * 1024 * 1024))
+        firmware_file.flush()
+        operations = _operations(firmware_file.name)
+
+        with _MockRouters(latency=args.latency) as server:
+            if 'single' in scenarios:
+                results['single'] = single_device(server, operations, args.calls)
+            if 'threaded' in scenarios:
+                results['threaded'] = threaded(server, operations, args.calls, args.threads)
+        if 'fleet' in scenarios:
+            with _MockRouters(devices=args.devices, latency=args.latency) as server:
+                results['fleet'] = fleet_sweep(server, args.threads * 4)
+
+    _print(results)
+    if args.output:
+        report = {
+            'version': PepPy.version,
+            'python': platform.python_version(),
+            'timestamp': time.time(),
+            'arguments': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'scenarios': results,
+        }
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
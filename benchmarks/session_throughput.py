@@ -0,0 +1,83 @@
+""" Compare API calls per second with and without a pooled session.
+
+Starts a local mock router over HTTPS and sends the same `login` call with
+module-level `requests.post` (a new TCP connection and TLS handshake per call)
+and with `PepPy` (one pooled connection, a single handshake).
+
+Without --certfile a self-signed certificate is generated with the openssl
+command line tool for the duration of the run.
+
+Usage:
+    python benchmarks/session_throughput.py --calls 500
+    python benchmarks/session_throughput.py --certfile cert.pem --keyfile key.pem
+    python benchmarks/session_throughput.py --http
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PepPy import mock_router, peppy
+
+
+def _self_signed_certificate(directory):
+    certfile, keyfile = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-subj', '/CN=127.0.0.1', '-days', '1',
+                    '-keyout', keyfile, '-out', certfile], check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def _per_call(url, calls):
+    params = {'username': 'admin', 'password': 'admin', 'func': 'login'}
+    for _ in range(calls):
+        requests.post(url, json=params, verify=False, timeout=5)
+
+
+def _pooled(port, http_type, calls):
+    with peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=port, http_type=http_type, timeout=5) as pep:
+        for _ in range(calls):
+            pep.login()
+
+
+def _measure(name, func, calls):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {calls / elapsed:10.1f} requests/second")
+    return calls / elapsed
+
+
+def _run(calls, certfile=None, keyfile=None):
+    with mock_router.MockRouterServer(certfile=certfile, keyfile=keyfile) as server:
+        port = server.routers[0].port
+        url = f"{server.http_type}://127.0.0.1:{port}/cgi-bin/MANGA/api.cgi"
+        print(f"{server.http_type.upper()} mock router on port {port}")
+        before = _measure('per-call', lambda: _per_call(url, calls), calls)
+        after = _measure('pooled', lambda: _pooled(port, server.http_type, calls), calls)
+        print(f"speedup      {after / before:10.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--certfile', help="Certificate of the mock router. Defaults to a generated self-signed one")
+    parser.add_argument('--keyfile', help="Private key of --certfile, if it is not in the same file")
+    parser.add_argument('--http', action='store_true', help="Use plain HTTP, without TLS handshakes")
+    args = parser.parse_args()
+
+    if args.http:
+        _run(args.calls)
+    elif args.certfile:
+        _run(args.calls, args.certfile, args.keyfile)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            _run(args.calls, *_self_signed_certificate(directory))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+""" CPU cost of preparing the payload of a template push, without PepPy or requests.
+
+Only the work that changed with the immutable templates is timed, so the
+numbers do not drown in the ~800 us requests spends on every call:
+
+    clean + serialize   what every push did before: remove the None values of
+                        the params in place, then json.dumps or urlencode them
+    shared template     template.body of one template pushed to every router
+    new template        building a template for every router, then its body
+
+Each column is the best of --repeat runs of --pushes payloads.
+
+Usage:
+    python benchmarks/template_push.py --pushes 1000 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PepPy import templates
+
+_TEMPLATES = {
+    'TimeSettings': lambda: templates.TimeSettings('America/Denver'),
+    'EmailSettings': lambda: templates.EmailSettings('smtp.example.com', None, 2525, 'peppy@example.com',
+                                                     ['ops@example.com']),
+    'CellularSettings': lambda: templates.CellularSettings(),
+    'PortForwarding': lambda: templates.PortForwarding('Web', '192.168.50.5', external_port=80, enable_wan=True),
+    'AdminSettings': lambda: templates.AdminSettings('Benchmark'),
+    'GenericLan': lambda: templates.GenericLan(),
+}
+
+def _clean_in_place(params):
+    # clean_params as it was before the templates were immutable
+    if type(params) == list:
+        return [_clean_in_place(e) for e in params]
+    elif type(params) == dict:
+        for k, v in list(params.items()):
+            if v is None:
+                del params[k]
+            else:
+                params[k] = _clean_in_place(v)
+    return params
+
+def _clean_and_serialize(template, params):
+    if template.strip_none:
+        _clean_in_place(params)
+    if template.encoding == 'json':
+        return json.dumps(params, allow_nan=False).encode() # What requests does with json=
+    return urllib.parse.urlencode(params, doseq=True).encode() # What requests does with data=
+
+def _us_per_push(function, pushes, repeat):
+    return min(timeit.repeat(function, number=pushes, repeat=repeat)) / pushes * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pushes', type=int, default=1000, help="Payloads per run, like a fleet of this size")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per column, the fastest one is reported")
+    args = parser.parse_args()
+
+    print(f"{'template':<18} {'clean + serialize':>20} {'shared template':>18} {'new template':>18}")
+    for name, make_template in _TEMPLATES.items():
+        template = make_template()
+        # The old templates held a plain dict that every push cleaned again
+        params = templates._thaw(template.params)
+        old = _us_per_push(lambda: _clean_and_serialize(template, params), args.pushes, args.repeat)
+        shared = _us_per_push(lambda: template.body, args.pushes, args.repeat)
+        rebuilt = _us_per_push(lambda: make_template().body, args.pushes, args.repeat)
+        print(f"{name:<18} {old:>14.2f} us/push {shared:>12.2f} us/push {rebuilt:>12.2f} us/push")
+
+if __name__ == '__main__':
+    main()
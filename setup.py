@@ -18,6 +18,10 @@ setup(
         "httpretty",
         'urllib3',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'parquet': ['pyarrow'],
+    },
     classifiers=[
         "Intended Audience :: Developers",
         "Programming Language :: Python :: 3.10",
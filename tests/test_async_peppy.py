@@ -0,0 +1,62 @@
+import sys
+sys.path.insert(1, '..')
+import asyncio
+import time
+import unittest
+
+from PepPy import async_peppy, exceptions, mock_router, templates
+
+class TestAsyncPepPy(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer()
+        cls.server.start()
+        cls.router = cls.server.routers[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def __pep(self):
+        return async_peppy.AsyncPepPy('admin', 'admin', ip_address='127.0.0.1', port=self.router.port, http_type='http', timeout=5)
+
+    def test_login_keeps_cookie(self):
+        async def run():
+            async with self.__pep() as pep:
+                self.assertTrue(await pep.login())
+                return await pep.get_serial_number()
+
+        self.assertEqual(asyncio.run(run()), self.router.serial_number)
+
+    def test_template_push(self):
+        async def run():
+            async with self.__pep() as pep:
+                await pep.login()
+                return await pep.update_time_settings(templates.TimeSettings("Test"))
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(self.router.config['config.time']['timeZone'], 'Test')
+
+    def test_unreachable(self):
+        async def run():
+            async with async_peppy.AsyncPepPy('admin', 'admin', ip_address='127.0.0.1', port=9, http_type='http') as pep:
+                await pep.get_device_info()
+
+        with self.assertRaises(exceptions.RouterUnreachableError):
+            asyncio.run(run())
+
+    def test_apply_changes_does_not_block(self):
+        async def run():
+            peps = [self.__pep() for _ in range(5)]
+            await asyncio.gather(*(pep.login() for pep in peps))
+            results = await asyncio.gather(*(pep.apply_changes(wait_time=0.2) for pep in peps))
+            await asyncio.gather(*(pep.close() for pep in peps))
+            return results
+
+        start = time.perf_counter()
+        self.assertTrue(all(asyncio.run(run())))
+        self.assertLess(time.perf_counter() - start, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import sys
+sys.path.insert(1, '..')
+import asyncio
+import http.server
+import threading
+import time
+import unittest
+
+from PepPy import discovery, exceptions, mock_router
+
+class TestDiscovery(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer()
+        cls.server.start()
+        cls.router = cls.server.routers[0]
+        # Something else answering HTTP, which must not be reported
+        cls.other = http.server.HTTPServer(('127.0.0.1', 0), http.server.SimpleHTTPRequestHandler)
+        threading.Thread(target=cls.other.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.other.shutdown()
+        cls.other.server_close()
+
+    def __scanner(self, networks, port=None, **kwargs):
+        return discovery.Scanner(networks, port=port or self.router.port, http_type='http', timeout=1, **kwargs)
+
+    def test_finds_router_in_range(self):
+        found = list(self.__scanner('127.0.0.0/29').run())
+        self.assertEqual([router.key for router in found], [f"127.0.0.1:{self.router.port}"])
+        self.assertIsNone(found[0].device_info)
+
+    def test_ignores_other_http_servers(self):
+        self.assertEqual(list(self.__scanner('127.0.0.1', port=self.other.server_address[1]).run()), [])
+
+    def test_login_reads_device_info(self):
+        found = list(discovery.discover('127.0.0.1/32', port=self.router.port, http_type='http', username='admin', password='admin'))
+        self.assertEqual(found[0].device_info.serial_number, self.router.serial_number)
+        device = found[0].device('admin', 'admin')
+        self.assertEqual((device.ip_address, device.port, device.name), ('127.0.0.1', self.router.port, found[0].device_info.device_name))
+
+    def test_wrong_password_is_reported(self):
+        found = list(self.__scanner('127.0.0.1', username='admin', password='wrong').run())
+        self.assertIsInstance(found[0].error, exceptions.RequestRejectedError)
+
+    def test_scan_is_concurrent(self):
+        async def scan():
+            return [router async for router in self.__scanner('127.0.0.0/22', concurrency=256).scan()]
+
+        start = time.perf_counter()
+        self.assertEqual(len(asyncio.run(scan())), 1)
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_is_peplink_api(self):
+        self.assertTrue(discovery.is_peplink_api(b'HTTP/1.1 200 OK\r\n\r\n{"stat": "fail", "code": 401}'))
+        self.assertFalse(discovery.is_peplink_api(b'HTTP/1.1 404 Not Found\r\n\r\n{"stat": "fail"}'))
+        self.assertFalse(discovery.is_peplink_api(b'HTTP/1.1 200 OK\r\n\r\n<html></html>'))
+
+if __name__ == '__main__':
+    unittest.main()
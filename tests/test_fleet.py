@@ -0,0 +1,75 @@
+import sys
+sys.path.insert(1, '..')
+import asyncio
+import unittest
+
+from PepPy import exceptions, fleet, mock_router, templates
+
+class TestFleet(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer(devices=4)
+        cls.server.routers[3].latency = 1
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def __fleet(self, count, **kwargs):
+        return fleet.Fleet(self.server.inventory()[:count], timeout=5, **kwargs)
+
+    def test_run_method_name(self):
+        results = list(self.__fleet(3).run('get_serial_number'))
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual({result.value for result in results}, {router.serial_number for router in self.server.routers[:3]})
+
+    def test_device_timeout(self):
+        results = {result.device.port: result for result in self.__fleet(4, device_timeout=0.5).run('get_serial_number')}
+        slow = results[self.server.routers[3].port]
+        self.assertIsInstance(slow.error, TimeoutError)
+        self.assertEqual(sum(result.ok for result in results.values()), 3)
+
+    def test_failed_login(self):
+        devices = self.server.inventory()[:2]
+        devices[1]['password'] = 'wrong'
+        results = {result.device.port: result for result in fleet.Fleet(devices, timeout=5).run('get_serial_number')}
+        self.assertTrue(results[devices[0]['port']].ok)
+        self.assertIsInstance(results[devices[1]['port']].error, exceptions.RequestRejectedError)
+
+        async def run():
+            return [result async for result in fleet.Fleet(devices, timeout=5).run_async('get_serial_number')]
+
+        errors = [result.error for result in asyncio.run(run())]
+        self.assertEqual(sum(isinstance(error, exceptions.RequestRejectedError) for error in errors), 1)
+
+    def test_push_template(self):
+        results = list(self.__fleet(3).push_template('update_time_settings', templates.TimeSettings("Test")))
+        self.assertTrue(all(result.value for result in results))
+
+    def test_fan_out(self):
+        devices = self.server.inventory()[:3]
+        overrides = {devices[1]['name']: {'update_time_settings': {'timeZone': 'Europe/Paris'}}}
+        base = {'update_time_settings': templates.TimeSettings('America/Denver')}
+        results = list(self.__fleet(3).fan_out(base, overrides, wait_time=0))
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result.ok and result.value.ok for result in results))
+        self.assertEqual([router.config['config.time']['timeZone'] for router in self.server.routers[:3]],
+                         ['America/Denver', 'Europe/Paris', 'America/Denver'])
+
+        with self.assertRaises(ValueError):
+            self.__fleet(3).fan_out({}, {'10.0.0.1:443': {}})
+        with self.assertRaises(ValueError):
+            self.__fleet(3).fan_out({}, {devices[0]['name']: {'update_time_settings': {}}})
+
+    def test_run_async(self):
+        async def run():
+            return [result async for result in self.__fleet(3).run_async('get_serial_number')]
+
+        results = asyncio.run(run())
+        self.assertTrue(all(result.ok for result in results))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import sys
+sys.path.insert(1, '..')
+import asyncio
+import logging
+import unittest
+
+from PepPy import async_peppy, exceptions, instrumentation, mock_router, peppy, templates
+
+class Recorder(instrumentation.Instrument):
+
+    def __init__(self):
+        self.before = list()
+        self.after = list()
+
+    def before_request(self, event):
+        self.before.append((event.func, event.outcome))
+
+    def after_request(self, event):
+        self.after.append(event)
+
+class TestInstrumentation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer()
+        cls.server.start()
+        cls.router = cls.server.routers[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def __pep(self, *instruments, **kwargs):
+        return peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=self.router.port, http_type='http', timeout=5,
+                           instruments=list(instruments), **kwargs)
+
+    def test_hooks_see_every_request(self):
+        recorder = Recorder()
+        with self.__pep(recorder) as pep:
+            pep.login()
+            pep.update_time_settings(templates.TimeSettings("Test"))
+            pep.get_device_info()
+
+        self.assertEqual(recorder.before, [('login', None), ('config.time', None), ('status.system.info', None)])
+        login, push, info = recorder.after
+        self.assertEqual(login.router, f"127.0.0.1:{self.router.port}")
+        self.assertEqual((push.method, push.outcome, push.status_code), ('POST', 'ok', 200))
+        self.assertGreater(push.payload_size, 0)
+        self.assertGreater(info.response_size, 0)
+        self.assertEqual(info.payload_size, 0)
+        self.assertTrue(login.new_connection)
+        self.assertFalse(info.new_connection)
+        self.assertLessEqual(info.server_time, info.elapsed)
+
+    def test_unreachable_router(self):
+        recorder = Recorder()
+        pep = peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=1, http_type='http', timeout=0.2,
+                          failure_threshold=None, retry_policy=peppy.RetryPolicy(attempts=1), instruments=[recorder])
+        with self.assertRaises(exceptions.RouterUnreachableError):
+            pep.login()
+        self.assertEqual(recorder.after[0].outcome, instrumentation.RequestEvent.UNREACHABLE)
+        self.assertIsInstance(recorder.after[0].error, exceptions.RouterUnreachableError)
+
+    def test_prometheus_exporter(self):
+        exporter = instrumentation.PrometheusExporter(buckets=(0.5, 1))
+        with self.__pep(exporter) as pep:
+            pep.login()
+            pep.get_device_info()
+            pep.get_device_info()
+
+        router = f"127.0.0.1:{self.router.port}"
+        self.assertEqual(exporter.requests(func='status.system.info', outcome='ok'), 2)
+        text = exporter.render()
+        self.assertIn(f'peppy_requests_total{{router="{router}",func="login",outcome="ok"}} 1', text)
+        self.assertIn(f'peppy_request_duration_seconds_bucket{{router="{router}",func="status.system.info",le="+Inf"}} 2', text)
+        self.assertIn(f'peppy_connections_opened_total{{router="{router}"}} 1', text)
+
+    def test_log_exporter(self):
+        with self.assertLogs('PepPy.requests', level=logging.INFO) as logs:
+            with self.__pep(instrumentation.LogExporter()) as pep:
+                pep.login()
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].peppy['func'], 'login')
+        self.assertEqual(logs.records[0].peppy['outcome'], 'ok')
+
+    def test_async_hooks(self):
+        recorder = Recorder()
+
+        async def run():
+            async with async_peppy.AsyncPepPy('admin', 'admin', ip_address='127.0.0.1', port=self.router.port,
+                                              http_type='http', timeout=5, instruments=[recorder]) as pep:
+                await pep.login()
+                await pep.get_device_info()
+
+        asyncio.run(run())
+        self.assertEqual([event.func for event in recorder.after], ['login', 'status.system.info'])
+        self.assertTrue(all(event.outcome == 'ok' for event in recorder.after))
+
+    def test_request_function(self):
+        self.assertEqual(instrumentation.request_function('admin.cgi', {'data': {'section': 'LAN_generic'}}), 'LAN_generic')
+        self.assertEqual(instrumentation.request_function('api.cgi', {'data': 'func=config.admin&x=1'}), 'config.admin')
+        self.assertEqual(instrumentation.request_function('firmware.cgi', {'data': object()}), 'firmware')
+
+if __name__ == '__main__':
+    unittest.main()
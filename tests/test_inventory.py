@@ -0,0 +1,69 @@
+import sys
+sys.path.insert(1, '..')
+import csv
+import json
+import os
+import tempfile
+import unittest
+
+from PepPy import fleet, inventory, mock_router
+
+class TestInventory(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer(devices=3)
+        cls.server.start()
+        cls.server.routers[0].config['config.inbound.service'] = {
+            '1': {'id': 1, 'name': 'Web', 'enable': True, 'protocol': {'type': 'TCP', 'port': 80, 'portMapper': 8080},
+                  'inboundServer': {'ip': '192.168.50.5'}, 'allowPepvpnConnection': False},
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        inventory_list = self.server.inventory() + [{'ip_address': '127.0.0.1', 'port': 1, 'username': 'admin',
+                                                     'password': 'admin', 'http_type': 'http'}]
+        self.collector = inventory.InventoryCollector(fleet.Fleet(inventory_list, timeout=5, retry_policy=None))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_csv_and_json_lines(self):
+        counts = self.collector.export(inventory.CsvWriter(self.directory.name), inventory.JsonLinesWriter(self.directory.name))
+        self.assertEqual(counts, {'devices': 4, 'wans': 6, 'port_forwarding': 1})
+
+        with open(os.path.join(self.directory.name, 'inventory_devices.csv')) as file:
+            devices = {row['router']: row for row in csv.DictReader(file)}
+        router = self.server.routers[1]
+        self.assertEqual(devices[f"127.0.0.1:{router.port}"]['serial_number'], router.serial_number)
+        self.assertEqual(devices['127.0.0.1:1']['ok'], 'False')
+
+        with open(os.path.join(self.directory.name, 'inventory_port_forwarding.jsonl')) as file:
+            rules = [json.loads(line) for line in file]
+        self.assertEqual((rules[0]['name'], rules[0]['external_port'], rules[0]['server_ip']), ('Web', '80', '192.168.50.5'))
+
+    @unittest.skipIf(inventory.pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        self.collector.export(inventory.ParquetWriter(self.directory.name, batch_size=2))
+        table = inventory.pyarrow.parquet.read_table(os.path.join(self.directory.name, 'inventory_wans.parquet'))
+        self.assertEqual(table.num_rows, 6)
+        self.assertEqual(sorted(set(table.column('imei').to_pylist()) - {None}),
+                         sorted(router.imei for router in self.server.routers))
+
+    def test_unreadable_rules_fail_the_router(self):
+        router = self.server.routers[2]
+        router.config['config.inbound.service'] = None # The mock answers with an error
+        try:
+            rows = [row for table, row in self.collector.collect() if table == 'devices']
+        finally:
+            del router.config['config.inbound.service']
+        row = {row['router']: row for row in rows}[f"127.0.0.1:{router.port}"]
+        self.assertFalse(row['ok'])
+        self.assertIn('RequestRejectedError', row['error'])
+
+if __name__ == '__main__':
+    unittest.main()
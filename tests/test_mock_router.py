@@ -0,0 +1,76 @@
+import sys
+sys.path.insert(1, '..')
+import contextlib
+import io
+import time
+import unittest
+
+from PepPy import exceptions, mock_router, peppy, resilience, templates
+
+class TestMockRouter(unittest.TestCase):
+
+    def setUp(self):
+        resilience.CircuitBreaker.reset_all()
+        self.server = mock_router.MockRouterServer(devices=2)
+        self.server.start()
+        self.router = self.server.routers[0]
+
+    def tearDown(self):
+        self.server.stop()
+
+    def __pep(self, router, **kwargs):
+        return peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=router.port, http_type='http', timeout=2, **kwargs)
+
+    def test_devices_are_distinct(self):
+        serials = {self.__pep(router).get_serial_number() for router in self.server.routers}
+        self.assertEqual(len(serials), 2)
+
+    def test_client_timeout_is_quiet(self):
+        self.router.latency = 0.3
+        pep = self.__pep(self.router, retry_policy=resilience.RetryPolicy(attempts=1))
+        pep.timeout = 0.05
+        errors = io.StringIO()
+        with contextlib.redirect_stderr(errors):
+            for _ in range(3):
+                with self.assertRaises(exceptions.RouterUnreachableError):
+                    pep.get_device_info()
+            pep.close()
+            time.sleep(0.5) # Let the router try to answer
+        self.assertEqual(errors.getvalue(), '')
+
+    def test_login_required(self):
+        pep = self.__pep(self.router, auto_login=False)
+        with self.assertRaises(KeyError):
+            pep.get_device_info()
+        self.assertTrue(pep.login())
+        self.assertEqual(pep.get_device_info()['device']['serialNumber'], self.router.serial_number)
+
+    def test_config_round_trip(self):
+        pep = self.__pep(self.router, skip_unchanged=True)
+        pep.login()
+        self.assertTrue(pep.update_time_settings(templates.TimeSettings("America/Denver")))
+        self.assertTrue(pep.apply_changes(wait_time=0))
+        second_run = self.__pep(self.router, skip_unchanged=True)
+        second_run.login()
+        requests = self.router.requests
+        self.assertTrue(second_run.update_time_settings(templates.TimeSettings("America/Denver")))
+        self.assertTrue(second_run.apply_changes(wait_time=0))
+        self.assertEqual(self.router.requests, requests + 1) # Only the config read back
+        self.assertEqual(self.router.applies, 1)
+
+    def test_injected_errors(self):
+        self.router.error_rate = 1
+        pep = self.__pep(self.router, retry_policy=resilience.RetryPolicy(attempts=2, backoff=0))
+        self.assertFalse(pep.login())
+        self.assertEqual(self.router.requests, 2)
+
+    def test_injected_timeouts(self):
+        self.router.timeout_rate = 1
+        self.router.hang_time = 1
+        pep = self.__pep(self.router, retry_policy=resilience.RetryPolicy(attempts=1))
+        pep.timeout = 0.2
+        with self.assertRaises(exceptions.RouterUnreachableError):
+            pep.login()
+
+if __name__ == '__main__':
+    unittest.main()
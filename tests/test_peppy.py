@@ -1,12 +1,47 @@
 import sys
-sys.path.insert(1, '../src')
-import peppy, templates
+sys.path.insert(1, '..')
+from PepPy import exceptions, firmware, mock_router, peppy, resilience, templates
+import concurrent.futures
 import httpretty
+import json
+import os
+import tempfile
+import time
 import unittest
 
+DEVICE_INFO = {
+    'stat': 'ok',
+    'response': {
+        'device': {'name': 'Test', 'model': 'MAX BR1', 'productCode': 'MAX-BR1-MINI', 'serialNumber': '1111-2222-3333',
+                   'firmwareVersion': '8.1.0'},
+        'macInfo': [{'mac': '00:1A:DD:00:00:01'}],
+        'uptime': {'string': '1 day'},
+        'cpuLoad': {'string': '5%'},
+        'systemTime': {'timezone': 'UTC'}
+    }
+}
+
+WAN_STATUS = {
+    'stat': 'ok',
+    'response': {
+        'order': [1, 2],
+        '1': {'name': 'WAN'},
+        '2': {'name': 'Cellular', 'cellular': {'imei': '350000000000001', 'sim': {'1': {'apn': 'firstnet'}}}}
+    }
+}
+
+TIME_CONFIG = {
+    'stat': 'ok',
+    'response': {'timeZone': 'Test', 'syncSource': 'server', 'timeServer': '0.peplink.pool.ntp.org'}
+}
+
+UNAUTHORIZED = '{"stat": "fail", "code": 401, "message": "Unauthorized"}'
+
 class TestPepPy(unittest.TestCase):
 
     def setUp(self):
+        resilience.CircuitBreaker.reset_all()
+        resilience.RequestGovernor.reset_all()
         self.pep = peppy.PepPy('admin', 'admin')
     
     def __assert_response(func):
@@ -81,9 +116,327 @@ class TestPepPy(unittest.TestCase):
     def test_update_firmware(self):
         self.__send_firmware_mock(self.pep.update_firmware, "Test.txt")
 
+    @httpretty.activate(allow_net_connect=False)
+    def test_update_firmware_streams_file(self):
+        bodies = []
+        def record(request, uri, response_headers):
+            bodies.append(request.body)
+            return [200, response_headers, '<status>\n1\n</status>']
+
+        httpretty.register_uri(httpretty.POST, "https://192.168.50.1/cgi-bin/MANGA/firmware.cgi", body=record)
+        progress = []
+        image = firmware.FirmwareImage("Test.txt", use_mmap=True)
+        self.assertTrue(self.pep.update_firmware(image, progress=lambda sent, total: progress.append((sent, total)),
+                                                 bandwidth_limit=1024 * 1024))
+        self.assertIn(b'name="upfile"; filename="Test.txt"', bodies[0])
+        self.assertIn(b'This is just for test purposes', bodies[0])
+        self.assertEqual(progress[-1][0], progress[-1][1])
+        self.assertEqual(progress[-1][1], len(bodies[0]))
+
+    def test_firmware_changed_during_upload(self):
+        with tempfile.NamedTemporaryFile('wb', delete=False) as image_file:
+            image_file.write(b'firmware v1')
+        try:
+            image = firmware.FirmwareImage(image_file.name)
+            image.sha256
+            stat = os.stat(image_file.name)
+            with open(image_file.name, 'wb') as changed:
+                changed.write(b'firmware v2')
+            os.utime(image_file.name, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            with firmware.MultipartEncoder(image) as body:
+                with self.assertRaises(exceptions.FirmwareChecksumError):
+                    body.read()
+        finally:
+            os.remove(image_file.name)
+
     def test_edit_lan(self):
         lp = templates.LanProfile(0)
         self.__send_admin_mock(self.pep.edit_lan, lp)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_device_info_fetched_once(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=json.dumps(DEVICE_INFO))
+        self.assertEqual(self.pep.get_serial_number(), '1111-2222-3333')
+        self.assertEqual(self.pep.get_mac_address(), '00:1A:DD:00:00:01')
+        self.assertEqual(self.pep.get_device_model(), 'MAX-BR1-MINI')
+        self.assertEqual(self.pep.get_uptime(), '1 day')
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_volatile_device_info_expires(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=json.dumps(DEVICE_INFO))
+        pep = peppy.PepPy('admin', 'admin', device_info_ttl=0)
+        pep.get_serial_number()
+        pep.get_serial_number()
+        pep.get_cpu_load()
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_device_snapshot_and_refresh(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=json.dumps(DEVICE_INFO))
+        snapshot = self.pep.get_device_snapshot()
+        self.assertEqual(snapshot.firmware_version, '8.1.0')
+        self.assertEqual(snapshot.as_dict()['timezone'], 'UTC')
+        self.assertIs(self.pep.get_device_snapshot(), snapshot)
+        self.assertIsNot(self.pep.refresh(), snapshot)
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_wan_status_fetched_once(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=json.dumps(WAN_STATUS))
+        self.assertEqual(self.pep.get_imei(), '350000000000001')
+        self.assertEqual(self.pep.get_main_apn(), 'firstnet')
+        self.assertIsNone(self.pep.get_secondary_apn())
+        self.assertEqual(self.pep.get_wan_status().ids, ['1', '2'])
+        self.assertFalse(self.pep.get_wan_status().wan(1).is_cellular)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        self.pep.get_wan_status(max_age=0)
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_apply_changes_until_ready(self):
+        httpretty.register_uri(httpretty.POST, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body='{"stat": "ok"}')
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi",
+                               responses=[httpretty.Response(body='rebooting'), httpretty.Response(body=json.dumps(DEVICE_INFO))])
+        self.assertTrue(self.pep.apply_changes(wait_until_ready=True, ready_timeout=5))
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_wait_until_ready_timeout(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body='rebooting')
+        with self.assertRaises(exceptions.RouterNotReadyError):
+            self.pep.wait_until_ready(timeout=0.3, poll_interval=0.05)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_wait_until_ready_waits_for_restart(self):
+        up = httpretty.Response(body=json.dumps(DEVICE_INFO))
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi",
+                               responses=[up, up, httpretty.Response(body='rebooting'), up])
+        self.pep.wait_until_ready(timeout=5, poll_interval=0.01)
+        # The answers from before the outage did not count
+        self.assertEqual(len(httpretty.latest_requests()), 5)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_wait_until_ready_uptime_reset(self):
+        def info(uptime):
+            response = json.loads(json.dumps(DEVICE_INFO))
+            response['response']['uptime']['second'] = uptime
+            return httpretty.Response(body=json.dumps(response))
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi",
+                               responses=[info(3600), info(3601), info(2)])
+        self.pep.wait_until_ready(timeout=5, poll_interval=0.01)
+        self.assertEqual(len(httpretty.latest_requests()), 4)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_wait_until_ready_min_delay(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=json.dumps(DEVICE_INFO))
+        self.assertGreaterEqual(self.pep.wait_until_ready(timeout=5, poll_interval=0.01, min_delay=0.2), 0.2)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_wait_until_ready_ignores_breaker(self):
+        busy = httpretty.Response(body='busy', status=503)
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi",
+                               responses=[busy, busy, busy, httpretty.Response(body=json.dumps(DEVICE_INFO))])
+        pep = peppy.PepPy('admin', 'admin', failure_threshold=1, failure_cooldown=30,
+                          retry_policy=resilience.RetryPolicy(attempts=1))
+        self.assertLess(pep.wait_until_ready(timeout=5, poll_interval=0.01), 5)
+        self.assertEqual(resilience.CircuitBreaker.for_router('192.168.50.1:443').state, resilience.CircuitBreaker.CLOSED)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_transaction_applies_once(self):
+        bodies = []
+        def record(body):
+            def callback(request, uri, response_headers):
+                bodies.append(request.body.decode())
+                return [200, response_headers, body]
+            return callback
+
+        httpretty.register_uri(httpretty.POST, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=record('{"stat": "ok"}'))
+        httpretty.register_uri(httpretty.POST, "https://192.168.50.1/cgi-bin/MANGA/admin.cgi", body=record('<status>\n1\n</status>'))
+        with self.pep.transaction(wait_time=0) as transaction:
+            self.pep.update_admin_settings(templates.AdminSettings("Test"))
+            self.pep.edit_lan(templates.LanProfile("Test"))
+            self.pep.update_time_settings(templates.TimeSettings("Test"))
+            self.assertEqual(len(bodies), 0)
+
+        self.assertTrue(transaction.ok)
+        self.assertEqual([name for name, _ in transaction.results], ['update_admin_settings', 'edit_lan', 'update_time_settings'])
+        self.assertEqual(len(bodies), 4)
+        self.assertIn('config.time', bodies[0])
+        self.assertIn('LAN_network_modify', bodies[1])
+        self.assertIn('config.admin', bodies[2])
+        self.assertIn('cmd.config.apply', bodies[3])
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_transaction_discarded_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with self.pep.transaction(wait_time=0):
+                self.pep.update_time_settings(templates.TimeSettings("Test"))
+                raise RuntimeError
+        self.assertEqual(len(httpretty.latest_requests()), 0)
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_skip_unchanged(self):
+        posts = []
+        def record(request, uri, response_headers):
+            posts.append(request.body.decode())
+            return [200, response_headers, '{"stat": "ok"}']
+
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=json.dumps(TIME_CONFIG))
+        httpretty.register_uri(httpretty.POST, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=record)
+        pep = peppy.PepPy('admin', 'admin', skip_unchanged=True)
+        self.assertTrue(pep.update_time_settings(templates.TimeSettings("Test")))
+        self.assertTrue(pep.apply_changes(wait_time=0))
+        self.assertEqual(posts, [])
+
+        self.assertTrue(pep.update_time_settings(templates.TimeSettings("America/Denver")))
+        self.assertTrue(pep.apply_changes(wait_time=0))
+        self.assertEqual(len(posts), 2)
+        self.assertIn('cmd.config.apply', posts[1])
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_device_field_without_info(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body='{"stat": "ok", "response": null}')
+        self.assertIsNone(self.pep.get_serial_number())
+
+    def test_template_differs_from(self):
+        ts = templates.TimeSettings("Test")
+        self.assertFalse(ts.differs_from(TIME_CONFIG['response']))
+        self.assertTrue(ts.differs_from({'timeZone': 'Test'}))
+        cs = templates.CellularSettings(mtu=1500)
+        self.assertTrue(cs.differs_from(cs.current_config({'2': {'physical': {'mtu': 1342}}})))
+        self.assertFalse(templates.LanProfile("Test").readable)
+
+        # Email settings send null to turn authentication off
+        email = templates.EmailSettings('smtp.example.com', None, 25, 'a@example.com', ['b@example.com'])
+        current = {key: value for key, value in email.params.items() if key != 'func'}
+        self.assertFalse(email.differs_from(current))
+        self.assertTrue(email.differs_from(dict(current, authentication={'user': 'u', 'password': 'p'})))
+        self.assertTrue(email.differs_from({key: value for key, value in current.items() if key != 'authentication'}))
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_skip_unchanged_applies_direct_writes(self):
+        posts = []
+        def record(request, uri, response_headers):
+            posts.append(request.body.decode())
+            return [200, response_headers, '{"stat": "ok"}']
+
+        httpretty.register_uri(httpretty.POST, "https://192.168.50.1/cgi-bin/MANGA/admin.cgi", body='<status>\n1\n</status>')
+        httpretty.register_uri(httpretty.POST, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=record)
+        pep = peppy.PepPy('admin', 'admin', skip_unchanged=True)
+        pep.change_ap_ssid('Test')
+        self.assertTrue(pep.apply_changes(wait_time=0))
+        self.assertEqual(len(posts), 1)
+        self.assertIn('cmd.config.apply', posts[0])
+
+    def test_unreachable(self):
+        pep = peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=9, http_type='http',
+                          retry_policy=resilience.RetryPolicy(attempts=2, backoff=0))
+        with self.assertRaises(exceptions.RouterUnreachableError):
+            pep.get_device_info()
+
+    def test_circuit_breaker_fails_fast(self):
+        def unreachable_pep():
+            return peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=9, http_type='http', failure_threshold=2,
+                               retry_policy=resilience.RetryPolicy(attempts=1))
+
+        for _ in range(2):
+            with self.assertRaises(exceptions.RouterUnreachableError):
+                unreachable_pep().get_device_info()
+        with self.assertRaises(exceptions.CircuitOpenError):
+            unreachable_pep().get_device_info()
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_circuit_breaker_counts_retryable_status(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body='busy', status=503)
+        pep = peppy.PepPy('admin', 'admin', failure_threshold=1, retry_policy=resilience.RetryPolicy(attempts=1))
+        pep.get_config('config.time')
+        with self.assertRaises(exceptions.CircuitOpenError):
+            pep.get_config('config.time')
+
+    def test_circuit_breaker_half_open(self):
+        breaker = resilience.CircuitBreaker(failure_threshold=1, cooldown=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, resilience.CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, resilience.CircuitBreaker.CLOSED)
+
+    def test_token_bucket(self):
+        bucket = resilience.TokenBucket(rate=20, burst=1)
+        self.assertTrue(bucket.acquire())
+        self.assertFalse(bucket.acquire(timeout=0))
+        start = time.monotonic()
+        self.assertTrue(bucket.acquire(timeout=1))
+        self.assertGreater(time.monotonic() - start, 0.03)
+
+    def test_governor_limits(self):
+        governor = resilience.RequestGovernor(max_concurrent=1)
+        with governor.slot():
+            with self.assertRaises(exceptions.RouterBusyError):
+                with governor.slot(timeout=0.05):
+                    pass
+        with governor.slot(timeout=0):
+            pass
+
+        resilience.RequestGovernor.set_global_limit(1)
+        with resilience.RequestGovernor.global_slot():
+            with self.assertRaises(exceptions.RouterBusyError):
+                with resilience.RequestGovernor(max_concurrent=2).slot(timeout=0.05):
+                    pass
+
+    def test_max_concurrent_shared_by_instances(self):
+        with mock_router.MockRouterServer(latency=0.3) as server:
+            router = server.inventory()[0]
+
+            def serial_number():
+                pep = peppy.PepPy('admin', 'admin', ip_address=router['ip_address'], port=router['port'], http_type='http',
+                                  timeout=5, max_concurrent=1, queue_timeout=0.1)
+                with pep:
+                    return pep.get_serial_number()
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [executor.submit(serial_number) for _ in range(2)]
+                errors = [future.exception() for future in futures]
+            self.assertEqual(sum(isinstance(error, exceptions.RouterBusyError) for error in errors), 1)
+
+    def test_timed_out_post_sent_once(self):
+        with mock_router.MockRouterServer() as server:
+            router = server.inventory()[0]
+            pep = peppy.PepPy('admin', 'admin', ip_address=router['ip_address'], port=router['port'], http_type='http',
+                              retry_policy=resilience.RetryPolicy(attempts=3, backoff=0), failure_threshold=None)
+            self.assertTrue(pep.login())
+            server.routers[0].latency = 0.8
+            with self.assertRaises(exceptions.RouterUnreachableError):
+                pep.add_port_forwarding_rule(templates.PortForwarding('Web', '192.168.50.5', external_port=80, enable_wan=True))
+            time.sleep(1) # Let the router finish the request that timed out
+            self.assertEqual(len(server.routers[0].config['config.inbound.service']), 1)
+            pep.close()
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_retry_on_status(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi",
+                               responses=[httpretty.Response(body='busy', status=503), httpretty.Response(body=json.dumps(DEVICE_INFO))])
+        pep = peppy.PepPy('admin', 'admin', retry_policy=resilience.RetryPolicy(backoff=0))
+        self.assertEqual(pep.get_serial_number(), '1111-2222-3333')
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_login_again_when_session_expired(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi",
+                               responses=[httpretty.Response(body=UNAUTHORIZED), httpretty.Response(body=json.dumps(DEVICE_INFO))])
+        httpretty.register_uri(httpretty.POST, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body='{"stat": "ok"}',
+                               set_cookie='bauth=Test')
+        self.assertEqual(self.pep.get_serial_number(), '1111-2222-3333')
+        self.assertEqual(self.pep.cookies['bauth'], 'Test')
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_rejected(self):
+        httpretty.register_uri(httpretty.GET, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=UNAUTHORIZED)
+        httpretty.register_uri(httpretty.POST, "https://192.168.50.1/cgi-bin/MANGA/api.cgi", body=UNAUTHORIZED)
+        with self.assertRaises(exceptions.RequestRejectedError):
+            self.pep.get_device_info()
+        # The router answered, it did not fail
+        self.assertEqual(resilience.CircuitBreaker.for_router('192.168.50.1:443').failures, 0)
         
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+import sys
+sys.path.insert(1, '..')
+import os
+import json
+import tempfile
+import time
+import unittest
+
+from PepPy import fleet, mock_router, poller
+
+class TestPoller(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer(devices=2)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.routers = fleet.Fleet(self.server.inventory(), timeout=5)
+        self.keys = [device.key for device in self.routers.devices]
+        self.router = self.server.routers[0]
+
+    def test_samples_and_ring_buffer(self):
+        samples = list()
+        pep_poller = poller.Poller(self.routers, min_interval=0.01, buffer_size=2, sinks=[samples.extend])
+        for _ in range(3):
+            pep_poller.poll(self.keys[0])
+        pep_poller.stop()
+
+        metrics = {sample.metric for sample in samples}
+        self.assertTrue({'reachable', 'cpu_load', 'uptime', 'wan.1.up', 'wan.2.up', 'wan.2.signal_level'} <= metrics)
+        self.assertEqual(len(pep_poller.series(self.keys[0], 'cpu_load')), 2)
+        self.assertEqual(pep_poller.series(self.keys[0], 'wan.2.signal_level')[-1][1], 4)
+
+    def test_adaptive_interval(self):
+        pep_poller = poller.Poller(self.routers, interval=1, min_interval=0.5, max_interval=4, cpu_change=100)
+        for expected in (2, 4, 4):
+            pep_poller.poll(self.keys[0])
+            self.assertEqual(pep_poller.current_interval(self.keys[0]), expected)
+
+        original = self.router.wan_connection
+        self.router.wan_connection = lambda: dict(original(), **{'1': {'name': 'WAN', 'message': 'Disconnected'}})
+        try:
+            pep_poller.poll(self.keys[0])
+        finally:
+            del self.router.wan_connection
+        self.assertEqual(pep_poller.current_interval(self.keys[0]), 0.5)
+        pep_poller.stop()
+
+    def test_unreachable_router_backs_off(self):
+        routers = fleet.Fleet([{'ip_address': '127.0.0.1', 'port': 1, 'username': 'admin', 'password': 'admin', 'http_type': 'http'}],
+                              timeout=0.2)
+        pep_poller = poller.Poller(routers, interval=1, max_interval=3)
+        samples = pep_poller.poll('127.0.0.1:1')
+        self.assertEqual([(sample.metric, sample.value) for sample in samples], [('reachable', 0)])
+        self.assertEqual(pep_poller.current_interval('127.0.0.1:1'), 2)
+        pep_poller.stop()
+
+    def test_failed_login_is_not_kept(self):
+        device = self.routers.devices[1]
+        device.password = 'wrong'
+        pep_poller = poller.Poller(self.routers, interval=1, max_interval=3)
+        samples = pep_poller.poll(device.key)
+        self.assertEqual([(sample.metric, sample.value) for sample in samples], [('reachable', 0)])
+
+        device.password = 'admin'
+        self.assertIn(('reachable', 1), [(sample.metric, sample.value) for sample in pep_poller.poll(device.key)])
+        pep_poller.stop()
+
+    def test_run_polls_every_router_with_sink(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'samples.jsonl')
+            pep_poller = poller.Poller(self.routers, min_interval=0.05, interval=0.05, sinks=[poller.JsonLinesSink(path)])
+            pep_poller.start()
+            time.sleep(0.5)
+            pep_poller.stop()
+            with open(path) as file:
+                routers = {json.loads(line)['router'] for line in file}
+        self.assertEqual(routers, set(self.keys))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import sys
+sys.path.insert(1, '..')
+import unittest
+
+from PepPy import exceptions, mock_router, peppy, port_forwarding, templates
+
+def rule(name, port, ip='192.168.50.5', protocol='TCP'):
+    return templates.PortForwarding(name, ip, protocol=protocol, external_port=port, enable_wan=True)
+
+class TestRuleTable(unittest.TestCase):
+
+    def test_indexes(self):
+        table = port_forwarding.RuleTable([rule('Web', 80), rule('Range', '8000-8010', ip='192.168.50.6'), rule('Dns', 53, protocol='UDP')])
+        self.assertEqual(table.get('Web')['name'], 'Web')
+        self.assertEqual(table.find_port('TCP', 8005)['name'], 'Range')
+        self.assertIsNone(table.find_port('UDP', 80))
+        self.assertEqual([r['name'] for r in table.for_server('192.168.50.5')], ['Web', 'Dns'])
+
+        table.remove('Web')
+        self.assertNotIn('Web', table)
+        self.assertIsNone(table.find_port('TCP', 80))
+        self.assertEqual(len(table), 2)
+
+    def test_conflicts(self):
+        table = port_forwarding.RuleTable([rule('Range', '8000-8010')])
+        self.assertEqual([r['name'] for r in table.conflicts(rule('Other', 8008))], ['Range'])
+        self.assertEqual(table.conflicts(rule('Other', 8008, protocol='UDP')), [])
+        with self.assertRaises(exceptions.PortForwardingConflictError):
+            table.add(rule('Range', 9000))
+
+class TestSyncPortForwarding(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer()
+        cls.server.start()
+        cls.router = cls.server.routers[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.router.config.pop('config.inbound.service', None)
+        self.pep = peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=self.router.port, http_type='http', timeout=5)
+        self.pep.login()
+
+    def tearDown(self):
+        self.pep.close()
+
+    def __rules(self):
+        return {r['name']: r for r in self.pep.get_port_forwarding().values()}
+
+    def test_sync_batches_changes(self):
+        self.assertTrue(self.pep.sync_port_forwarding([rule(f"Rule {index}", 1000 + index) for index in range(50)]))
+        self.assertEqual(len(self.__rules()), 50)
+
+        desired = [rule(f"Rule {index}", 1000 + index) for index in range(1, 50)]
+        desired[0] = rule("Rule 1", 1001, ip='192.168.50.9')
+        desired.append(rule("New", 2000))
+        requests = self.router.requests
+        self.assertTrue(self.pep.sync_port_forwarding(desired))
+        self.assertEqual(self.router.requests - requests, 4) # Read back, remove, update and add
+
+        rules = self.__rules()
+        self.assertNotIn("Rule 0", rules)
+        self.assertEqual(rules["Rule 1"]['inboundServer']['ip'], '192.168.50.9')
+        self.assertIn("New", rules)
+        self.assertEqual(len(rules), 50)
+
+    def test_sync_without_changes_sends_nothing(self):
+        desired = [rule("Web", 80)]
+        self.pep.sync_port_forwarding(desired)
+        requests = self.router.requests
+        self.assertTrue(self.pep.sync_port_forwarding(desired))
+        self.assertEqual(self.router.requests - requests, 1)
+
+    def test_sync_stops_when_rules_can_not_be_read(self):
+        self.pep.sync_port_forwarding([rule("Web", 80)])
+        pep = peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=self.router.port, http_type='http', timeout=5,
+                          auto_login=False)
+        with pep:
+            with self.assertRaises(exceptions.RequestRejectedError):
+                pep.sync_port_forwarding([rule("Web", 80)])
+        self.assertEqual([r['name'] for r in self.pep.get_port_forwarding().values()], ['Web'])
+
+    def test_conflicting_desired_rules(self):
+        with self.assertRaises(exceptions.PortForwardingConflictError):
+            self.pep.sync_port_forwarding([rule("Web", 80), rule("Other", 80)])
+
+    def test_table_from_router(self):
+        self.pep.sync_port_forwarding([rule("Web", 80)])
+        table = self.pep.get_port_forwarding_table(use_cache=False)
+        self.assertEqual(table.find_port('TCP', 80)['id'], int(next(iter(self.pep.get_port_forwarding()))))
+
+if __name__ == '__main__':
+    unittest.main()
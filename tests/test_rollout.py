@@ -0,0 +1,85 @@
+import sys
+sys.path.insert(1, '..')
+import unittest
+
+from PepPy import exceptions, fleet, mock_router, resilience, rollout
+
+class TestRollout(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer(devices=6)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        for router in self.server.routers:
+            router.firmware_version = '8.1.0'
+            router.next_firmware_version = '8.2.0'
+            router.reject_firmware = False
+            router.latency = 0.0
+            router.reboot_time = 0.0
+        self.fleet = fleet.Fleet(self.server.inventory(), timeout=5)
+
+    def tearDown(self):
+        resilience.CircuitBreaker.reset_all()
+
+    def __rollout(self, **kwargs):
+        return rollout.Rollout(self.fleet, "Test.txt", '8.2.0', poll_interval=0.01, ready_timeout=5, **kwargs)
+
+    def test_plan(self):
+        waves = self.__rollout(canary=1, waves=(50, 100)).plan()
+        self.assertEqual([len(wave) for wave in waves], [1, 2, 3])
+
+    def test_upgrades_every_router(self):
+        results = list(self.__rollout(waves=(50, 100)).run())
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(result.value == '8.2.0' for result in results))
+        self.assertTrue(all(router.firmware_version == '8.2.0' for router in self.server.routers))
+
+    def test_halts_on_canary_failure(self):
+        self.server.routers[0].reject_firmware = True
+        upgrade = self.__rollout()
+        with self.assertRaises(exceptions.RolloutHaltedError):
+            list(upgrade.run())
+        self.assertTrue(upgrade.halted)
+        self.assertTrue(all(router.firmware_version == '8.1.0' for router in self.server.routers))
+
+    def test_halt_waits_for_routers_in_flight(self):
+        self.server.routers[0].reject_firmware = True
+        self.server.routers[1].latency = 0.2
+        upgrade = self.__rollout(canary=2, max_in_flight=2)
+        with self.assertRaises(exceptions.RolloutHaltedError):
+            list(upgrade.run())
+        # The second canary was flashing when the first one failed
+        self.assertEqual(len(upgrade.results), 2)
+        self.assertEqual([result.value for result in upgrade.results if result.ok], ['8.2.0'])
+        self.assertTrue(all(router.firmware_version == '8.1.0' for router in self.server.routers[2:]))
+
+    def test_halts_when_a_wave_fails(self):
+        self.server.routers[1].reject_firmware = True
+        upgrade = self.__rollout(waves=(50, 100))
+        with self.assertRaises(exceptions.RolloutHaltedError):
+            list(upgrade.run())
+        self.assertEqual(len(upgrade.results), 3)
+        self.assertTrue(all(router.firmware_version == '8.1.0' for router in self.server.routers[3:]))
+
+    def test_rate_is_checked_against_the_whole_wave(self):
+        self.server.routers[1].reject_firmware = True
+        self.server.routers[2].latency = 0.1 # The failure comes first in its wave
+        results = list(self.__rollout(waves=(50, 100), max_failure_rate=0.4).run())
+        self.assertEqual(len(results), 6)
+        self.assertEqual(sum(result.ok for result in results), 5)
+
+    def test_reboot_does_not_open_circuit_breaker(self):
+        self.server.routers[0].reboot_time = 0.5
+        self.fleet = fleet.Fleet(self.server.inventory()[:1], timeout=5, failure_threshold=2, failure_cooldown=30,
+                                 retry_policy=resilience.RetryPolicy(attempts=1))
+        results = list(self.__rollout().run())
+        self.assertEqual(results[0].value, '8.2.0')
+
+if __name__ == '__main__':
+    unittest.main()
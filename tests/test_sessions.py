@@ -0,0 +1,83 @@
+import sys
+sys.path.insert(1, '..')
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+from PepPy import mock_router, peppy, sessions
+
+class TestSessionStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer()
+        cls.server.start()
+        cls.router = cls.server.routers[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sessions.db')
+        self.router.sessions.clear()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def __pep(self, store=None):
+        return peppy.PepPy('admin', 'admin', ip_address='127.0.0.1', port=self.router.port, http_type='http', timeout=5,
+                           session_store=store or self.path)
+
+    def test_store_expiry(self):
+        store = sessions.SessionStore(self.path)
+        store.put('a', {'bauth': '1'})
+        store.put('b', {'bauth': '2'}, expires=time.time() - 1)
+        self.assertEqual(store.get('a'), {'bauth': '1'})
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.purge(), 1)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_discard_keeps_newer_session(self):
+        store = sessions.SessionStore(self.path)
+        store.put('a', {'bauth': 'new'})
+        store.discard('a', {'bauth': 'old'})
+        self.assertEqual(store.get('a'), {'bauth': 'new'})
+        store.discard('a', {'bauth': 'new'})
+        self.assertIsNone(store.get('a'))
+
+    def test_second_client_reuses_session(self):
+        with self.__pep() as first:
+            self.assertTrue(first.login())
+        with self.__pep() as second:
+            self.assertTrue(second.login())
+            self.assertEqual(second.get_serial_number(), self.router.serial_number)
+        self.assertEqual(len(self.router.sessions), 1)
+
+    def test_expired_session_logs_in_again(self):
+        store = sessions.SessionStore(self.path)
+        with self.__pep(store) as pep:
+            pep.login()
+            old = store.get(f"127.0.0.1:{self.router.port}:admin")
+            self.router.sessions.clear()
+            self.assertEqual(pep.get_serial_number(), self.router.serial_number)
+        self.assertNotEqual(store.get(f"127.0.0.1:{self.router.port}:admin"), old)
+
+    def test_shared_between_threads_and_processes(self):
+        store = sessions.SessionStore(self.path)
+        threads = [threading.Thread(target=store.put, args=(f"key{index}", {'bauth': str(index)})) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        script = ("import sys; sys.path.insert(1, '..'); from PepPy import sessions; "
+                  f"print(sessions.SessionStore({self.path!r}).get('key3')['bauth'])")
+        self.assertEqual(subprocess.check_output([sys.executable, '-c', script], text=True).strip(), '3')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import sys
+sys.path.insert(1, '..')
+import os
+import tempfile
+import unittest
+
+from PepPy import fleet, mock_router, snapshots, templates
+
+class TestDiff(unittest.TestCase):
+
+    def test_diff_sections(self):
+        old = {'config.time': {'timeZone': 'UTC', 'syncSource': 'server'}, 'config.notify': {'enable': True}}
+        new = {'config.time': {'timeZone': 'Europe/Paris', 'syncSource': 'server'}, 'config.ap.profile': {'1': {}}}
+        changes = snapshots.diff_sections(old, new)
+        self.assertEqual(changes, [
+            snapshots.Change('config.ap.profile', (), None, {'1': {}}),
+            snapshots.Change('config.notify', (), {'enable': True}, None),
+            snapshots.Change('config.time', ('timeZone',), 'UTC', 'Europe/Paris'),
+        ])
+        self.assertEqual([change.kind for change in changes], ['added', 'removed', 'changed'])
+
+class TestSnapshotStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer(devices=2)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = snapshots.SnapshotStore(self.directory.name)
+        self.fleet = fleet.Fleet(self.server.inventory(), timeout=5)
+        for router in self.server.routers:
+            router.config['config.time'] = {'timeZone': 'UTC', 'syncSource': 'server'}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def __objects(self):
+        return sum(len(files) for _, _, files in os.walk(os.path.join(self.directory.name, 'objects')))
+
+    def test_backup_is_incremental(self):
+        first = [result.value for result in self.store.backup(self.fleet)]
+        self.assertEqual(len(first), 2)
+        # Both routers have the same configuration, it is stored once
+        self.assertEqual(sum(snapshot.written for snapshot in first), self.__objects())
+        self.assertEqual(len(first[0].sections), len(snapshots.SECTIONS))
+
+        second = [result.value for result in self.store.backup(self.fleet)]
+        self.assertEqual(sum(snapshot.written for snapshot in second), 0)
+        router = self.server.inventory()[0]
+        key = f"{router['ip_address']}:{router['port']}"
+        self.assertEqual(len(self.store.snapshots(key)), 2)
+        self.assertEqual(sorted(self.store.routers()), sorted(snapshot.router for snapshot in first))
+
+    def test_diff(self):
+        device = self.fleet.devices[0]
+        with self.fleet.client(device) as pep:
+            pep.login()
+            before = self.store.take(pep, device.key)
+            pep.update_time_settings(templates.TimeSettings('Europe/Paris'))
+            self.assertEqual(self.store.diff_live(pep, device.key),
+                             [snapshots.Change('config.time', ('timeServer',), None, '0.peplink.pool.ntp.org'),
+                              snapshots.Change('config.time', ('timeZone',), 'UTC', 'Europe/Paris')])
+            after = self.store.take(pep, device.key)
+
+        self.assertEqual(after.written, 1)
+        self.assertEqual([change.path for change in self.store.diff(before, after)], [('timeServer',), ('timeZone',)])
+        self.assertEqual(self.store.restore_sections(after)['config.time']['timeZone'], 'Europe/Paris')
+
+    def test_prune(self):
+        device = self.fleet.devices[0]
+        with self.fleet.client(device) as pep:
+            pep.login()
+            self.store.take(pep, device.key)
+            pep.update_time_settings(templates.TimeSettings('Europe/Paris'))
+            latest = self.store.take(pep, device.key)
+
+        self.assertEqual(self.store.prune(keep=1), 1)
+        self.assertEqual(self.store.snapshots(device.key), [latest.id])
+        self.assertEqual(self.store.restore_sections(latest)['config.time']['timeZone'], 'Europe/Paris')
+
+if __name__ == '__main__':
+    unittest.main()
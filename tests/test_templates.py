@@ -0,0 +1,99 @@
+import sys
+sys.path.insert(1, '..')
+import copy
+import json
+import pickle
+import unittest
+import urllib.parse
+
+from PepPy import instrumentation, mock_router, peppy, templates
+
+class TestTemplates(unittest.TestCase):
+
+    def test_immutable(self):
+        time_settings = templates.TimeSettings('America/Denver')
+        with self.assertRaises(AttributeError):
+            time_settings.params = {}
+        with self.assertRaises(TypeError):
+            time_settings['timeZone'] = 'Europe/Paris'
+        with self.assertRaises(TypeError):
+            time_settings.params['timeZone'] = 'Europe/Paris'
+        with self.assertRaises(TypeError):
+            templates.CellularSettings().params['list'][0]['cellular'].update(mtu=1400)
+        self.assertFalse(hasattr(time_settings, '__dict__'))
+
+    def test_replace(self):
+        time_settings = templates.TimeSettings('America/Denver')
+        changed = time_settings.replace(timeZone='Europe/Paris')
+        self.assertIsInstance(changed, templates.TimeSettings)
+        self.assertEqual(changed['timeZone'], 'Europe/Paris')
+        self.assertEqual(time_settings['timeZone'], 'America/Denver')
+        self.assertEqual(changed['timeServer'], time_settings['timeServer'])
+
+    def test_body(self):
+        time_settings = templates.TimeSettings('America/Denver', timeServer=None)
+        self.assertIs(time_settings.body, time_settings.body)
+        self.assertEqual(json.loads(time_settings.body), {'timeZone': 'America/Denver', 'syncSource': 'server',
+                                                          'func': 'config.time'})
+        self.assertEqual(time_settings.content_type, 'application/json')
+
+        # Email and cellular settings send null on purpose
+        email = templates.EmailSettings('smtp.example.com', None, 25, 'a@example.com', ['b@example.com'])
+        self.assertIsNone(json.loads(email.body)['authentication'])
+
+    def test_admin_body(self):
+        admin = templates.AdminSettings('Router', https_access='http+https')
+        body = admin.body.decode()
+        self.assertIn('accessProtocol_https_access=http+https', body)
+        self.assertNotIn('None', body)
+        self.assertEqual(admin.content_type, 'application/x-www-form-urlencoded')
+        self.assertEqual(urllib.parse.parse_qs(body)['func'], ['config.admin'])
+
+    def test_request_function(self):
+        body = templates.TimeSettings('America/Denver').body
+        self.assertEqual(instrumentation.request_function('api.cgi', {'data': body}), 'config.time')
+        body = templates.GenericLan().body
+        self.assertEqual(instrumentation.request_function('admin.cgi', {'data': body}), 'LAN_generic_modify')
+
+    def test_pickle_and_copy(self):
+        email = templates.EmailSettings('smtp.example.com', None, 25, 'a@example.com', ['b@example.com'],
+                                        username='u', password='p')
+        for restored in (pickle.loads(pickle.dumps(email)), copy.copy(email), copy.deepcopy(email)):
+            self.assertIsInstance(restored, templates.EmailSettings)
+            self.assertEqual(restored.params, email.params)
+            self.assertEqual(restored.body, email.body)
+        self.assertEqual(pickle.loads(pickle.dumps(email.params)), email.params)
+
+        params = copy.deepcopy(email.params)
+        params['authentication']['user'] = 'other'
+        self.assertEqual(email['authentication']['user'], 'u')
+        self.assertEqual(copy.copy(email.params), email.params)
+
+    def test_clean_params_copies(self):
+        params = {'a': None, 'b': {'c': None, 'd': 1}}
+        self.assertEqual(peppy.clean_params(params), {'b': {'d': 1}})
+        self.assertEqual(params, {'a': None, 'b': {'c': None, 'd': 1}})
+
+class TestSharedTemplate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mock_router.MockRouterServer(devices=2)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_push_to_many_routers(self):
+        time_settings = templates.TimeSettings('Europe/Paris')
+        for device, router in zip(self.server.inventory(), self.server.routers):
+            pep = peppy.PepPy(device['username'], device['password'], ip_address=device['ip_address'],
+                              port=device['port'], http_type=device['http_type'], timeout=2)
+            self.assertTrue(pep.login())
+            self.assertTrue(pep.update_time_settings(time_settings))
+            self.assertEqual(router.config['config.time']['timeZone'], 'Europe/Paris')
+            pep.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import sys
+sys.path.insert(1, '..')
+import asyncio
+import copy
+import unittest
+
+from PepPy import exceptions, fleet, mock_router, watcher
+
+def snapshot(message='Connected', imei='350000000000001', signal=4, apn='mock.apn', active='1'):
+    return {
+        'order': [1, 2],
+        '1': {'name': 'WAN', 'message': 'Connected'},
+        '2': {'name': 'Cellular', 'message': message,
+              'cellular': {'imei': imei, 'signalLevel': signal,
+                           'sim': {'1': {'apn': apn, 'active': active == '1'}, '2': {'apn': None, 'active': active == '2'}}}},
+    }
+
+class TestWanWatcher(unittest.TestCase):
+
+    def test_first_snapshot_is_baseline(self):
+        wan_watcher = watcher.WanWatcher()
+        self.assertEqual(wan_watcher.update('r', snapshot()), [])
+        self.assertEqual(wan_watcher.update('r', snapshot()), [])
+
+    def test_typed_events(self):
+        wan_watcher = watcher.WanWatcher(signal_thresholds=(2, 3))
+        wan_watcher.update('r', snapshot())
+        events = wan_watcher.update('r', snapshot(message='Disconnected', imei='2', signal=1, apn='other', active='2'))
+        kinds = {type(event) for event in events}
+        self.assertEqual(kinds, {watcher.WanDown, watcher.ImeiChanged, watcher.SimSwitched, watcher.ApnChanged,
+                                 watcher.SignalThresholdCrossed})
+        crossed = [event for event in events if isinstance(event, watcher.SignalThresholdCrossed)]
+        self.assertEqual(sorted(event.threshold for event in crossed), [2, 3])
+        self.assertFalse(crossed[0].rising)
+        self.assertTrue(all(event.wan_id == '2' for event in events))
+
+        up = wan_watcher.update('r', snapshot(imei='2', signal=1, apn='other', active='2'))
+        self.assertEqual([type(event) for event in up], [watcher.WanUp])
+
+    def test_callbacks_by_type(self):
+        downs, everything = list(), list()
+        wan_watcher = watcher.WanWatcher()
+        wan_watcher.on(watcher.WanDown, downs.append)
+        wan_watcher.on(watcher.WanEvent, everything.append)
+        wan_watcher.update('r', snapshot())
+        wan_watcher.update('r', snapshot(message='Disconnected', apn='other'))
+        self.assertEqual(len(downs), 1)
+        self.assertEqual(len(everything), 2)
+
+    def test_unchanged_wan_is_not_parsed(self):
+        wan_watcher = watcher.WanWatcher()
+        wan_watcher.update('r', snapshot())
+        changed = snapshot()
+        changed['1'] = {'name': 'WAN', 'message': 'Disconnected'}
+        changed['2'] = copy.deepcopy(changed['2'])
+        original = watcher._WanState
+        parsed = list()
+        watcher._WanState = lambda raw: parsed.append(raw) or original(raw)
+        try:
+            events = wan_watcher.update('r', changed)
+        finally:
+            watcher._WanState = original
+        self.assertEqual(parsed, [changed['1']])
+        self.assertEqual([type(event) for event in events], [watcher.WanDown])
+
+    def test_asyncio_queue_with_fleet(self):
+        server = mock_router.MockRouterServer()
+        server.start()
+        router = server.routers[0]
+        wan_watcher = watcher.WanWatcher(fleet.Fleet(server.inventory(), timeout=5), interval=0.05)
+
+        async def run():
+            queue = asyncio.Queue()
+            wan_watcher.to_queue(queue, event_type=watcher.ImeiChanged)
+            wan_watcher.start()
+            await asyncio.sleep(0.2)
+            router.imei = '359999999999999'
+            return await asyncio.wait_for(queue.get(), 5)
+
+        try:
+            event = asyncio.run(run())
+        finally:
+            wan_watcher.stop()
+            server.stop()
+        self.assertEqual((event.new, event.router), ('359999999999999', f"127.0.0.1:{router.port}"))
+
+    def test_failed_login(self):
+        with mock_router.MockRouterServer() as server:
+            routers = fleet.Fleet(server.inventory(), timeout=5)
+            device = routers.devices[0]
+            device.password = 'wrong'
+            wan_watcher = watcher.WanWatcher(routers)
+            with self.assertRaises(exceptions.RequestRejectedError):
+                wan_watcher.check(device)
+
+            device.password = 'admin'
+            self.assertEqual(wan_watcher.check(device), [])
+
+if __name__ == '__main__':
+    unittest.main()